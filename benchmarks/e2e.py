@@ -0,0 +1,129 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""End to end benchmarks of git-lint.
+
+It generates a repository (see repo_generator.py) and measures the time taken
+by modified_files, modified_lines and main in its normal, --force and
+--last-commit modes, with a cold and a warm cache. The linters are stubs, so
+the results reflect the cost of git-lint itself and of the VCS.
+
+Example:
+  python -m benchmarks.e2e --files 500 --modified 50 \\
+      --compare benchmarks/baselines/e2e-git.json
+"""
+
+from __future__ import print_function
+
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+import gitlint
+import gitlint.git as git
+import gitlint.hg as hg
+
+from benchmarks import harness
+from benchmarks import repo_generator
+
+MODES = (
+    ('normal', []),
+    ('force', ['--force']),
+    ('last_commit', ['--last-commit']),
+)
+
+
+def _run_main(argv):
+    gitlint.main(
+        ['git-lint'] + argv, stdout=io.StringIO(), stderr=io.StringIO())
+
+
+def run_benchmarks(root, vcs, repeat, workdir):
+    """Runs the benchmarks against the repository in root.
+
+    Returns: dict: the results of harness.measure keyed by benchmark name.
+    """
+    vcs_module = git if vcs == 'git' else hg
+    homes = []
+
+    def cold_cache():
+        """Uses a new home directory, so the cache is empty."""
+        home = tempfile.mkdtemp(dir=workdir)
+        homes.append(home)
+        os.environ['HOME'] = home
+
+    results = {}
+    results[vcs + '.modified_files'] = harness.measure(
+        lambda: vcs_module.modified_files(root), repeat)
+
+    modified_files = vcs_module.modified_files(root)
+    results[vcs + '.modified_lines'] = harness.measure(
+        lambda: [
+            vcs_module.modified_lines(filename, extra_data)
+            for filename, extra_data in modified_files.items()
+        ], repeat)
+
+    for mode, argv in MODES:
+        name = '%s.main.%s' % (vcs, mode)
+        results[name + '.cold'] = harness.measure(
+            lambda: _run_main(argv), repeat, setup=cold_cache)
+        cold_cache()
+        _run_main(argv)
+        results[name + '.warm'] = harness.measure(lambda: _run_main(argv),
+                                                  repeat)
+
+    return results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--vcs', choices=('git', 'hg'), default='git')
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--lines', type=int, default=200)
+    parser.add_argument('--depth', type=int, default=10)
+    parser.add_argument('--modified', type=int, default=20)
+    parser.add_argument('--hunks', type=int, default=2)
+    parser.add_argument('--hunk-size', type=int, default=5)
+    harness.add_arguments(parser)
+    args = parser.parse_args(argv[1:])
+
+    workdir = tempfile.mkdtemp(prefix='git-lint-benchmark-')
+    cwd = os.getcwd()
+    home = os.environ.get('HOME')
+    try:
+        root = os.path.join(workdir, 'repo')
+        repo_generator.generate(
+            root,
+            vcs=args.vcs,
+            files=args.files,
+            lines=args.lines,
+            depth=args.depth,
+            modified=args.modified,
+            hunks=args.hunks,
+            hunk_size=args.hunk_size)
+        os.chdir(root)
+        results = run_benchmarks(root, args.vcs, args.repeat, workdir)
+    finally:
+        os.chdir(cwd)
+        if home is not None:
+            os.environ['HOME'] = home
+        shutil.rmtree(workdir)
+
+    return harness.finish(results, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
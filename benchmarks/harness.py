@@ -0,0 +1,143 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Helpers to time functions and to store and compare baselines.
+
+A baseline is a json file mapping the name of each benchmark to its timings in
+seconds. A benchmark regresses when its median is slower than the median of the
+baseline by more than the given threshold.
+"""
+
+from __future__ import print_function
+
+import io
+import json
+import platform
+import sys
+import timeit
+
+# Default allowed slowdown with respect to the baseline, 0.25 means 25%.
+DEFAULT_THRESHOLD = 0.25
+
+
+def measure(function, repeat=5, setup=None):
+    """Times function, calling setup (not timed) before each repetition.
+
+    Args:
+      function: callable: the code to benchmark.
+      repeat: int: number of times to run function.
+      setup: callable|None: code to run before each repetition.
+
+    Returns: dict: with the min, median and max times in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = timeit.default_timer()
+        function()
+        times.append(timeit.default_timer() - start)
+    times.sort()
+
+    return {
+        'min': times[0],
+        'median': times[len(times) // 2],
+        'max': times[-1],
+        'repeat': repeat,
+    }
+
+
+def save_baseline(results, filename):
+    """Writes results, as returned by measure, to filename."""
+    baseline = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    with io.open(filename, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(baseline, indent=2, sort_keys=True) + '\n')
+
+
+def load_baseline(filename):
+    """Returns the results stored in the baseline filename."""
+    with io.open(filename, encoding='utf-8') as f:
+        return json.load(f)['results']
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Compares results against baseline.
+
+    Benchmarks missing from the baseline are ignored.
+
+    Returns: list[(string, float, float)]: the regressions as tuples of (name,
+      baseline median, current median).
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        expected = baseline[name]['median']
+        if result['median'] > expected * (1 + threshold):
+            regressions.append((name, expected, result['median']))
+    return regressions
+
+
+def report(results, baseline=None, stream=sys.stdout):
+    """Prints the results, along with the ratio against the baseline."""
+    for name, result in sorted(results.items()):
+        line = '%-50s median %11.6fs  min %11.6fs' % (name, result['median'],
+                                                      result['min'])
+        if baseline and name in baseline and baseline[name]['median']:
+            line += '  x%.2f' % (result['median'] / baseline[name]['median'])
+        print(line, file=stream)
+
+
+def add_arguments(parser):
+    """Adds the baseline related options to an argparse parser."""
+    parser.add_argument(
+        '--repeat', type=int, default=5, help='Repetitions per benchmark.')
+    parser.add_argument(
+        '--save-baseline',
+        metavar='FILE',
+        help='Writes the results as a baseline to FILE.')
+    parser.add_argument(
+        '--compare',
+        metavar='FILE',
+        help='Compares the results with the baseline in FILE.')
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help='Allowed slowdown with respect to the baseline (default: '
+        '%(default)s).')
+
+
+def finish(results, args):
+    """Reports, saves and compares the results as requested in args.
+
+    Returns: int: the exit code, 1 if there are regressions, 0 otherwise.
+    """
+    baseline = load_baseline(args.compare) if args.compare else None
+    report(results, baseline)
+    if args.save_baseline:
+        save_baseline(results, args.save_baseline)
+    if baseline is None:
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for name, expected, actual in regressions:
+        print(
+            'REGRESSION: %s took %.4fs, baseline %.4fs' % (name, actual,
+                                                           expected),
+            file=sys.stderr)
+    return 1 if regressions else 0
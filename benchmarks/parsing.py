@@ -0,0 +1,199 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Micro benchmarks of the parsing of the output of the linters.
+
+It measures, for the output of every linter defined in
+gitlint/configs/config.yaml (see data/linter_outputs.yaml):
+
+ * filter_lines: utils.filter_lines with all the lines (--force) and with some
+   modified lines.
+ * lint_command: linters.lint_command with the output in the cache, which
+   includes the filtering and the construction of the comments.
+ * format_comment: gitlint.format_comment over all the comments.
+
+and, independently of the linter, the merge and sort of the comments done by
+linters.lint, both for the comments built by lint_command and for the dicts
+returned by custom linters, which are converted.
+
+Example:
+  python -m benchmarks.parsing --sizes 10,1000 \\
+      --compare benchmarks/baselines/parsing.json
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import io
+import os
+import os.path
+import re
+import sys
+
+import yaml
+
+import gitlint
+import gitlint.linters as linters
+import gitlint.utils as utils
+
+from benchmarks import harness
+
+OUTPUTS = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'data', 'linter_outputs.yaml')
+CONFIG = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gitlint',
+    'configs', 'config.yaml')
+
+DEFAULT_SIZES = (10, 1000, 100000)
+GROUPS = ('line', 'column', 'message', 'severity', 'message_id')
+# At most this many lines are considered as modified.
+MAX_MODIFIED_LINES = 500
+
+
+def generate_output(templates, size, filename):
+    """Repeats the templates until the output has size lines.
+
+    Returns: list[string]: the lines of the output.
+    """
+    output = []
+    line = 1
+    while len(output) < size:
+        for template in templates[:size - len(output)]:
+            output.append(template.format(filename=filename, line=line))
+        line += 1
+    return output
+
+
+def _lines_regex(lines):
+    if lines is None:
+        return r'(\d+)'
+    return '(%s)' % '|'.join(map(str, lines))
+
+
+class _CachedOutput(object):
+    """Replaces utils.get_output_from_cache to always return output."""
+
+    def __init__(self, output):
+        self.output = output
+        self.original = None
+
+    def __enter__(self):
+        self.original = utils.get_output_from_cache
+        utils.get_output_from_cache = lambda name, filename: self.output
+
+    def __exit__(self, *unused_exc_info):
+        utils.get_output_from_cache = self.original
+
+
+def benchmark_linter(name, linter_config, templates, size, repeat):
+    """Returns the results for the output of one linter."""
+    filename = '/home/user/repo/src/module' + linter_config['extensions'][0]
+    output = generate_output(templates, size, filename)
+    modified_lines = list(range(1, size + 1, 10))[:MAX_MODIFIED_LINES]
+    filter_regex = linter_config['filter']
+
+    def filter_lines(lines):
+        regex = filter_regex.format(
+            lines=_lines_regex(lines), filename=re.escape(filename))
+        return list(utils.filter_lines(output, regex, groups=GROUPS))
+
+    results = {}
+    prefix = '%s.%d.' % (name, size)
+    results[prefix + 'filter_lines.all'] = harness.measure(
+        lambda: filter_lines(None), repeat)
+    results[prefix + 'filter_lines.modified'] = harness.measure(
+        lambda: filter_lines(modified_lines), repeat)
+
+    command = linters.Partial(linters.lint_command, name,
+                              linter_config['command'], [], filter_regex)
+    with _CachedOutput(os.linesep.join(output)):
+        results[prefix + 'lint_command'] = harness.measure(
+            lambda: command(filename, None), repeat)
+        comments = command(filename, None)[filename]['comments']
+
+    results[prefix + 'format_comment'] = harness.measure(
+        lambda: [gitlint.format_comment(comment) for comment in comments],
+        repeat)
+    return results
+
+
+def _sort_config(comments):
+    """Returns a configuration with a linter returning each list of comments."""
+    config = collections.defaultdict(list)
+    for linter_comments in comments:
+        config['.py'].append(
+            lambda filename, lines, linter_comments=linter_comments: {
+                filename: {
+                    'comments': linter_comments
+                }
+            })
+    return config
+
+
+def benchmark_sort(size, repeat):
+    """Returns the results of merging and sorting the comments of 2 linters."""
+    filename = 'module.py'
+    comments = [[], []]
+    for index in range(size):
+        comments[index % 2].append({
+            'line': size - index,
+            'column': index % 80,
+            'message': 'message %d' % index,
+        })
+
+    config = _sort_config(
+        [[linters.Comment(**comment) for comment in linter_comments]
+         for linter_comments in comments])
+    dicts_config = _sort_config(comments)
+    return {
+        'lint.%d.sort' % size:
+        harness.measure(lambda: linters.lint(filename, None, config), repeat),
+        'lint.%d.sort_dicts' % size:
+        harness.measure(lambda: linters.lint(filename, None, dicts_config),
+                        repeat),
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--sizes',
+        default=','.join(map(str, DEFAULT_SIZES)),
+        help='Comma separated sizes, in lines, of the outputs.')
+    parser.add_argument(
+        '--linters',
+        help='Comma separated linters to benchmark, defaults to all.')
+    harness.add_arguments(parser)
+    args = parser.parse_args(argv[1:])
+
+    with io.open(CONFIG, encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    with io.open(OUTPUTS, encoding='utf-8') as f:
+        outputs = yaml.safe_load(f)
+    names = args.linters.split(',') if args.linters else sorted(outputs)
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    results = {}
+    for size in sizes:
+        for name in names:
+            results.update(
+                benchmark_linter(name, config[name], outputs[name], size,
+                                 args.repeat))
+        results.update(benchmark_sort(size, args.repeat))
+
+    return harness.finish(results, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
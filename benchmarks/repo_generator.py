@@ -0,0 +1,159 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Generates synthetic git and mercurial repositories for the benchmarks.
+
+The repositories contain Python and PHP files, a history in which a fraction of
+the files is modified in each commit, some modified files in the working copy
+and a .gitlint.yaml using stub linters (see stub_linter.py).
+"""
+
+import io
+import os
+import os.path
+import random
+import subprocess
+import sys
+
+import yaml
+
+STUB_LINTER = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'stub_linter.py')
+DEFAULT_CONFIG = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gitlint',
+    'configs', 'config.yaml')
+
+EXTENSIONS = {
+    '.py': 'value_{file}_{line} = {line}  # {revision}',
+    '.php': '$value_{file}_{line} = {line};  // {revision}',
+}
+
+_ENV = dict(
+    os.environ,
+    GIT_AUTHOR_NAME='bench',
+    GIT_AUTHOR_EMAIL='bench@example.com',
+    GIT_COMMITTER_NAME='bench',
+    GIT_COMMITTER_EMAIL='bench@example.com',
+    HGUSER='bench <bench@example.com>',
+    HGPLAIN='1')
+
+
+def _run(command, cwd):
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call(
+            command,
+            cwd=cwd,
+            env=_ENV,
+            stdout=devnull,
+            stderr=subprocess.STDOUT)
+
+
+def _commit(vcs, root, message):
+    if vcs == 'git':
+        _run(['git', 'add', '-A'], root)
+        _run(['git', 'commit', '-q', '-m', message], root)
+    else:
+        _run(['hg', 'commit', '-q', '-A', '-m', message], root)
+
+
+def write_config(root, every):
+    """Writes a .gitlint.yaml using the stub linters with real filters."""
+    with io.open(DEFAULT_CONFIG, encoding='utf-8') as f:
+        default_config = yaml.safe_load(f)
+    config = {}
+    for name in ('pylint', 'phpcs'):
+        config[name] = default_config[name]
+        config[name]['command'] = sys.executable
+        config[name]['arguments'] = [STUB_LINTER, name, str(every)]
+        config[name].pop('requirements', None)
+    with io.open(
+            os.path.join(root, '.gitlint.yaml'), 'w', encoding='utf-8') as f:
+        f.write(yaml.safe_dump(config, default_flow_style=False))
+
+
+def _write_file(filename, lines):
+    with io.open(filename, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def _read_file(filename):
+    with io.open(filename, encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+def _modify(rng, filename, revision, hunks, hunk_size):
+    """Rewrites hunks of hunk_size lines of filename, at random positions."""
+    lines = _read_file(filename)
+    for _ in range(hunks):
+        start = rng.randrange(max(1, len(lines) - hunk_size))
+        for line in range(start, min(len(lines), start + hunk_size)):
+            lines[line] = '%s  # changed in %s' % (lines[line], revision)
+    _write_file(filename, lines)
+
+
+def generate(root,
+             vcs='git',
+             files=100,
+             lines=200,
+             depth=10,
+             modified=10,
+             hunks=2,
+             hunk_size=5,
+             every=3,
+             seed=0):
+    """Generates a repository in root, which must not exist.
+
+    Args:
+      root: string: where to create the repository.
+      vcs: string: either git or hg.
+      files: int: number of files in the repository.
+      lines: int: number of lines of each file.
+      depth: int: number of commits in the history.
+      modified: int: number of files modified in the working copy.
+      hunks: int: number of hunks modified in each modified file.
+      hunk_size: int: number of lines of each hunk.
+      every: int: the stub linters report a problem every this many lines.
+      seed: int: seed for the random generator, so the repository is the same
+        for the same arguments.
+
+    Returns: list[string]: the absolute paths of the files in the repository.
+    """
+    rng = random.Random(seed)
+    os.makedirs(root)
+    _run([vcs, 'init', '-q'] if vcs == 'git' else [vcs, 'init'], root)
+    write_config(root, every)
+
+    extensions = sorted(EXTENSIONS)
+    filenames = []
+    for index in range(files):
+        extension = extensions[index % len(extensions)]
+        filename = os.path.join(root, 'src', 'package_%d' % (index % 10),
+                                'module_%d%s' % (index, extension))
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        _write_file(filename, [
+            EXTENSIONS[extension].format(file=index, line=line, revision=0)
+            for line in range(lines)
+        ])
+        filenames.append(filename)
+    _commit(vcs, root, 'Initial commit')
+
+    for revision in range(1, depth):
+        for filename in rng.sample(filenames, max(1, files // 10)):
+            _modify(rng, filename, revision, hunks, hunk_size)
+        _commit(vcs, root, 'Revision %d' % revision)
+
+    for filename in rng.sample(filenames, min(modified, files)):
+        _modify(rng, filename, 'working copy', hunks, hunk_size)
+
+    return filenames
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Stub linter emitting output shaped like the one of real linters.
+
+It is used by the benchmarks to measure the cost of git-lint itself, without
+the noise of the actual linters.
+
+Usage: stub_linter.py pylint|phpcs EVERY FILENAME
+
+It reports a problem every EVERY lines of FILENAME.
+"""
+
+from __future__ import print_function
+
+import io
+import sys
+
+
+def pylint_output(filename, lines, every):
+    yield '************* Module %s' % filename
+    for line in range(1, lines + 1, every):
+        yield ('%s:%d:%d: [C:line-too-long] function_%d: Line too long '
+               '(%d/80)' % (filename, line, line % 7, line, 80 + line % 40))
+    yield ''
+    yield '-' * 70
+    yield 'Your code has been rated at 5.00/10'
+
+
+def phpcs_output(filename, lines, every):
+    yield ''
+    yield 'FILE: %s' % filename
+    yield '-' * 80
+    errors = (lines + every - 1) // every
+    yield 'FOUND %d ERRORS AFFECTING %d LINES' % (errors, errors)
+    yield '-' * 80
+    for line in range(1, lines + 1, every):
+        yield (' %d | ERROR | Expected "if (...) {\\n"; found "if (...) {"' %
+               line)
+    yield '-' * 80
+
+
+FORMATS = {
+    'pylint': pylint_output,
+    'phpcs': phpcs_output,
+}
+
+
+def main(argv):
+    output_format, every, filename = argv[1:]
+    with io.open(filename, encoding='utf-8') as f:
+        lines = sum(1 for _ in f)
+    for output_line in FORMATS[output_format](filename, lines, int(every)):
+        print(output_line)
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
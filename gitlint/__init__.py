@@ -22,8 +22,12 @@ It supports many filetypes, including:
     among others. See https://github.com/sk-/git-lint for the complete list.
 
 Usage:
-    git-lint [-f | --force] [--json] [--last-commit] [FILENAME ...]
-    git-lint [-t | --tracked] [-f | --force] [--json] [--last-commit]
+    git-lint cache export [--since=REV]
+    git-lint cache import BUNDLE...
+    git-lint cache serve [--host=HOST] [--port=PORT] [--directory=DIR]
+    git-lint merge REPORT...
+    git-lint worker [--listen=ADDRESS] [--slots=N]
+    git-lint [options] [FILENAME ...]
     git-lint -h | --version
 
 Options:
@@ -31,39 +35,167 @@ Options:
     --version      Prints the version number.
     -f --force     Shows all the lines with problems.
     -t --tracked   Lints only tracked files.
+    --all          Lints all the tracked files instead of only the modified
+                   ones. Use it with --force to see the problems in all the
+                   lines.
     --json         Prints the result as a json string. Useful to use it in
                    conjunction with other tools.
+    --fail-fast    Stops at the first problem, killing the linters still
+                   running. Useful for hooks that only need to know whether
+                   there are problems. Besides the files with problems, only
+                   the files before them already linted are reported.
+    --fail-after=N  Like --fail-fast, but stops once N problems are found.
+    --deadline=SECONDS  Lints the files with the most modified lines first,
+                   then those with the cheapest linters, and reports as
+                   deferred the files not linted within SECONDS. The deferred
+                   files are linted in the background, so their results are
+                   cached for the next run, and do not make the run fail.
     --last-commit  Checks the last checked-out commit. This is mostly useful
                    when used as: git checkout <revid>; git lint --last-commit.
+    --commit=REV   Lints the files changed by the commit REV, reading them
+                   from the repository, so REV does not need to be checked
+                   out.
+    --range=RANGE  Lints every commit in RANGE, like A..B, in parallel and
+                   without checking them out. Merges are skipped.
+    --new-only     Reports only the problems that are not in the last commit,
+                   by linting both versions of the files. Unlike filtering by
+                   the modified lines, it catches the problems that changes
+                   cause in other lines, like unused imports.
+    --staged       Lints the content staged in the index, as it is going to be
+                   committed, instead of the working copy. Only for git.
+    --stdin-filename=FILE  Lints the content read from stdin as if it were
+                   FILE, which does not need to exist. Useful for editors to
+                   lint unsaved buffers.
+    --timings      Prints the wall time, child CPU time and max RSS of each
+                   phase and of each linter job, along with the cache hits and
+                   misses. With --json they are included under "timings".
+    --trace=FILE   Writes a trace of the run in the Trace Event Format, which
+                   can be loaded in chrome://tracing or Perfetto.
+    --metrics-file=FILE  Atomically writes metrics of the run (files linted,
+                   linter invocations and latencies, cache hits and misses,
+                   subprocesses spawned) for the node exporter textfile
+                   collector.
+    --profile=MODE Profiles the run, either its CPU usage (cpu) or its memory
+                   allocations (mem), including the worker threads. The stats
+                   are written to the profile output and a summary to stderr.
+    --profile-output=FILE  Where to write the profile stats
+                   [default: git-lint.prof].
+    --shard=I/N    Lints only the files of the I-th of N shards, to split a
+                   run across machines. The --json reports of the shards can
+                   be combined with git-lint merge.
+    --shard-weights=FILE  A --json --timings report of a previous run, used
+                   to balance the shards by the recorded cost of the files.
+    --workers=ADDRESSES  Runs the linters in the git-lint workers listening on
+                   the comma separated ADDRESSES, each either host:port or
+                   unix:/path. Jobs the workers cannot run are run locally.
+    --remote-cache=URL  Looks up the results missing in the local cache in the
+                   cache server at URL, uploading the new ones in the
+                   background. Defaults to $GIT_LINT_REMOTE_CACHE.
+    -j N --jobs=N  Number of linters run at once. Defaults to the number of
+                   CPUs available to git-lint, as limited by its CPU affinity
+                   and its cgroup CPU quota. When run from make -j, the
+                   linters also take job slots from the make jobserver.
+    --engine=ENGINE  Runs the subprocesses from a pool of --jobs threads
+                   (threads) or from an asyncio event loop (asyncio), which
+                   runs up to --max-subprocesses at once, linters included.
+                   The asyncio engine requires Python 3.8 [default: threads].
+    --max-subprocesses=N  Number of subprocesses the asyncio engine runs at
+                   once, including the ones of the VCS. Defaults to twice
+                   --jobs.
+
+Cache options:
+    --since=REV    Exports only the entries for the files changed since REV.
+    --host=HOST    Address where the cache server listens [default: localhost].
+    --port=PORT    Port where the cache server listens [default: 8742].
+    --directory=DIR  Where the cache server stores the entries. Defaults to the
+                   local cache keyed by content.
+
+Directories given as FILENAME are expanded to the tracked files in them. The
+tracked files are linted as they are listed by the vcs, so even huge
+repositories are linted without collecting all their files first.
+
+Worker options:
+    --listen=ADDRESS  Where the worker listens, either host:port or unix:/path
+                   [default: localhost:8743].
+    --slots=N      Number of jobs the worker runs at once. Defaults to the
+                   number of CPUs available to the worker.
+
+The worker command runs the jobs of runs given --workers. Workers only run the
+linters of their own configuration, so they should be started in a clone of
+the repository with the same linters installed. Anyone who can connect to a
+worker can make it run its linters, so it should listen on a Unix socket or on
+localhost. Workers and runs given the same $GIT_LINT_WORKER_TOKEN only accept
+each other.
+
+The merge command prints the combination of the --json reports of several
+shards as a single --json report, exiting with the code main would have
+returned for all the files.
+
+The cache commands export to stdout and import from files ('-' for stdin)
+bundles of the cache keyed by content, to share it across machines. The cache
+can also be shared by running a cache server and using --remote-cache.
 """
 
 from __future__ import unicode_literals
 
 import codecs
+import collections
+import contextlib
 import functools
+import io
 import json
-import multiprocessing
 import os
 import os.path
+import socket
+import subprocess
 import sys
+import threading
+import time
 from concurrent import futures
 
 import docopt
 import termcolor
 import yaml
 
+import gitlint.cache as cache
+import gitlint.distributed as distributed
+import gitlint.engine as engine
 import gitlint.git as git
 import gitlint.hg as hg
+import gitlint.hooks as hooks
 import gitlint.linters as linters
+import gitlint.metrics as metrics
+import gitlint.parallelism as parallelism
+import gitlint.profiling as profiling
+import gitlint.remote_cache as remote_cache
+import gitlint.scheduling as scheduling
+import gitlint.sharding as sharding
+import gitlint.timings as timings
+import gitlint.utils as utils
 from gitlint.version import __VERSION__
 
 ERROR = termcolor.colored('ERROR', 'red', attrs=('bold', ))
 SKIPPED = termcolor.colored('SKIPPED', 'yellow', attrs=('bold', ))
+DEFERRED = termcolor.colored('DEFERRED', 'cyan', attrs=('bold', ))
 OK = termcolor.colored('OK', 'green', attrs=('bold', ))
 
+# Files submitted to the pool of workers ahead of the one being rendered, per
+# worker. It bounds the memory used when linting streams of files.
+MAX_PENDING_PER_WORKER = 4
+
+# Share of the --deadline budget that computing the modified lines, to lint
+# the files with the most of them first, may take. Past it the files are only
+# sorted by the cost of their linters.
+PRIORITIZING_SHARE = 0.25
+
+# Options of a run given --deadline passed to the run linting its deferred
+# files in the background.
+BACKGROUND_OPTIONS = ('--staged', '--new-only', '--jobs', '--engine',
+                      '--max-subprocesses', '--remote-cache', '--workers')
+
 
 def find_invalid_filenames(filenames, repository_root):
-    """Find files that does not exist, are not in the repo or are directories.
+    """Find files that does not exist or are not in the repo.
 
     Args:
       filenames: list of filenames to check
@@ -79,16 +211,15 @@ def find_invalid_filenames(filenames, repository_root):
         if not os.path.exists(filename):
             errors.append((filename,
                            'Error: File %s does not exist' % (filename, )))
-        if os.path.isdir(filename):
-            errors.append((filename,
-                           'Error: %s is a directory. Directories are'
-                           ' not yet supported' % (filename, )))
 
     return errors
 
 
-def get_config(repo_root):
-    """Gets the configuration file either from the repository or the default."""
+def read_config(repo_root):
+    """Reads the configuration file either from the repository or the default.
+
+    Returns: dict: the parsed yaml configuration.
+    """
     config = os.path.join(os.path.dirname(__file__), 'configs', 'config.yaml')
 
     if repo_root:
@@ -106,6 +237,14 @@ def get_config(repo_root):
         else:
             yaml_config = yaml.safe_load(content)
 
+    return yaml_config
+
+
+def get_config(repo_root):
+    """Gets the configuration file either from the repository or the default."""
+    yaml_config = read_config(repo_root)
+    yaml_config.pop(hooks.CONFIG_KEY, None)
+
     return linters.parse_yaml_config(yaml_config, repo_root)
 
 
@@ -120,11 +259,14 @@ def format_comment(comment_data):
     Any of the fields may nbe absent.
 
     Args:
-      comment_data: dictionary with the linter data.
+      comment_data: dictionary with the linter data, or a linters.Comment.
 
     Returns:
       a string with the formatted message.
     """
+    if isinstance(comment_data, linters.Comment):
+        return comment_data.format()
+
     format_pieces = []
     # Line and column information
     if 'line' in comment_data:
@@ -150,6 +292,15 @@ def format_comment(comment_data):
     return ''.join(format_pieces).format(**comment_data)
 
 
+def _comment_to_json(comment):
+    """Returns the JSON output of a comment, formatted as it is written."""
+    if not isinstance(comment, linters.Comment):
+        raise TypeError('%r is not JSON serializable' % (comment, ))
+    data = dict(comment)
+    data['formatted_message'] = format_comment(comment)
+    return data
+
+
 def get_vcs_root():
     """Returns the vcs module and the root of the repo.
 
@@ -157,34 +308,424 @@ def get_vcs_root():
       A tuple containing the vcs module to use (git, hg) and the root of the
       repository. If no repository exisits then (None, None) is returned.
     """
-    for vcs in (git, hg):
-        repo_root = vcs.repository_root()
-        if repo_root:
-            return vcs, repo_root
+    with timings.span('vcs_discovery', timings.PHASE):
+        for vcs in (git, hg):
+            repo_root = vcs.repository_root()
+            if repo_root:
+                return vcs, repo_root
 
     return (None, None)
 
 
-def process_file(vcs, commit, force, gitlint_config, file_data):
+def process_file(vcs,
+                 commit,
+                 force,
+                 gitlint_config,
+                 file_data,
+                 content_function=None,
+                 modified_lines_function=None,
+                 base_content_function=None):
     """Lint the file
 
+    Args:
+      file_data: tuple: the filename and its extra data, optionally followed by
+        the git blob id of its content if already known.
+      content_function: callable(filename, extra_data)|None: if given, returns
+        the content to lint instead of the one in the working copy, like the
+        staged content.
+      modified_lines_function: callable(filename, extra_data)|None: returns the
+        modified lines of the file. Defaults to vcs.modified_lines.
+      base_content_function: callable(filename, extra_data)|None: if given,
+        returns the content of the file to compare with, and only the problems
+        not in it are reported. The modified lines are not used in this case.
+
     Returns:
       The results from the linter.
     """
-    filename, extra_data = file_data
+    filename, extra_data = file_data[:2]
+    file_hash = file_data[2] if len(file_data) > 2 else None
 
-    if force:
-        modified_lines = None
-    else:
-        modified_lines = vcs.modified_lines(
-            filename, extra_data, commit=commit)
-    result = linters.lint(filename, modified_lines, gitlint_config)
-    result = result[filename]
+    with timings.span('process_file', timings.FILE, filename=filename):
+        if base_content_function is not None:
+            result = _lint_new_only(file_data, gitlint_config,
+                                    content_function, base_content_function)
+            hooks.emit(hooks.FILE_DONE, filename=filename, result=result)
+            return filename, result
+        if force:
+            modified_lines = None
+        else:
+            with timings.span(
+                    'modified_lines', timings.VCS, filename=filename):
+                if modified_lines_function is None:
+                    modified_lines = vcs.modified_lines(
+                        filename, extra_data, commit=commit)
+                else:
+                    modified_lines = modified_lines_function(
+                        filename, extra_data)
+        if content_function is not None:
+            result = linters.lint(
+                filename,
+                modified_lines,
+                gitlint_config,
+                content=content_function(filename, extra_data))
+        elif file_hash is not None:
+            result = linters.lint(
+                filename, modified_lines, gitlint_config, file_hash=file_hash)
+        else:
+            result = linters.lint(filename, modified_lines, gitlint_config)
+        result = result[filename]
 
+    hooks.emit(hooks.FILE_DONE, filename=filename, result=result)
     return filename, result
 
 
-def main(argv, stdout=sys.stdout, stderr=sys.stderr):
+def _lint_new_only(file_data, gitlint_config, content_function,
+                   base_content_function):
+    """Lints the file, keeping only the comments not in its base content."""
+    filename, extra_data = file_data[:2]
+    if content_function is None:
+        with io.open(filename, 'rb') as f:
+            content = f.read()
+        result = linters.lint(filename, None, gitlint_config)[filename]
+    else:
+        content = content_function(filename, extra_data)
+        result = linters.lint(
+            filename, None, gitlint_config, content=content)[filename]
+    if not result.get('comments'):
+        return result
+
+    with timings.span('base_content', timings.VCS, filename=filename):
+        base_content = base_content_function(filename, extra_data)
+    if base_content is None:
+        return result
+    base_result = linters.lint(
+        filename, None, gitlint_config, content=base_content)[filename]
+    result['comments'] = linters.new_comments(
+        base_result.get('comments', []), base_content, result['comments'],
+        content)
+    return result
+
+
+def _walk_files(vcs, repository_root, filenames, directories, changed_files):
+    """Yields the files to lint and their extra data, as they are discovered.
+
+    The tracked files found in directories also come with their blob id in the
+    index, if any, see vcs.tracked_files.
+
+    Args:
+      vcs: the vcs module.
+      repository_root: the absolute path of the repository's root.
+      filenames: list[string]: absolute paths of the files to lint.
+      directories: list[string]: absolute paths of the directories whose
+        tracked files are linted.
+      changed_files: dict: the output of vcs.modified_files. Files not in it
+        get None as extra data, meaning that they were not modified.
+    """
+    for filename in filenames:
+        yield filename, changed_files.get(filename)
+    if not directories:
+        return
+    filenames = set(filenames)
+    for filename, file_hash in vcs.tracked_files(repository_root, directories):
+        if filename not in filenames:
+            yield filename, changed_files.get(filename), file_hash
+
+
+# Extra data of the files changed by a commit, see _commit_files.
+CommitFile = collections.namedtuple('CommitFile',
+                                    ('commit', 'lines', 'content'))
+
+
+def _commit_files(vcs, repository_root, commits, commit_reader):
+    """Yields the files changed by each commit, with their content.
+
+    The contents are read as the files are consumed, so only the files being
+    linted are kept in memory.
+
+    Yields: tuple(string, CommitFile): the filename and the commit, the added
+      lines and the content of the file in the commit.
+    """
+    for commit in commits:
+        with timings.span('commit_changes', timings.VCS, commit=commit):
+            changes = vcs.commit_changes(repository_root, commit)
+        for filename, lines in changes:
+            content = commit_reader.read(commit, filename)
+            if content is not None:
+                yield filename, CommitFile(commit, lines, content)
+
+
+def _in_commit(process_function):
+    """Wraps process_file to key the results by commit and filename."""
+
+    def process_commit_file(file_data):
+        filename, result = process_function(file_data)
+        return '%s:%s' % (file_data[1].commit, filename), result
+
+    return process_commit_file
+
+
+def _commit_display_name(key):
+    commit, filename = key.split(':', 1)
+    return '%s:%s' % (commit[:12], os.path.relpath(filename))
+
+
+class _FailFast(object):
+    """Cancels the run once max_comments comments are found (--fail-fast).
+
+    The files are checked as they are linted, in any order, and not as they
+    are reported, so a problem in the last file cancels the linters of the
+    files before it.
+
+    Args:
+      process_function: callable: process_file, already bound to its
+        arguments.
+      max_comments: int: the number of comments stopping the run.
+    """
+
+    def __init__(self, process_function, max_comments):
+        self._process_function = process_function
+        self._max_comments = max_comments
+        self._lock = threading.Lock()
+        # The number of comments found, including the ones after stopping.
+        self.comments = 0
+        # Files with comments not reported yet, by the order they were linted.
+        self._failed = collections.OrderedDict()
+        self.stopped = False
+
+    def __call__(self, file_data):
+        if self.stopped:
+            raise engine.Cancelled()
+        filename, result = self._process_function(file_data)
+        comments = len(result.get('comments') or ())
+        if comments:
+            with self._lock:
+                self._failed[filename] = result
+                self.comments += comments
+                stop = (not self.stopped
+                        and self.comments >= self._max_comments)
+                self.stopped = self.stopped or stop
+            if stop:
+                engine.cancel()
+        return filename, result
+
+    def results(self, results):
+        """Yields the results until the run is cancelled.
+
+        Then the files with comments not yielded yet are yielded too, so the
+        problems stopping the run are always reported.
+        """
+        try:
+            for filename, result in results:
+                with self._lock:
+                    self._failed.pop(filename, None)
+                yield filename, result
+        except engine.Cancelled:
+            pass
+        with self._lock:
+            failed = list(self._failed.items())
+            self._failed.clear()
+        for filename, result in failed:
+            yield filename, result
+
+
+class _Deadline(object):
+    """Defers the files not linted before the deadline (--deadline).
+
+    Once the deadline passes no more files are linted, and the subprocesses
+    still running are killed, like the linters, whose files are deferred too,
+    or git blame while sorting the files.
+
+    Args:
+      deadline: float: the time, as returned by time.time, when to stop.
+    """
+
+    def __init__(self, deadline):
+        self._deadline = deadline
+        self._lock = threading.Lock()
+        self.deferred = []
+        self._timer = threading.Timer(
+            max(0, deadline - time.time()), engine.cancel)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def expired(self):
+        return time.time() >= self._deadline
+
+    def remaining(self):
+        """Returns the seconds left before the deadline."""
+        return max(0, self._deadline - time.time())
+
+    def wrap(self, process_function):
+        """Returns process_function deferring the files once expired.
+
+        Args:
+          process_function: callable: process_file, already bound to its
+            arguments.
+        """
+
+        def process(file_data):
+            if not self.expired():
+                try:
+                    return process_function(file_data)
+                except engine.Cancelled:
+                    if not self.expired():
+                        raise
+            with self._lock:
+                self.deferred.append(file_data[0])
+            return file_data[0], {
+                'deferred': ['The linters did not finish before the deadline']
+            }
+
+        return process
+
+    def close(self):
+        self._timer.cancel()
+
+
+def _prioritize(executor,
+                files,
+                gitlint_config,
+                linter_costs,
+                lines_function,
+                content_function,
+                budget=None):
+    """Sorts the files in the order they are linted with --deadline.
+
+    The files are sorted by their number of modified lines only if they are
+    all computed within budget. Otherwise the computations not started are
+    cancelled, and the files are sorted by the cost of their linters.
+
+    Args:
+      executor: futures.Executor: where to compute the modified lines.
+      files: iterable[tuple]: the data of the files.
+      gitlint_config: dict: the configuration of the linters.
+      linter_costs: scheduling.LinterCosts: the recorded costs of the linters.
+      lines_function: callable(filename, extra_data)|None: returns the
+        modified lines of a file, or None if all its lines are new. If not
+        given, the files are only sorted by cost.
+      content_function: callable(filename, extra_data)|None: returns the
+        content of a file, if not the one in the working copy.
+      budget: float|None: the seconds that computing the modified lines may
+        take, unlimited if None.
+
+    Returns: tuple(list[tuple], dict|None): the sorted files and, if computed,
+      the modified lines of the files, keyed by filename. Without enough
+      budget, only some files may have them. The files whose modified lines
+      could not be computed have none, and are sorted as if unmodified.
+    """
+    files = list(files)
+
+    def modified_lines(file_data):
+        filename, extra_data = file_data[:2]
+        lines = lines_function(filename, extra_data)
+        if lines is not None:
+            return lines, len(lines)
+        try:
+            if content_function is not None:
+                content = content_function(filename, extra_data)
+            else:
+                with io.open(filename, 'rb') as f:
+                    content = f.read()
+        except (IOError, OSError):
+            return lines, 0
+        return lines, len(content.splitlines())
+
+    lines = None
+    counts = [0] * len(files)
+    if lines_function is not None:
+        with timings.span('modified_lines', timings.PHASE):
+            # The git blame of the files counts in the phase.
+            measured_lines = timings.propagate(modified_lines)
+            pending = [
+                executor.submit(measured_lines, file_data)
+                for file_data in files
+            ]
+            done, not_done = futures.wait(pending, timeout=budget)
+        for future in not_done:
+            future.cancel()
+
+        def succeeded(future):
+            # Like git blame failing, or killed by the deadline.
+            return (future in done and not future.cancelled()
+                    and future.exception() is None)
+
+        lines = dict((file_data[0], future.result()[0])
+                     for file_data, future in zip(files, pending)
+                     if succeeded(future))
+        if not not_done:
+            # The files whose modified lines failed have an unknown priority.
+            counts = [
+                future.result()[1] if succeeded(future) else 0
+                for future in pending
+            ]
+    costs = [
+        linter_costs.estimate(
+            linters.linter_names(file_data[0], gitlint_config))
+        for file_data in files
+    ]
+    return scheduling.prioritize(files, counts, costs), lines
+
+
+def _lint_in_background(arguments, repository_root, filenames):
+    """Lints filenames in a detached git-lint, so the results get cached.
+
+    Returns: bool: whether the run could be started.
+    """
+    command = [
+        sys.executable, '-c',
+        'import sys, gitlint; sys.exit(gitlint.main(sys.argv))', '--force',
+        '--json'
+    ]
+    for option in BACKGROUND_OPTIONS:
+        if arguments[option] is True:
+            command.append(option)
+        elif arguments[option]:
+            command.append('%s=%s' % (option, arguments[option]))
+    command.extend(filenames)
+    # The same gitlint package is used, even if it is not installed.
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        path for path in (package_root, env.get('PYTHONPATH')) if path)
+    try:
+        with io.open(os.devnull, 'r+b') as devnull:
+            subprocess.Popen(
+                command,
+                cwd=repository_root,
+                env=env,
+                stdin=devnull,
+                stdout=devnull,
+                stderr=devnull,
+                close_fds=True,
+                **engine.new_group_arguments())
+    except OSError:
+        return False
+    return True
+
+
+@contextlib.contextmanager
+def _cancel_on_error():
+    """Kills the running linters on errors, like KeyboardInterrupt.
+
+    The linters run in their own process groups, so they do not get the signals
+    of the terminal, and the pool of workers would wait for them to finish.
+    """
+    try:
+        yield
+    except BaseException:
+        engine.cancel()
+        raise
+
+
+def _emit_discovered(files):
+    for file_data in files:
+        filename, extra_data = file_data[:2]
+        hooks.emit(
+            hooks.FILE_DISCOVERED, filename=filename, extra_data=extra_data)
+        yield file_data
+
+
+def main(argv, stdout=sys.stdout, stderr=sys.stderr, stdin=sys.stdin):
     """Main gitlint routine. To be called from scripts."""
     # Wrap sys stdout for python 2, so print can understand unicode.
     linesep = os.linesep
@@ -198,19 +739,327 @@ def main(argv, stdout=sys.stdout, stderr=sys.stderr):
     arguments = docopt.docopt(
         __doc__, argv=argv[1:], version='git-lint v%s' % __VERSION__)
 
+    if arguments['cache']:
+        return _cache_command(arguments, linesep, stdout, stderr, stdin)
+    if arguments['merge']:
+        return _merge_command(arguments, linesep, stdout, stderr)
+    if arguments['worker']:
+        return _worker_command(arguments, linesep, stderr)
+
+    if arguments['--profile']:
+        try:
+            profiling.start(arguments['--profile'])
+        except ValueError as error:
+            stderr.write('fatal: %s%s' % (error, linesep))
+            return 2
+
+    try:
+        jobs = int(arguments['--jobs'] or 0)
+        if jobs < 0:
+            raise ValueError('Invalid number of jobs %d' % jobs)
+        max_subprocesses = int(arguments['--max-subprocesses'] or 0)
+        if max_subprocesses < 0:
+            raise ValueError(
+                'Invalid number of subprocesses %d' % max_subprocesses)
+        engine.start(arguments['--engine'], jobs, max_subprocesses)
+    except ValueError as error:
+        profiling.stop()
+        stderr.write('fatal: %s%s' % (error, linesep))
+        return 2
+    try:
+        parallelism.start(engine.concurrency(), os.environ.get('MAKEFLAGS'))
+    except ValueError as error:
+        stderr.write('%s, linting without it%s' % (error, linesep))
+        parallelism.start(engine.concurrency())
+
+    recorder = None
+    if (arguments['--timings'] or arguments['--trace']
+            or arguments['--metrics-file']):
+        recorder = timings.enable()
+    remote_cache_url = (arguments['--remote-cache']
+                        or os.environ.get('GIT_LINT_REMOTE_CACHE'))
+    if remote_cache_url:
+        remote_cache.enable(remote_cache_url)
+    if arguments['--workers']:
+        coordinator = distributed.enable(
+            arguments['--workers'].split(','),
+            token=os.environ.get(distributed.TOKEN_ENVIRONMENT_VARIABLE))
+        if not coordinator.slots:
+            stderr.write('Could not connect to any worker, linting locally' +
+                         linesep)
+    # The costs are only needed to sort the files before a deadline.
+    linter_costs = None
+    if arguments['--deadline']:
+        linter_costs = scheduling.load_costs()
+        hooks.register(hooks.LINTER_END, linter_costs.on_linter_end)
+    try:
+        return_code = _lint(arguments, recorder, linter_costs, linesep, stdout,
+                            stderr, stdin)
+        hooks.emit(hooks.RUN_END, return_code=return_code)
+        return return_code
+    finally:
+        if linter_costs is not None:
+            hooks.unregister(hooks.LINTER_END, linter_costs.on_linter_end)
+            scheduling.save_costs(linter_costs)
+        hooks.unregister_config()
+        parallelism.stop()
+        engine.stop()
+        distributed.disable()
+        remote_cache.disable()
+        timings.disable()
+        if arguments['--trace']:
+            with io.open(arguments['--trace'], 'w', encoding='utf-8') as f:
+                f.write(json.dumps(timings.trace_events(recorder)))
+        if arguments['--metrics-file']:
+            metrics.write_metrics(recorder, arguments['--metrics-file'])
+        profiler = profiling.stop()
+        if profiler is not None:
+            profiler.write(arguments['--profile-output'])
+            stderr.write(profiler.summary())
+
+
+def _cache_command(arguments, linesep, stdout, stderr, stdin):
+    """Exports or imports bundles of the cache, or serves it."""
+    if arguments['serve']:
+        directory = arguments['--directory'] or utils.get_content_cache_dir()
+        try:
+            server = remote_cache.Server(
+                (arguments['--host'], int(arguments['--port'])), directory)
+        except (ValueError, OSError, socket.error) as error:
+            stderr.write('fatal: Could not start the cache server: %s%s' %
+                         (error, linesep))
+            return 2
+        stderr.write('Serving %s on http://%s:%d/%s' % (
+            directory, arguments['--host'], server.server_address[1], linesep))
+        remote_cache.serve(server)
+        return 0
+
+    if arguments['export']:
+        keys = None
+        if arguments['--since']:
+            vcs, repository_root = get_vcs_root()
+            if vcs is None:
+                stderr.write('fatal: Not a git repository' + linesep)
+                return 128
+            try:
+                keys = cache.keys_since(vcs, repository_root,
+                                        arguments['--since'])
+            except subprocess.CalledProcessError:
+                stderr.write('fatal: Invalid revision %s%s' %
+                             (arguments['--since'], linesep))
+                return 2
+        count = cache.export_bundle(cache.open_binary(stdout), keys=keys)
+        stderr.write('Exported %d cache entries%s' % (count, linesep))
+        return 0
+
+    count = 0
+    for filename in arguments['BUNDLE']:
+        try:
+            if filename == '-':
+                count += cache.import_bundle(cache.open_binary(stdin))
+            else:
+                with io.open(filename, 'rb') as bundle:
+                    count += cache.import_bundle(bundle)
+        except (IOError, OSError, ValueError) as error:
+            stderr.write('fatal: Could not import %s: %s%s' % (filename, error,
+                                                               linesep))
+            return 2
+    stderr.write('Imported %d cache entries%s' % (count, linesep))
+    return 0
+
+
+def _merge_command(arguments, linesep, stdout, stderr):
+    """Merges the --json reports of several shards."""
+    reports = []
+    for filename in arguments['REPORT']:
+        try:
+            with io.open(filename, encoding='utf-8') as f:
+                reports.append(json.loads(f.read()))
+        except (IOError, OSError, ValueError) as error:
+            stderr.write('fatal: Could not read report %s: %s%s' %
+                         (filename, error, linesep))
+            return 2
+    merged = sharding.merge_reports(reports)
+    stdout.write(
+        json.dumps(merged, ensure_ascii=False).encode('utf-8').decode('utf-8'))
+    return sharding.return_code(merged)
+
+
+def _worker_command(arguments, linesep, stderr):
+    """Runs the jobs sent by coordinators."""
+    _, repository_root = get_vcs_root()
+    commands = linters.commands_by_fingerprint(get_config(repository_root))
+    try:
+        slots = int(arguments['--slots'] or parallelism.available_cpus())
+        if slots < 1:
+            raise ValueError('Invalid number of slots %d' % slots)
+        server = distributed.make_worker(
+            arguments['--listen'],
+            functools.partial(linters.run_job, commands),
+            slots,
+            token=os.environ.get(distributed.TOKEN_ENVIRONMENT_VARIABLE))
+    except (ValueError, OSError, socket.error) as error:
+        stderr.write(
+            'fatal: Could not start the worker: %s%s' % (error, linesep))
+        return 2
+    stderr.write(
+        'Worker listening on %s with %d slots and %d linters%s' %
+        (distributed.worker_address(server), slots, len(commands), linesep))
+    distributed.serve(server)
+    return 0
+
+
+def _lint(arguments, recorder, linter_costs, linesep, stdout, stderr, stdin):
+    """Lints the files selected by the command line arguments."""
+    start = time.time()
     json_output = arguments['--json']
 
+    deadline = None
+    if arguments['--deadline']:
+        try:
+            seconds = float(arguments['--deadline'])
+            if seconds <= 0:
+                raise ValueError()
+        except ValueError:
+            stderr.write('fatal: Invalid deadline %s%s' %
+                         (arguments['--deadline'], linesep))
+            return 2
+        deadline = start + seconds
+
+    in_shard = None
+    if arguments['--shard']:
+        try:
+            index, count = sharding.parse_shard(arguments['--shard'])
+            costs = None
+            if arguments['--shard-weights']:
+                with io.open(
+                        arguments['--shard-weights'], encoding='utf-8') as f:
+                    costs = sharding.costs_from_report(json.loads(f.read()))
+        except (IOError, OSError, ValueError) as error:
+            stderr.write('fatal: %s%s' % (error, linesep))
+            return 2
+        in_shard = sharding.shard_filter(index, count, costs)
+
     vcs, repository_root = get_vcs_root()
 
     if vcs is None:
         stderr.write('fatal: Not a git repository' + linesep)
         return 128
 
+    with timings.span('config', timings.PHASE):
+        yaml_config = read_config(repository_root)
+        hooks_config = yaml_config.pop(hooks.CONFIG_KEY, None) or {}
+        gitlint_config = linters.parse_yaml_config(yaml_config,
+                                                   repository_root)
+    try:
+        hooks.register_from_config(hooks_config)
+    except (ImportError, AttributeError, ValueError) as error:
+        stderr.write('fatal: Could not load hooks: %s%s' % (error, linesep))
+        return 2
+
+    hooks.emit(
+        hooks.RUN_START,
+        repository_root=repository_root,
+        vcs=vcs.__name__.split('.')[-1])
+
     commit = None
     if arguments['--last-commit']:
         commit = vcs.last_commit()
 
-    if arguments['FILENAME']:
+    base_content_function = None
+    if arguments['--new-only']:
+        if commit is not None:
+            stderr.write('fatal: --new-only can not be combined with '
+                         '--last-commit' + linesep)
+            return 2
+
+        def base_content_function(filename, unused_extra_data):
+            return vcs.committed_content(repository_root, filename)
+
+    contents = None
+    content_function = None
+    modified_lines_function = None
+    files = None
+    commit_reader = None
+    if arguments['--commit'] or arguments['--range']:
+        if (arguments['FILENAME'] or arguments['--staged']
+                or arguments['--stdin-filename'] or arguments['--all']
+                or commit is not None):
+            stderr.write('fatal: --commit and --range do not accept '
+                         'filenames, --staged, --stdin-filename, --all nor '
+                         '--last-commit' + linesep)
+            return 2
+        revisions = arguments['--range'] or arguments['--commit']
+        try:
+            with timings.span('commits', timings.PHASE):
+                commits = vcs.commits(
+                    repository_root,
+                    revisions,
+                    walk=bool(arguments['--range']))
+        except subprocess.CalledProcessError:
+            stderr.write('fatal: Invalid revision %s%s' % (revisions, linesep))
+            return 2
+        commit_reader = vcs.CommitReader(repository_root)
+        files = _commit_files(vcs, repository_root, commits, commit_reader)
+
+        def content_function(unused_filename, extra_data):
+            return extra_data.content
+
+        def modified_lines_function(unused_filename, extra_data):
+            return extra_data.lines
+
+        if base_content_function is not None:
+
+            def base_content_function(filename, extra_data):
+                return commit_reader.read(
+                    vcs.parent_revision(extra_data.commit), filename)
+    elif arguments['--stdin-filename']:
+        if arguments['FILENAME'] or arguments['--staged']:
+            stderr.write('fatal: --stdin-filename does not accept filenames '
+                         'nor --staged' + linesep)
+            return 2
+        filename = os.path.abspath(arguments['--stdin-filename'])
+        # The file does not need to exist, as the content comes from stdin.
+        if not filename.startswith(repository_root):
+            stderr.write(
+                'Error: File %s does not belong to repository %s%s' %
+                (arguments['--stdin-filename'], repository_root, linesep))
+            return 2
+        content = cache.open_binary(stdin).read()
+        with timings.span('modified_files', timings.PHASE):
+            committed_content = vcs.committed_content(repository_root,
+                                                      filename)
+        modified_lines = utils.changed_lines(committed_content, content)
+        modified_files = {filename: None}
+        contents = {filename: content}
+        modified_lines_function = (
+            lambda unused_filename, unused_extra_data: modified_lines)
+    elif arguments['--staged']:
+        if vcs is not git:
+            stderr.write('fatal: --staged is only supported for git' + linesep)
+            return 2
+        with timings.span('modified_files', timings.PHASE):
+            modified_files = vcs.staged_files(repository_root)
+        if arguments['FILENAME']:
+            filenames = set(
+                os.path.abspath(filename)
+                for filename in arguments['FILENAME'])
+            modified_files = dict(
+                (filename, extra_data)
+                for filename, extra_data in modified_files.items()
+                if filename in filenames)
+        with timings.span('staged_contents', timings.VCS):
+            contents = vcs.staged_contents(repository_root,
+                                           sorted(modified_files))
+        modified_files = dict(
+            (filename, extra_data)
+            for filename, extra_data in modified_files.items()
+            if filename in contents)
+        modified_lines_function = vcs.staged_modified_lines
+    elif arguments['--all'] or arguments['FILENAME']:
+        if arguments['--all'] and arguments['FILENAME']:
+            stderr.write('fatal: --all does not accept filenames' + linesep)
+            return 2
         invalid_filenames = find_invalid_filenames(arguments['FILENAME'],
                                                    repository_root)
         if invalid_filenames:
@@ -219,71 +1068,196 @@ def main(argv, stdout=sys.stdout, stderr=sys.stderr):
                 linesep.join(invalid[1] for invalid in invalid_filenames))
             return 2
 
-        changed_files = vcs.modified_files(
-            repository_root,
-            tracked_only=arguments['--tracked'],
-            commit=commit)
-        modified_files = {}
+        changed_files = {}
+        # With --force the status of the files is not needed, which saves a
+        # full scan of the working copy with --all.
+        if not (arguments['--all'] and arguments['--force']):
+            with timings.span('modified_files', timings.PHASE):
+                changed_files = vcs.modified_files(
+                    repository_root,
+                    tracked_only=arguments['--tracked'],
+                    commit=commit)
+        filenames = set()
+        directories = []
+        if arguments['--all']:
+            directories.append(repository_root)
         for filename in arguments['FILENAME']:
-            normalized_filename = os.path.abspath(filename)
-            modified_files[normalized_filename] = changed_files.get(
-                normalized_filename)
+            if os.path.isdir(filename):
+                directories.append(os.path.abspath(filename))
+            else:
+                filenames.add(os.path.abspath(filename))
+        files = _walk_files(vcs, repository_root, sorted(filenames),
+                            directories, changed_files)
     else:
-        modified_files = vcs.modified_files(
-            repository_root,
-            tracked_only=arguments['--tracked'],
-            commit=commit)
+        with timings.span('modified_files', timings.PHASE):
+            modified_files = vcs.modified_files(
+                repository_root,
+                tracked_only=arguments['--tracked'],
+                commit=commit)
+
+    if files is None:
+        files = [(filename, modified_files[filename])
+                 for filename in sorted(modified_files.keys())]
+    if contents is not None:
+
+        def content_function(filename, unused_extra_data):
+            return contents[filename]
+
+    if in_shard is not None:
+        files = (file_data for file_data in files
+                 if in_shard(os.path.relpath(file_data[0], repository_root)))
+    if hooks.has_listeners(hooks.FILE_DISCOVERED):
+        files = _emit_discovered(files)
+
+    fail_after = None
+    if arguments['--fail-fast'] or arguments['--fail-after']:
+        try:
+            fail_after = int(arguments['--fail-after'] or 1)
+            if fail_after < 1:
+                raise ValueError()
+        except ValueError:
+            stderr.write('fatal: Invalid number of problems %s%s' %
+                         (arguments['--fail-after'], linesep))
+            return 2
 
     linter_not_found = False
     files_with_problems = 0
-    gitlint_config = get_config(repository_root)
     json_result = {}
 
-    with futures.ThreadPoolExecutor(max_workers=multiprocessing.cpu_count())\
-            as executor:
-        processfile = functools.partial(process_file, vcs, commit,
-                                        arguments['--force'], gitlint_config)
-        for filename, result in executor.map(
-                processfile, [(filename, modified_files[filename])
-                              for filename in sorted(modified_files.keys())]):
-
-            rel_filename = os.path.relpath(filename)
-
-            if not json_output:
-                stdout.write('Linting file: %s%s' % (termcolor.colored(
-                    rel_filename, attrs=('bold', )), linesep))
-
-            output_lines = []
-            if result.get('error'):
-                output_lines.extend('%s: %s' % (ERROR, reason)
-                                    for reason in result.get('error'))
-                linter_not_found = True
-            if result.get('skipped'):
-                output_lines.extend('%s: %s' % (SKIPPED, reason)
-                                    for reason in result.get('skipped'))
-            if not result.get('comments', []):
-                if not output_lines:
-                    output_lines.append(OK)
-            else:
-                files_with_problems += 1
-                for data in result['comments']:
-                    formatted_message = format_comment(data)
-                    output_lines.append(formatted_message)
-                    data['formatted_message'] = formatted_message
-
-            if json_output:
-                json_result[filename] = result
-            else:
-                output = linesep.join(output_lines)
-                stdout.write(output)
-                stdout.write(linesep + linesep)
+    # The threads running remote jobs just wait for them.
+    workers = engine.concurrency() + distributed.slots()
+    fail_fast = None
+    deadline_filter = None
+    if deadline is not None:
+        # Started before sorting the files, so it can stop git blame too.
+        deadline_filter = _Deadline(deadline)
+    try:
+        with futures.ThreadPoolExecutor(max_workers=workers) as executor, \
+                _cancel_on_error():
+            if deadline_filter is not None:
+                lines_function = None
+                if not arguments['--force'] and base_content_function is None:
+                    lines_function = (modified_lines_function
+                                      or functools.partial(
+                                          vcs.modified_lines, commit=commit))
+                files, modified_lines = _prioritize(
+                    executor,
+                    files,
+                    gitlint_config,
+                    linter_costs,
+                    lines_function,
+                    content_function,
+                    budget=PRIORITIZING_SHARE * deadline_filter.remaining())
+                if modified_lines is not None and commit_reader is None:
+
+                    def modified_lines_function(filename, extra_data):
+                        if filename in modified_lines:
+                            return modified_lines[filename]
+                        return lines_function(filename, extra_data)
+
+            processfile = functools.partial(
+                process_file,
+                vcs,
+                commit,
+                arguments['--force'],
+                gitlint_config,
+                content_function=content_function,
+                modified_lines_function=modified_lines_function,
+                base_content_function=base_content_function)
+            if deadline_filter is not None:
+                processfile = deadline_filter.wrap(processfile)
+            display_name = os.path.relpath
+            if commit_reader is not None:
+                processfile = _in_commit(processfile)
+                display_name = _commit_display_name
+            if fail_after is not None:
+                processfile = fail_fast = _FailFast(processfile, fail_after)
+            results = utils.ordered_map(executor, processfile, files,
+                                        MAX_PENDING_PER_WORKER * workers)
+            if fail_fast is not None:
+                results = fail_fast.results(results)
+            for filename, result in results:
+
+                with timings.span('render', timings.RENDER, filename=filename):
+                    rel_filename = display_name(filename)
+
+                    if not json_output:
+                        stdout.write('Linting file: %s%s' % (termcolor.colored(
+                            rel_filename, attrs=('bold', )), linesep))
+
+                    output_lines = []
+                    if result.get('error'):
+                        output_lines.extend('%s: %s' % (ERROR, reason)
+                                            for reason in result.get('error'))
+                        linter_not_found = True
+                    if result.get('skipped'):
+                        output_lines.extend(
+                            '%s: %s' % (SKIPPED, reason)
+                            for reason in result.get('skipped'))
+                    if result.get('deferred'):
+                        output_lines.extend(
+                            '%s: %s' % (DEFERRED, reason)
+                            for reason in result.get('deferred'))
+                    if not result.get('comments', []):
+                        if not output_lines:
+                            output_lines.append(OK)
+                    else:
+                        files_with_problems += 1
+                        if not json_output:
+                            output_lines.extend(
+                                format_comment(comment)
+                                for comment in result['comments'])
+
+                    if json_output:
+                        json_result[filename] = result
+                    else:
+                        output = linesep.join(output_lines)
+                        stdout.write(output)
+                        stdout.write(linesep + linesep)
+    except IOError as error:
+        if commit_reader is None:
+            raise
+        # Like git cat-file exiting on an invalid name.
+        stderr.write('fatal: %s%s' % (error, linesep))
+        return 2
+    finally:
+        if deadline_filter is not None:
+            deadline_filter.close()
+        if commit_reader is not None:
+            commit_reader.close()
+
+    if deadline_filter is not None and deadline_filter.deferred:
+        deferred = len(deadline_filter.deferred)
+        if (commit_reader is None
+                and not arguments['--stdin-filename'] and _lint_in_background(
+                    arguments, repository_root, deadline_filter.deferred)):
+            stderr.write('Deferred %d file(s), linting them in the '
+                         'background%s' % (deferred, linesep))
+        else:
+            stderr.write('Deferred %d file(s)%s' % (deferred, linesep))
+
+    if fail_fast is not None and fail_fast.stopped:
+        stderr.write('Stopped after %d problem(s), the remaining files were '
+                     'not linted%s' % (fail_fast.comments, linesep))
+
+    if arguments['--timings']:
+        timings_summary = timings.summary(recorder, repository_root)
+        if json_output:
+            json_result['timings'] = timings_summary
+        else:
+            stdout.write(
+                linesep.join(timings.format_summary(timings_summary)) +
+                linesep)
 
+    profiling.checkpoint()
     if json_output:
         # Hack to convert to unicode, Python3 returns unicode, wheres Python2
         # returns str.
-        stdout.write(
-            json.dumps(json_result,
-                       ensure_ascii=False).encode('utf-8').decode('utf-8'))
+        with timings.span('render', timings.RENDER):
+            stdout.write(
+                json.dumps(
+                    json_result, ensure_ascii=False,
+                    default=_comment_to_json).encode('utf-8').decode('utf-8'))
 
     if files_with_problems > 0:
         return 1
@@ -0,0 +1,123 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Functions to export and import bundles of the content cache.
+
+A bundle is a gzipped tar archive with one member per entry of the cache keyed
+by content, named '<linter fingerprint>/<file key>', see utils.content_key. As
+the entries are keyed by content, merging bundles just means adding the missing
+entries.
+"""
+
+import os
+import os.path
+import re
+import tarfile
+
+import gitlint.utils as utils
+
+_ENTRY_REGEX = re.compile(r'^[0-9a-f]{40}/[0-9a-f]{40}$')
+
+
+def is_valid_entry(name):
+    """Returns whether name is '<linter fingerprint>/<file key>'."""
+    return bool(_ENTRY_REGEX.match(name))
+
+
+def _entries(keys=None):
+    """Yields the (name, path) of the entries in the content cache.
+
+    Args:
+      keys: set[string]|None: if given, only entries for these file keys are
+        returned.
+    """
+    cache_dir = utils.get_content_cache_dir()
+    if not os.path.isdir(cache_dir):
+        return
+    for fingerprint in sorted(os.listdir(cache_dir)):
+        fingerprint_dir = os.path.join(cache_dir, fingerprint)
+        if not os.path.isdir(fingerprint_dir):
+            continue
+        for key in sorted(os.listdir(fingerprint_dir)):
+            name = '%s/%s' % (fingerprint, key)
+            if not is_valid_entry(name):
+                continue
+            if keys is not None and key not in keys:
+                continue
+            yield name, os.path.join(fingerprint_dir, key)
+
+
+def export_bundle(stream, keys=None):
+    """Writes a bundle with the entries of the content cache to stream.
+
+    Args:
+      stream: binary file object where to write the bundle. It does not need to
+        be seekable.
+      keys: set[string]|None: if given, only entries for these file keys are
+        exported.
+
+    Returns: int: the number of exported entries.
+    """
+    count = 0
+    with tarfile.open(fileobj=stream, mode='w|gz') as bundle:
+        for name, path in _entries(keys):
+            bundle.add(path, arcname=name, recursive=False)
+            count += 1
+    return count
+
+
+def import_bundle(stream):
+    """Adds the entries of the bundle in stream to the content cache.
+
+    Entries already present are skipped, as the content is the same.
+
+    Args:
+      stream: binary file object with the bundle. It does not need to be
+        seekable.
+
+    Returns: int: the number of imported entries.
+
+    Raises: ValueError if stream is not a valid bundle.
+    """
+    cache_dir = utils.get_content_cache_dir()
+    count = 0
+    try:
+        with tarfile.open(fileobj=stream, mode='r|*') as bundle:
+            for member in bundle:
+                if not member.isfile() or not is_valid_entry(member.name):
+                    continue
+                cache_filename = os.path.join(cache_dir,
+                                              *member.name.split('/'))
+                if os.path.exists(cache_filename):
+                    continue
+                content = bundle.extractfile(member).read().decode('utf-8')
+                utils.write_atomically(cache_filename, content)
+                count += 1
+    except tarfile.TarError as error:
+        raise ValueError('Invalid bundle: %s' % error)
+    return count
+
+
+def keys_since(vcs, repository_root, revision):
+    """Returns the keys of the files changed since revision."""
+    return set(
+        utils.content_key(
+            os.path.relpath(filename, repository_root),
+            utils.content_hash(filename))
+        for filename in vcs.files_changed_since(repository_root, revision)
+        if os.path.isfile(filename))
+
+
+def open_binary(stream):
+    """Returns the binary version of a text stream like sys.stdout."""
+    return getattr(stream, 'buffer', stream)
@@ -0,0 +1,445 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Coordinator and workers to run the linters on other machines.
+
+Workers are started with 'git-lint worker' and listen on a TCP address
+(host:port) or on a Unix socket (unix:/path). A run given --workers acts as the
+coordinator: the linters missing in the caches are sent to the workers as jobs
+made of the linter fingerprint, the path of the file relative to the repository
+root and the content to lint. The workers only run the linters of their own
+configuration, looked up by fingerprint, over the path in their own clone, and
+reply with the raw output, with the linted filename replaced by
+utils.FILENAME_PLACEHOLDER. The coordinator puts back its own filename, then
+filters and caches the output as if the linter had run locally.
+
+The workers run linters over content sent by anyone who can connect to them, so
+they should listen on a Unix socket or on localhost, reached through an SSH
+tunnel for instance. The workers and coordinators given the same
+GIT_LINT_WORKER_TOKEN only accept each other. The workers reject paths that are
+absolute, go up with .. or start with -, so they cannot be passed to the
+linters as options or name files outside the clone.
+
+The protocol is line based, with one JSON object per line. On connection the
+coordinator sends {"token": ...}, and the worker answers {"slots": N}, the
+number of jobs it runs at once, or {"error": ...} if the token is not its own.
+Then each request {"fingerprint": ..., "path": ..., "content": <base64>} is
+answered with {"output": ...} or {"error": ...}.
+
+The coordinator opens one connection per slot, all of them taking jobs from a
+shared queue, so idle workers take the pending jobs from busy ones. A job whose
+connection fails is queued again, up to MAX_ATTEMPTS times. Jobs that cannot
+be run remotely are run locally.
+"""
+
+import base64
+import hmac
+import json
+import os
+import socket
+import threading
+import time
+from concurrent import futures
+
+try:
+    import queue
+    import socketserver
+except ImportError:
+    import Queue as queue
+    import SocketServer as socketserver
+
+import gitlint.timings as timings
+import gitlint.utils as utils
+
+# Default address where the workers listen.
+DEFAULT_ADDRESS = 'localhost:8743'
+
+# Seconds to wait for a worker to connect or to finish a job.
+DEFAULT_TIMEOUT = 600
+
+# Times a job is sent to the workers before running it locally.
+MAX_ATTEMPTS = 3
+
+# Consecutive failed connections after which a slot is given up.
+MAX_CONNECT_FAILURES = 3
+
+# Seconds to wait before reconnecting, multiplied by the failures so far.
+RECONNECT_DELAY = 0.5
+
+# Largest message, in bytes, accepted by the workers and the coordinator.
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+UNIX_PREFIX = 'unix:'
+
+# Environment variable with the token shared by the workers and coordinators.
+TOKEN_ENVIRONMENT_VARIABLE = 'GIT_LINT_WORKER_TOKEN'
+
+
+def parse_address(address):
+    """Parses host:port or unix:/path.
+
+    Returns: tuple(int, object): the socket family and the address in the
+      format expected by socket.
+
+    Raises: ValueError if address is not valid.
+    """
+    if address.startswith(UNIX_PREFIX):
+        return socket.AF_UNIX, address[len(UNIX_PREFIX):]
+    host, _, port = address.rpartition(':')
+    if not host:
+        raise ValueError('Invalid address "%s", expected host:port or '
+                         'unix:/path' % address)
+    return socket.AF_INET, (host, int(port))
+
+
+def validate_path(path):
+    """Returns path if it is safe to lint in the clone of a worker.
+
+    Raises: ValueError if path is absolute, goes up with .. or starts with -,
+      like an option of the linters.
+    """
+    if (not path or os.path.isabs(path) or path.startswith('-')
+            or os.pardir in path.replace(os.sep, '/').split('/')):
+        raise ValueError('Invalid path "%s"' % path)
+    return path
+
+
+def _read_message(stream):
+    line = stream.readline(MAX_MESSAGE_SIZE)
+    if not line.endswith(b'\n'):
+        raise ValueError('Connection closed')
+    return json.loads(line.decode('utf-8'))
+
+
+def _write_message(stream, message):
+    stream.write(json.dumps(message).encode('utf-8') + b'\n')
+    stream.flush()
+
+
+class _Connection(object):
+    """Connection to a worker, running one job at a time."""
+
+    def __init__(self, address, timeout, token=None):
+        family, socket_address = parse_address(address)
+        if family == socket.AF_UNIX:
+            self._socket = socket.socket(family, socket.SOCK_STREAM)
+            self._socket.settimeout(timeout)
+            try:
+                self._socket.connect(socket_address)
+            except Exception:
+                self._socket.close()
+                raise
+        else:
+            self._socket = socket.create_connection(socket_address, timeout)
+        self._file = self._socket.makefile('rwb')
+        try:
+            _write_message(self._file, {'token': token})
+            self.slots = int(_read_message(self._file)['slots'])
+        except Exception:
+            self.close()
+            raise
+
+    def request(self, job):
+        _write_message(self._file, job)
+        return _read_message(self._file)
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+
+# Errors of a connection to a worker.
+_CONNECTION_ERRORS = (socket.error, OSError, ValueError, KeyError, TypeError)
+
+
+class Coordinator(object):
+    """Sends the jobs to the workers, with one thread per slot of the workers.
+
+    The workers are connected when the coordinator is created, so slots tells
+    how many jobs can run remotely at once.
+
+    Args:
+      addresses: list[string]: the addresses of the workers.
+      timeout: float: seconds to wait for a worker to connect or to finish a
+        job.
+      token: string|None: the token the workers expect, if any.
+    """
+
+    def __init__(self, addresses, timeout=DEFAULT_TIMEOUT, token=None):
+        self._timeout = timeout
+        self._token = token
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._alive = 0
+        self.slots = 0
+        for address in addresses:
+            try:
+                connection = _Connection(address, timeout, token)
+            except _CONNECTION_ERRORS:
+                timings.increment('worker_errors')
+                continue
+            self.slots += connection.slots
+            self._start(address, connection)
+            for _ in range(connection.slots - 1):
+                self._start(address, None)
+
+    def _start(self, address, connection):
+        thread = threading.Thread(
+            target=self._work,
+            args=(address, connection),
+            name='git-lint-worker-%s-%d' % (address, len(self._threads)))
+        thread.daemon = True
+        with self._lock:
+            self._alive += 1
+        self._threads.append(thread)
+        thread.start()
+
+    def _work(self, address, connection):
+        """Runs the queued jobs in the worker at address, one at a time."""
+        failures = 0
+        try:
+            while True:
+                if connection is None:
+                    try:
+                        connection = _Connection(address, self._timeout,
+                                                 self._token)
+                    except _CONNECTION_ERRORS:
+                        timings.increment('worker_errors')
+                        failures += 1
+                        if failures >= MAX_CONNECT_FAILURES:
+                            return
+                        time.sleep(RECONNECT_DELAY * failures)
+                        continue
+                item = self._queue.get()
+                if item is None:
+                    return
+                job, future, attempts = item
+                try:
+                    response = connection.request(job)
+                except _CONNECTION_ERRORS:
+                    timings.increment('worker_errors')
+                    connection.close()
+                    connection = None
+                    failures += 1
+                    if attempts + 1 < MAX_ATTEMPTS:
+                        timings.increment('worker_retries')
+                        self._queue.put((job, future, attempts + 1))
+                    else:
+                        future.set_result(None)
+                    continue
+                failures = 0
+                future.set_result(response.get('output'))
+        finally:
+            if connection is not None:
+                connection.close()
+            with self._lock:
+                self._alive -= 1
+                if not self._alive:
+                    # Nobody is left to run the queued jobs.
+                    while True:
+                        try:
+                            item = self._queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if item is not None:
+                            item[1].set_result(None)
+
+    def run(self, fingerprint, filename, content, path=None):
+        """Runs a job in the workers, blocking until it is done.
+
+        Args:
+          fingerprint: string: the fingerprint of the linter configuration.
+          filename: string: the filename to use in the output.
+          content: bytes: the content to lint.
+          path: string|None: the path of filename relative to the repository
+            root, which the workers lint in their clone. Without it, or if it
+            is not valid, the job is not run remotely.
+
+        Returns: string|None: the output of the linter, or None if it could not
+          be run remotely.
+        """
+        try:
+            validate_path(path)
+        except (ValueError, TypeError, AttributeError):
+            return None
+        future = futures.Future()
+        job = {
+            'fingerprint': fingerprint,
+            'path': path,
+            'content': base64.b64encode(content).decode('ascii'),
+        }
+        with self._lock:
+            if not self._alive:
+                return None
+            self._queue.put((job, future, 0))
+        output = future.result()
+        if output is not None:
+            timings.increment('worker_jobs')
+            output = output.replace(utils.FILENAME_PLACEHOLDER, filename)
+        return output
+
+    def close(self):
+        """Stops the threads once the queued jobs are done."""
+        for _ in self._threads:
+            self._queue.put(None)
+
+
+_COORDINATOR = None
+
+
+def enable(addresses, timeout=DEFAULT_TIMEOUT, token=None):
+    """Starts sending the jobs to the workers, returning the coordinator."""
+    global _COORDINATOR  # pylint: disable=global-statement
+    _COORDINATOR = Coordinator(addresses, timeout=timeout, token=token)
+    return _COORDINATOR
+
+
+def disable():
+    """Stops sending the jobs to the workers."""
+    global _COORDINATOR  # pylint: disable=global-statement
+    coordinator, _COORDINATOR = _COORDINATOR, None
+    if coordinator is not None:
+        coordinator.close()
+
+
+def slots():
+    """Returns how many jobs the workers can run at once, 0 if disabled."""
+    coordinator = _COORDINATOR
+    if coordinator is None:
+        return 0
+    return coordinator.slots
+
+
+def is_enabled():
+    return _COORDINATOR is not None
+
+
+def run(fingerprint, filename, content, path=None):
+    """Runs a job in the workers, see Coordinator.run.
+
+    Returns: string|None: the output of the linter, or None if it could not be
+      run remotely or the workers are disabled.
+    """
+    coordinator = _COORDINATOR
+    if coordinator is None:
+        return None
+    return coordinator.run(fingerprint, filename, content, path)
+
+
+class WorkerHandler(socketserver.StreamRequestHandler):
+    """Runs the jobs sent through a connection, one at a time."""
+
+    def handle(self):
+        try:
+            token = _read_message(self.rfile)['token']
+        except (ValueError, socket.error, KeyError, TypeError):
+            return
+        if not self.server.accepts(token):
+            _write_message(self.wfile, {'error': 'Invalid token'})
+            return
+        _write_message(self.wfile, {'slots': self.server.slots})
+        while True:
+            try:
+                job = _read_message(self.rfile)
+            except (ValueError, socket.error):
+                return
+            try:
+                path = validate_path(job['path'])
+                content = base64.b64decode(job['content'].encode('ascii'))
+                with self.server.semaphore:
+                    output = self.server.run_job(job['fingerprint'], path,
+                                                 content)
+                response = {'output': output}
+            except (KeyError, TypeError, ValueError, AttributeError) as error:
+                response = {'error': 'Invalid job: %r' % (error, )}
+            _write_message(self.wfile, response)
+
+
+def _encode(text):
+    return text if isinstance(text, bytes) else text.encode('utf-8')
+
+
+class _WorkerMixIn(socketserver.ThreadingMixIn):
+    daemon_threads = True
+
+    def setup_worker(self, run_job, slots, token):
+        self.run_job = run_job
+        self.slots = slots
+        self.token = token
+        # Jobs of all the connections share the slots.
+        self.semaphore = threading.BoundedSemaphore(slots)
+
+    def accepts(self, token):
+        """Returns whether a coordinator sending token may send jobs."""
+        if self.token is None:
+            return True
+        if not isinstance(token, (type(u''), bytes)):
+            return False
+        # Compared in constant time, so the token cannot be guessed by timing.
+        return hmac.compare_digest(_encode(token), _encode(self.token))
+
+
+class TcpWorker(_WorkerMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+
+
+class UnixWorker(_WorkerMixIn, socketserver.UnixStreamServer):
+    pass
+
+
+def make_worker(address, run_job, slots, token=None):
+    """Creates a worker listening on address.
+
+    Args:
+      address: string: host:port or unix:/path.
+      run_job: callable(fingerprint, path, content): returns the output of the
+        linter with the given fingerprint over content, for the file at path
+        relative to the root of the clone, raising KeyError for unknown
+        fingerprints. The linted filename is replaced by
+        utils.FILENAME_PLACEHOLDER in the output.
+      slots: int: number of jobs to run at once.
+      token: string|None: if given, the token the coordinators have to send.
+
+    Raises: ValueError if the address is not valid, or socket.error if it
+      cannot listen on it.
+    """
+    family, socket_address = parse_address(address)
+    if family == socket.AF_UNIX:
+        server = UnixWorker(socket_address, WorkerHandler)
+    else:
+        server = TcpWorker(socket_address, WorkerHandler)
+    server.setup_worker(run_job, slots, token)
+    return server
+
+
+def worker_address(server):
+    """Returns the address where the worker listens, like host:port."""
+    if server.address_family == socket.AF_UNIX:
+        return UNIX_PREFIX + server.server_address
+    return '%s:%d' % server.server_address[:2]
+
+
+def serve(server):
+    """Serves the jobs until interrupted."""
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if server.address_family == socket.AF_UNIX:
+            try:
+                os.remove(server.server_address)
+            except OSError:
+                pass
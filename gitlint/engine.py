@@ -0,0 +1,515 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Engines running the subprocesses of the linters and the vcs (--engine).
+
+The threads engine, the default, starts each subprocess from the thread that
+needs it, so the number of subprocesses running at once is bounded by the
+number of threads (--jobs). The asyncio engine starts them with
+asyncio.create_subprocess_exec from an event loop running in its own thread,
+bounded by a global semaphore (--max-subprocesses) instead. The threads only
+wait for the loop, so there are as many of them as subprocesses, and the
+linters are only limited by the semaphore and the job slots of make.
+
+Both engines honor the limits of each linter (max_processes in the
+configuration) and kill all their subprocesses when cancelled. The
+subprocesses run in their own process group, so the processes they start, like
+those of a linter wrapped in a shell script, are killed along with them.
+
+The threads engine reaps its subprocesses with os.wait4, recording the CPU
+time and max RSS of each of them in the timings. The event loop reaps those of
+the asyncio engine, so they are not measured.
+"""
+
+import errno
+import os
+import signal
+import subprocess
+import sys
+import threading
+from concurrent import futures
+
+import gitlint.parallelism as parallelism
+import gitlint.timings as timings
+
+THREADS = 'threads'
+ASYNCIO = 'asyncio'
+ENGINES = (THREADS, ASYNCIO)
+
+# Size of the chunks read from the output of the subprocesses by the asyncio
+# engine. Each read is a round trip to the loop.
+READ_SIZE = 64 * 1024
+
+
+class Cancelled(Exception):
+    """Raised when starting a subprocess after the engine was cancelled."""
+
+
+class _Limits(object):
+    """Semaphores limiting the subprocesses of each key, created on demand."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def get(self, key, count):
+        with self._lock:
+            if key not in self._semaphores:
+                self._semaphores[key] = self._factory(count)
+            return self._semaphores[key]
+
+
+class _Engine(object):
+    """Keeps track of the running subprocesses, to kill them on cancel."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._processes = set()
+        self._cancelled = False
+
+    def _register(self, process):
+        with self._lock:
+            if not self._cancelled:
+                self._processes.add(process)
+                return
+        process.kill()
+        process.wait()
+        raise Cancelled()
+
+    def _unregister(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+    def is_cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        """Kills the running subprocesses. New ones raise Cancelled."""
+        with self._lock:
+            self._cancelled = True
+            processes = list(self._processes)
+        for process in processes:
+            process.kill()
+
+    def check_output(self, command, **kwargs):
+        """Like subprocess.check_output, but killed on cancel like popen.
+
+        Raises: CalledProcessError if command failed. Cancelled if the engine
+          was cancelled, like when killing command.
+        """
+        process = self.popen(command, **kwargs)
+        try:
+            output = process.stdout.read()
+        finally:
+            returncode = process.wait()
+        if returncode:
+            if self._cancelled:
+                raise Cancelled()
+            raise subprocess.CalledProcessError(returncode, command, output)
+        return output
+
+
+def new_group_arguments():
+    """Returns the arguments of Popen to start a process in its own group."""
+    if sys.version_info[0] < 3:
+        return {'preexec_fn': os.setsid}
+    return {'start_new_session': True}
+
+
+def _kill_group(process):
+    """Kills the process and all the processes of its group."""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        # It already exited.
+        pass
+
+
+def _reap(process):
+    """Waits for process to exit, recording its resource usage in the timings.
+
+    Returns: int: the exit code of the process.
+    """
+    if not hasattr(os, 'wait4') or process.returncode is not None:
+        return process.wait()
+    while True:
+        try:
+            _, status, usage = os.wait4(process.pid, 0)
+            break
+        except OSError as error:
+            if error.errno == errno.EINTR:
+                continue
+            if error.errno == errno.ECHILD:
+                # Already reaped by Popen, like when killing it.
+                return process.wait()
+            raise
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+    timings.record_child(usage)
+    return process.returncode
+
+
+def _write_input(stream, content):
+    """Writes content to the stdin of a process, closing it afterwards."""
+    try:
+        try:
+            stream.write(content)
+        finally:
+            stream.close()
+    except (IOError, OSError):
+        # The process exited without reading all its input.
+        pass
+
+
+class _ThreadProcess(object):
+    """A subprocess started by ThreadEngine."""
+
+    def __init__(self, engine, process, content, semaphore):
+        self._engine = engine
+        self._process = process
+        self._semaphore = semaphore
+        self.stdout = process.stdout
+        self._writer = None
+        if content is not None:
+            # The process may write its output before reading all its input.
+            self._writer = threading.Thread(
+                target=_write_input, args=(process.stdin, content))
+            self._writer.daemon = True
+            self._writer.start()
+
+    def kill(self):
+        _kill_group(self._process)
+
+    def wait(self):
+        """Waits for the process to exit, returning its exit code."""
+        try:
+            return _reap(self._process)
+        finally:
+            if self._writer is not None:
+                self._writer.join()
+            if self._semaphore is not None:
+                self._semaphore.release()
+            self._engine._unregister(self)  # pylint: disable=protected-access
+
+
+class ThreadEngine(_Engine):
+    """Starts the subprocesses from the calling threads.
+
+    Args:
+      jobs: int|None: the number of threads. Defaults to the number of CPUs
+        available to the process.
+    """
+
+    def __init__(self, jobs=None):
+        _Engine.__init__(self)
+        self.jobs = jobs
+        self._limits = _Limits(threading.BoundedSemaphore)
+
+    def concurrency(self):
+        return self.jobs or parallelism.available_cpus()
+
+    def popen(self, arguments, content=None, limit=None, **kwargs):
+        semaphore = None
+        if limit is not None:
+            semaphore = self._limits.get(*limit)
+            semaphore.acquire()
+        try:
+            if self._cancelled:
+                raise Cancelled()
+            if content is not None:
+                kwargs['stdin'] = subprocess.PIPE
+            kwargs.update(new_group_arguments())
+            process = _ThreadProcess(
+                self,
+                subprocess.Popen(arguments, stdout=subprocess.PIPE, **kwargs),
+                content, semaphore)
+        except BaseException:
+            if semaphore is not None:
+                semaphore.release()
+            raise
+        self._register(process)
+        return process
+
+    def close(self):
+        self.cancel()
+
+
+class _AsyncReader(object):
+    """Blocking reader of the output of a subprocess run by the event loop.
+
+    The output is fetched from the loop in chunks of READ_SIZE, and split in
+    lines by the calling thread.
+    """
+
+    def __init__(self, engine, stream):
+        self._engine = engine
+        self._stream = stream
+        self._buffer = b''
+        self._position = 0
+        self._eof = False
+
+    def _fill(self):
+        chunk = self._engine.run(self._stream.read(READ_SIZE))
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+        self._eof = not chunk
+
+    def read(self, size=-1):
+        """Returns up to size bytes, or all the remaining ones if negative.
+
+        Like the read of a pipe, it only blocks when there is no data at all.
+        """
+        if size < 0:
+            while not self._eof:
+                self._fill()
+            size = len(self._buffer)
+        elif self._position == len(self._buffer) and not self._eof:
+            self._fill()
+        data = self._buffer[self._position:self._position + size]
+        self._position += len(data)
+        return data
+
+    def readline(self):
+        index = self._buffer.find(b'\n', self._position)
+        while index < 0 and not self._eof:
+            start = len(self._buffer) - self._position
+            self._fill()
+            index = self._buffer.find(b'\n', start)
+        end = len(self._buffer) if index < 0 else index + 1
+        line = self._buffer[self._position:end]
+        self._position = end
+        return line
+
+    def close(self):
+        self._buffer = b''
+        self._position = 0
+
+
+class _AsyncProcess(object):
+    """A subprocess started by AsyncioEngine."""
+
+    def __init__(self, engine, process, semaphores):
+        self._engine = engine
+        self._process = process
+        self._semaphores = semaphores
+        self.stdout = _AsyncReader(engine, process.stdout)
+
+    def kill(self):
+        _kill_group(self._process)
+
+    def wait(self):
+        """Waits for the process to exit, returning its exit code."""
+        try:
+            return self._engine.run(self._process.wait())
+        finally:
+            for semaphore in self._semaphores:
+                self._engine.call_soon(semaphore.release)
+            self._engine._unregister(self)  # pylint: disable=protected-access
+
+
+class AsyncioEngine(_Engine):
+    """Starts the subprocesses from an event loop running in its own thread.
+
+    Args:
+      max_subprocesses: int: the maximum number of subprocesses running at
+        once, counting the ones of the VCS too.
+    """
+
+    def __init__(self, max_subprocesses):
+        _Engine.__init__(self)
+        # asyncio is not available in Python 2.
+        import asyncio  # pylint: disable=import-error
+        self._asyncio = asyncio
+        self.max_subprocesses = max_subprocesses
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run_loop, name='asyncio-engine')
+        self._thread.daemon = True
+        self._thread.start()
+        # The semaphores are created in the loop, as before Python 3.10 they
+        # are bound to the loop of the thread creating them.
+        self._semaphore = self._call(asyncio.Semaphore, max_subprocesses)
+        self._limits = _Limits(asyncio.Semaphore)
+
+    def _run_loop(self):
+        self._asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def _call(self, function, *args):
+        """Calls function in the loop, returning its result."""
+        future = futures.Future()
+
+        def call():
+            try:
+                future.set_result(function(*args))
+            except BaseException as error:  # pylint: disable=broad-except
+                future.set_exception(error)
+
+        self._loop.call_soon_threadsafe(call)
+        return future.result()
+
+    def call_soon(self, function, *args):
+        """Schedules a call of function in the loop, without waiting for it."""
+        self._loop.call_soon_threadsafe(function, *args)
+
+    def run(self, coroutine):
+        """Runs coroutine in the loop, returning its result."""
+        return self._asyncio.run_coroutine_threadsafe(coroutine,
+                                                      self._loop).result()
+
+    def concurrency(self):
+        return self.max_subprocesses
+
+    def _start(self, arguments, content, kwargs):
+        """Starts the process in the loop, writing content to its stdin."""
+        if content is not None:
+            kwargs['stdin'] = self._asyncio.subprocess.PIPE
+        kwargs.update(new_group_arguments())
+        process = self.run(
+            self._asyncio.create_subprocess_exec(
+                *arguments, stdout=self._asyncio.subprocess.PIPE, **kwargs))
+        if content is not None:
+
+            def write():
+                # The transport writes the content as the process reads it, and
+                # closes stdin once all written.
+                process.stdin.write(content)
+                process.stdin.close()
+
+            self.call_soon(write)
+        return process
+
+    def popen(self, arguments, content=None, limit=None, **kwargs):
+        # The slot of the linter is taken first, so the global slots are not
+        # held while waiting for it.
+        semaphores = [self._semaphore]
+        if limit is not None:
+            semaphores.insert(0, self._call(self._limits.get, *limit))
+        acquired = []
+        try:
+            for semaphore in semaphores:
+                self.run(semaphore.acquire())
+                acquired.append(semaphore)
+            if self._cancelled:
+                raise Cancelled()
+            process = _AsyncProcess(self,
+                                    self._start(arguments, content, kwargs),
+                                    acquired)
+        except BaseException:
+            for semaphore in acquired:
+                self.call_soon(semaphore.release)
+            raise
+        self._register(process)
+        return process
+
+    def close(self):
+        """Kills the running subprocesses and stops the loop."""
+        self.cancel()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+_ENGINE = ThreadEngine()
+
+
+def start(name, jobs=None, max_subprocesses=None):
+    """Starts running the subprocesses with the engine called name.
+
+    Args:
+      name: string: one of ENGINES.
+      jobs: int|None: for the threads engine, the number of linters to run at
+        once. Defaults to the number of CPUs available to the process.
+      max_subprocesses: int|None: for the asyncio engine, the maximum number of
+        subprocesses running at once, linters included. Defaults to twice
+        jobs.
+
+    Returns: the engine.
+
+    Raises: ValueError if the engine is not supported.
+    """
+    global _ENGINE  # pylint: disable=global-statement
+    jobs = jobs or parallelism.available_cpus()
+    if name == THREADS:
+        engine = ThreadEngine(jobs)
+    elif name == ASYNCIO:
+        if sys.version_info < (3, 8):
+            raise ValueError('The asyncio engine requires Python 3.8')
+        engine = AsyncioEngine(max_subprocesses or 2 * jobs)
+    else:
+        raise ValueError('Invalid engine "%s", expected one of: %s' %
+                         (name, ', '.join(ENGINES)))
+    _ENGINE = engine
+    return engine
+
+
+def stop():
+    """Kills the subprocesses still running and goes back to the threads engine.
+
+    Returns: the engine used until now.
+    """
+    global _ENGINE  # pylint: disable=global-statement
+    engine, _ENGINE = _ENGINE, ThreadEngine()
+    engine.close()
+    return engine
+
+
+def concurrency():
+    """Returns the number of subprocesses the engine is meant to run at once."""
+    return _ENGINE.concurrency()
+
+
+def popen(arguments, content=None, limit=None, **kwargs):
+    """Starts a subprocess, whose output is read from stdout.
+
+    Args:
+      arguments: list[string]: the program and its arguments.
+      content: bytes|None: the content to pass through stdin.
+      limit: tuple(string, int)|None: a key, like the linter name, and the
+        maximum number of subprocesses with that key running at once.
+      kwargs: extra arguments for subprocess.Popen, like stderr or cwd.
+
+    Returns: the process, with a stdout file object supporting read and
+      readline, and the methods kill and wait. wait has to be called once the
+      output is read, to release the slots of the process.
+
+    Raises: OSError if the program could not be executed. Cancelled if the
+      engine was cancelled.
+    """
+    return _ENGINE.popen(arguments, content=content, limit=limit, **kwargs)
+
+
+def check_output(command, **kwargs):
+    """Like subprocess.check_output, but running command in the engine.
+
+    Raises: CalledProcessError if command failed. Cancelled if the engine was
+      cancelled, killing command.
+    """
+    return _ENGINE.check_output(command, **kwargs)
+
+
+def cancel():
+    """Kills the running subprocesses, making the new ones raise Cancelled."""
+    _ENGINE.cancel()
+
+
+def is_cancelled():
+    """Returns whether the engine was cancelled.
+
+    The output of a subprocess killed by cancel ends early, so callers check it
+    once the output is read, to not mistake it for the whole output.
+    """
+    return _ENGINE.is_cancelled()
@@ -15,14 +15,16 @@
 
 import os.path
 import subprocess
+import threading
 
+import gitlint.timings as timings
 import gitlint.utils as utils
 
 
 def repository_root():
     """Returns the root of the repository as an absolute path."""
     try:
-        root = subprocess.check_output(
+        root = utils.check_output(
             ['git', 'rev-parse', '--show-toplevel'],
             stderr=subprocess.STDOUT).strip()
         # Convert to unicode first
@@ -34,7 +36,7 @@ def repository_root():
 def last_commit():
     """Returns the SHA1 of the last commit."""
     try:
-        root = subprocess.check_output(
+        root = utils.check_output(
             ['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT).strip()
         # Convert to unicode first
         return root.decode('utf-8')
@@ -69,7 +71,7 @@ def modified_files(root, tracked_only=False, commit=None):
         return _modified_files_with_commit(root, commit)
 
     # Convert to unicode and split
-    status_lines = subprocess.check_output([
+    status_lines = utils.check_output([
         'git', 'status', '--porcelain', '--untracked-files=all',
         '--ignore-submodules=all'
     ]).decode('utf-8').split(os.linesep)
@@ -90,7 +92,7 @@ def modified_files(root, tracked_only=False, commit=None):
 
 def _modified_files_with_commit(root, commit):
     # Convert to unicode and split
-    status_lines = subprocess.check_output([
+    status_lines = utils.check_output([
         'git', 'diff-tree', '-r', '--root', '--no-commit-id', '--name-status',
         commit
     ]).decode('utf-8').split(os.linesep)
@@ -116,7 +118,7 @@ def modified_lines(filename, extra_data, commit=None):
       commit: the complete sha1 (40 chars) of the commit. Note that specifying
         this value will only work (100%) when commit == last_commit (with
         respect to the currently checked out revision), otherwise, we could miss
-        some lines.
+        some lines. To get the lines changed by any commit, use commit_changes.
 
     Returns: a list of lines that were modified, or None in case all lines are
       new.
@@ -131,10 +133,299 @@ def modified_lines(filename, extra_data, commit=None):
     commit = commit.encode('utf-8')
 
     # Split as bytes, as the output may have some non unicode characters.
-    blame_lines = subprocess.check_output(
-        ['git', 'blame', '--porcelain', filename]).split(
-            os.linesep.encode('utf-8'))
+    blame_lines = utils.check_output(['git', 'blame', '--porcelain',
+                                      filename]).split(
+                                          os.linesep.encode('utf-8'))
     modified_line_numbers = utils.filter_lines(
         blame_lines, commit + br' (?P<line>\d+) (\d+)', groups=('line', ))
 
     return list(map(int, modified_line_numbers))
+
+
+def files_changed_since(root, revision):
+    """Returns the files whose content differs from the one in revision.
+
+    Args:
+      root: the root of the repository, it has to be an absolute path.
+      revision: any revision understood by git, like a SHA1 or a branch name.
+
+    Returns: a list with the absolute paths of the changed files, including
+      the changes in the working copy.
+    """
+    assert os.path.isabs(root), "Root has to be absolute, got: %s" % root
+
+    filenames = utils.check_output(
+        ['git', 'diff', '--name-only', '-z', revision,
+         '--']).decode('utf-8').split('\0')
+
+    return [os.path.join(root, filename) for filename in filenames if filename]
+
+
+def staged_files(root):
+    """Returns the files added or modified in the index.
+
+    Args:
+      root: the root of the repository, it has to be an absolute path.
+
+    Returns: a dictionary with the staged files as keys, and their status as
+      values, either 'A ' or 'M ' as returned by git status.
+    """
+    assert os.path.isabs(root), "Root has to be absolute, got: %s" % root
+
+    fields = utils.check_output([
+        'git', 'diff', '--cached', '--name-status', '-z', '--no-renames',
+        '--diff-filter=AM'
+    ]).decode('utf-8').split('\0')
+
+    return dict((os.path.join(root, filename), mode + ' ')
+                for mode, filename in zip(fields[0::2], fields[1::2])
+                if filename)
+
+
+class _CatFile(object):
+    """A git cat-file --batch process, to read many objects with one process.
+
+    It is thread safe, reads are serialized.
+    """
+
+    def __init__(self, root):
+        self._lock = threading.Lock()
+        self._process = subprocess.Popen(
+            ['git', 'cat-file', '--batch'],
+            cwd=root,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE)
+
+    def read(self, name):
+        """Returns the content of the object name, or None if missing."""
+        # The batch protocol is line based.
+        if '\n' in name:
+            return None
+        with self._lock:
+            self._process.stdin.write(('%s\n' % name).encode('utf-8'))
+            self._process.stdin.flush()
+            header = self._process.stdout.readline().rstrip(b'\n')
+            if not header:
+                # Git exits on fatal errors, after writing them to stderr.
+                raise IOError('git cat-file exited with status %s reading %s' %
+                              (self._process.wait(), name))
+            # The name is echoed back for the missing objects, and it may have
+            # spaces, like "HEAD:sp ace.py missing".
+            if header.endswith((b' missing', b' ambiguous')):
+                return None
+            _, object_type, size = header.rsplit(None, 2)
+            content = self._process.stdout.read(int(size))
+            self._process.stdout.read(1)
+            if object_type != b'blob':
+                # Like a directory, whose content is a tree.
+                return None
+            return content
+
+    def close(self):
+        self._process.stdin.close()
+        self._process.stdout.close()
+        self._process.wait()
+
+
+def staged_contents(root, filenames):
+    """Returns the content in the index of the given files.
+
+    All the files are read with a single git cat-file process.
+
+    Args:
+      root: the root of the repository, it has to be an absolute path.
+      filenames: list[string]: absolute paths of the files.
+
+    Returns: dict[string: bytes]: the content of each file in the index. Files
+      not in the index are omitted.
+    """
+    assert os.path.isabs(root), "Root has to be absolute, got: %s" % root
+
+    contents = {}
+    with timings.span('git cat-file', timings.SUBPROCESS):
+        cat_file = _CatFile(root)
+        try:
+            for filename in filenames:
+                content = cat_file.read(
+                    ':%s' % os.path.relpath(filename, root))
+                if content is not None:
+                    contents[filename] = content
+        finally:
+            cat_file.close()
+
+    return contents
+
+
+def staged_modified_lines(filename, extra_data):
+    """Returns the lines modified in the index for this file.
+
+    Args:
+      filename: the file to check.
+      extra_data: is the extra_data returned by staged_files. Additionally, a
+        value of None means that the file was not modified.
+
+    Returns: a list of lines that were modified, or None in case all lines are
+      new.
+    """
+    if extra_data is None:
+        return []
+    if extra_data != 'M ':
+        return None
+
+    diff = utils.check_output([
+        'git', 'diff', '--cached', '-U0', '--no-color', '--no-ext-diff', '--',
+        filename
+    ])
+
+    lines = []
+    for _, file_lines in utils.diff_changes(diff):
+        lines.extend(file_lines or [])
+    return lines
+
+
+def committed_content(root, filename):
+    """Returns the content of filename in the last commit.
+
+    Args:
+      root: the root of the repository, it has to be an absolute path.
+      filename: the absolute path of the file.
+
+    Returns: bytes|None: the content, or None if the file is not in the last
+      commit.
+    """
+    assert os.path.isabs(root), "Root has to be absolute, got: %s" % root
+
+    try:
+        return utils.check_output(
+            [
+                'git', 'cat-file', 'blob',
+                'HEAD:%s' % os.path.relpath(filename, root)
+            ],
+            stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError:
+        return None
+
+
+def tracked_files(root, paths=None):
+    """Yields the tracked files, as they are listed by git ls-files.
+
+    The files are streamed, so they can be processed while git is still
+    listing them, without holding the whole list in memory.
+
+    Each file comes with its blob id in the index when the working copy still
+    has the same content, so it does not need to be read to find it in the
+    cache keyed by content.
+
+    Args:
+      root: the root of the repository, it has to be an absolute path.
+      paths: list[string]|None: absolute paths of files or directories to
+        restrict the listing to. Defaults to the whole repository.
+
+    Yields: tuple(string, string|None): the absolute path of each tracked file
+      present in the working copy, in the order of the index, and its blob id.
+      The blob id is None for files modified in the working copy, unmerged
+      files and symlinks.
+    """
+    assert os.path.isabs(root), "Root has to be absolute, got: %s" % root
+
+    relpaths = [os.path.relpath(path, root) for path in paths or [root]]
+    # Files whose stat information does not match the index, even if only
+    # touched, are considered modified.
+    modified = set(
+        utils.output_fields(
+            ['git', 'diff-files', '--name-only', '-z', '--'] + relpaths,
+            cwd=root))
+    previous = None
+    entries = utils.output_fields(
+        ['git', 'ls-files', '-s', '-z', '--'] + relpaths, cwd=root)
+    for entry in entries:
+        info, relpath = entry.split(b'\t', 1)
+        # Unmerged files have one entry per stage.
+        if relpath == previous:
+            continue
+        previous = relpath
+        filename = os.path.join(root, relpath.decode('utf-8'))
+        # Skip the files deleted in the working copy and submodules.
+        if not os.path.isfile(filename):
+            continue
+        mode, blob_id, stage = info.split(b' ')
+        if stage != b'0' or mode == b'120000' or relpath in modified:
+            yield filename, None
+        else:
+            yield filename, blob_id.decode('ascii')
+
+
+def commits(root, revisions, walk=True):
+    """Returns the commits in revisions, oldest first, skipping merges.
+
+    Args:
+      root: the root of the repository, it has to be an absolute path.
+      revisions: string: a revision, or a range like A..B when walk is True.
+      walk: bool: whether to list all the commits in the range, or just the
+        one given.
+
+    Returns: list[string]: the SHA1 of the commits.
+
+    Raises: subprocess.CalledProcessError if revisions is not valid.
+    """
+    assert os.path.isabs(root), "Root has to be absolute, got: %s" % root
+
+    command = ['git', 'rev-list', '--no-merges']
+    command.append('--reverse' if walk else '--no-walk')
+    command.extend([revisions, '--'])
+    return utils.check_output(
+        command, stderr=subprocess.STDOUT).decode('utf-8').split()
+
+
+def parent_revision(commit):
+    """Returns the name of the first parent of commit."""
+    return '%s^' % commit
+
+
+def commit_changes(root, commit):
+    """Returns the files added or modified by commit and their added lines.
+
+    Args:
+      root: the root of the repository, it has to be an absolute path.
+      commit: string: the SHA1 of the commit.
+
+    Returns: list[(string, list[int]|None)]: the absolute path of each file
+      and the lines added to it, or None if the file is new.
+    """
+    assert os.path.isabs(root), "Root has to be absolute, got: %s" % root
+
+    # Git still quotes the paths with special characters, like quotes, but
+    # not the non-ASCII ones.
+    diff = utils.check_output([
+        'git', '-c', 'core.quotePath=false', 'diff-tree', '-r', '--root',
+        '--no-commit-id', '-p', '-U0', '--no-renames', '--diff-filter=AM',
+        '--no-color', '--no-ext-diff', commit
+    ])
+    return [(os.path.join(root, filename), lines)
+            for filename, lines in utils.diff_changes(diff)]
+
+
+class CommitReader(object):
+    """Reads the content of files in any commit, with a single process."""
+
+    def __init__(self, root):
+        assert os.path.isabs(root), "Root has to be absolute, got: %s" % root
+        self._root = root
+        with timings.span('git cat-file', timings.SUBPROCESS):
+            self._cat_file = _CatFile(root)
+
+    def read(self, commit, filename):
+        """Returns the content of filename in commit, or None if missing.
+
+        Raises:
+          IOError: if git cat-file exited, like on invalid names.
+        """
+        relpath = os.path.relpath(filename, self._root)
+        if relpath.startswith(os.pardir + os.sep):
+            # Git exits when asked for paths outside the repository.
+            return None
+        with timings.span('git cat-file', timings.IO):
+            return self._cat_file.read('%s:%s' % (commit, relpath))
+
+    def close(self):
+        self._cat_file.close()
@@ -22,7 +22,7 @@ import gitlint.utils as utils
 def repository_root():
     """Returns the root of the repository as an absolute path."""
     try:
-        root = subprocess.check_output(
+        root = utils.check_output(
             ['hg', 'root'], stderr=subprocess.STDOUT).strip()
         # Convert to unicode first
         return root.decode('utf-8')
@@ -33,7 +33,7 @@ def repository_root():
 def last_commit():
     """Returns the SHA1 of the last commit."""
     try:
-        root = subprocess.check_output(
+        root = utils.check_output(
             ['hg', 'parent', '--template={node}'],
             stderr=subprocess.STDOUT).strip()
         # Convert to unicode first
@@ -62,7 +62,7 @@ def modified_files(root, tracked_only=False, commit=None):
         command.append('--change=%s' % commit)
 
     # Convert to unicode and split
-    status_lines = subprocess.check_output(command).decode('utf-8').split(
+    status_lines = utils.check_output(command).decode('utf-8').split(
         os.linesep)
 
     modes = ['M', 'A']
@@ -89,7 +89,7 @@ def modified_lines(filename, extra_data, commit=None):
       commit: the complete sha1 (40 chars) of the commit. Note that specifying
         this value will only work (100%) when commit == last_commit (with
         respect to the currently checked out revision), otherwise, we could miss
-        some lines.
+        some lines. To get the lines changed by any commit, use commit_changes.
 
     Returns: a list of lines that were modified, or None in case all lines are
       new.
@@ -105,8 +105,7 @@ def modified_lines(filename, extra_data, commit=None):
     command.append(filename)
 
     # Split as bytes, as the output may have some non unicode characters.
-    diff_lines = subprocess.check_output(command).split(
-        os.linesep.encode('utf-8'))
+    diff_lines = utils.check_output(command).split(os.linesep.encode('utf-8'))
     diff_line_numbers = utils.filter_lines(
         diff_lines,
         br'@@ -\d+,\d+ \+(?P<start_line>\d+),(?P<lines>\d+) @@',
@@ -118,3 +117,137 @@ def modified_lines(filename, extra_data, commit=None):
         modified_line_numbers.extend(range(start_line, start_line + lines))
 
     return modified_line_numbers
+
+
+def files_changed_since(root, revision):
+    """Returns the files whose content differs from the one in revision.
+
+    Args:
+      root: the root of the repository, it has to be an absolute path.
+      revision: any revision understood by mercurial.
+
+    Returns: a list with the absolute paths of the changed files, including
+      the changes in the working copy.
+    """
+    assert os.path.isabs(root), "Root has to be absolute, got: %s" % root
+
+    filenames = utils.check_output([
+        'hg', 'status', '--no-status', '--print0', '--modified', '--added',
+        '--rev', revision
+    ]).decode('utf-8').split('\0')
+
+    return [os.path.join(root, filename) for filename in filenames if filename]
+
+
+def committed_content(root, filename):
+    """Returns the content of filename in the parent of the working copy.
+
+    Args:
+      root: the root of the repository, it has to be an absolute path.
+      filename: the absolute path of the file.
+
+    Returns: bytes|None: the content, or None if the file is not in the
+      parent revision.
+    """
+    assert os.path.isabs(root), "Root has to be absolute, got: %s" % root
+
+    try:
+        return utils.check_output(
+            ['hg', 'cat', '--rev', '.', filename], stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError:
+        return None
+
+
+def tracked_files(root, paths=None):
+    """Yields the tracked files, as they are listed by hg files.
+
+    The files are streamed, so they can be processed while mercurial is still
+    listing them, without holding the whole list in memory.
+
+    Args:
+      root: the root of the repository, it has to be an absolute path.
+      paths: list[string]|None: absolute paths of files or directories to
+        restrict the listing to. Defaults to the whole repository.
+
+    Yields: tuple(string, None): the absolute path of each tracked file
+      present in the working copy. Mercurial does not use git blob ids, so the
+      second element, the blob id, is always None.
+    """
+    assert os.path.isabs(root), "Root has to be absolute, got: %s" % root
+
+    command = ['hg', 'files', '-0', '--']
+    command.extend(os.path.relpath(path, root) for path in paths or [root])
+    # hg files exits with 1 when no file matches.
+    for filename in utils.output_fields(
+            command, ok_returncodes=(0, 1), cwd=root):
+        filename = os.path.join(root, filename.decode('utf-8'))
+        if os.path.isfile(filename):
+            yield filename, None
+
+
+def commits(root, revisions, walk=True):
+    """Returns the commits in revisions, oldest first, skipping merges.
+
+    Args:
+      root: the root of the repository, it has to be an absolute path.
+      revisions: string: a revision, or a range like A..B when walk is True,
+        meaning the ancestors of B that are not ancestors of A, as in git.
+      walk: bool: whether to list all the commits in the range, or just the
+        one given.
+
+    Returns: list[string]: the node ids of the commits.
+
+    Raises: subprocess.CalledProcessError if revisions is not valid.
+    """
+    assert os.path.isabs(root), "Root has to be absolute, got: %s" % root
+
+    if walk and '..' in revisions:
+        start, end = revisions.split('..', 1)
+        revset = 'sort(only(%s, %s) and not merge())' % (end or '.', start)
+    else:
+        revset = revisions
+    return utils.check_output(
+        ['hg', 'log', '--rev', revset, '--template', '{node}\n'],
+        stderr=subprocess.STDOUT).decode('utf-8').split()
+
+
+def parent_revision(commit):
+    """Returns the name of the first parent of commit."""
+    return 'p1(%s)' % commit
+
+
+def commit_changes(root, commit):
+    """Returns the files added or modified by commit and their added lines.
+
+    Args:
+      root: the root of the repository, it has to be an absolute path.
+      commit: string: the node id of the commit.
+
+    Returns: list[(string, list[int]|None)]: the absolute path of each file
+      and the lines added to it, or None if the file is new.
+    """
+    assert os.path.isabs(root), "Root has to be absolute, got: %s" % root
+
+    diff = utils.check_output(
+        ['hg', 'diff', '--git', '-U', '0', '--change', commit], cwd=root)
+    return [(os.path.join(root, filename), lines)
+            for filename, lines in utils.diff_changes(diff)]
+
+
+class CommitReader(object):
+    """Reads the content of files in any commit with hg cat."""
+
+    def __init__(self, root):
+        assert os.path.isabs(root), "Root has to be absolute, got: %s" % root
+
+    def read(self, commit, filename):  # pylint: disable=no-self-use
+        """Returns the content of filename in commit, or None if missing."""
+        try:
+            return utils.check_output(
+                ['hg', 'cat', '--rev', commit, filename],
+                stderr=subprocess.STDOUT)
+        except subprocess.CalledProcessError:
+            return None
+
+    def close(self):
+        pass
@@ -0,0 +1,120 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Hooks to observe a lint run.
+
+Listeners are callables receiving the name of the event and a dictionary with
+its data. They can be registered from Python with register, or from the
+configuration file under the key 'hooks', mapping each event to a list of entry
+points of the form 'module:function':
+
+  hooks:
+    linter_end:
+      - mypackage.metrics:on_linter_end
+
+Note that linter_start, linter_end and file_done are emitted from the worker
+threads, so listeners must be thread safe. The exceptions raised by listeners
+are logged and do not interrupt the run.
+"""
+
+import collections
+import importlib
+import logging
+
+RUN_START = 'run_start'
+FILE_DISCOVERED = 'file_discovered'
+LINTER_START = 'linter_start'
+LINTER_END = 'linter_end'
+FILE_DONE = 'file_done'
+RUN_END = 'run_end'
+
+EVENTS = (RUN_START, FILE_DISCOVERED, LINTER_START, LINTER_END, FILE_DONE,
+          RUN_END)
+
+# Key in the configuration file holding the hooks.
+CONFIG_KEY = 'hooks'
+
+_LOGGER = logging.getLogger(__name__)
+
+_LISTENERS = collections.defaultdict(list)
+_CONFIG_LISTENERS = []
+
+
+def register(event, listener):
+    """Registers listener to be called every time event is emitted."""
+    if event not in EVENTS:
+        raise ValueError('Unknown event "%s". Valid events are: %s' %
+                         (event, ', '.join(EVENTS)))
+    _LISTENERS[event].append(listener)
+
+
+def unregister(event, listener):
+    """Unregisters a listener previously registered for event."""
+    _LISTENERS[event].remove(listener)
+    if not _LISTENERS[event]:
+        del _LISTENERS[event]
+
+
+def has_listeners(event):
+    """Returns whether someone is listening to event."""
+    return event in _LISTENERS
+
+
+def emit(event, **data):
+    """Calls all the listeners of event with the given data.
+
+    This is cheap when there are no listeners, so it can be called in hot
+    paths. A listener failing does not prevent calling the other ones.
+    """
+    listeners = _LISTENERS.get(event)
+    if listeners:
+        for listener in list(listeners):
+            try:
+                listener(event, data)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception('The listener %r of %s failed', listener,
+                                  event)
+
+
+def load_entry_point(entry_point):
+    """Returns the object referred by an entry point like 'module:function'."""
+    module_name, separator, attribute = entry_point.partition(':')
+    if not separator or not module_name or not attribute:
+        raise ValueError('Invalid entry point "%s", expected the format '
+                         '"module:function"' % entry_point)
+    value = importlib.import_module(module_name)
+    for name in attribute.split('.'):
+        value = getattr(value, name)
+    return value
+
+
+def register_from_config(hooks_config):
+    """Registers the listeners defined in the configuration file.
+
+    They stay registered until unregister_config is called.
+
+    Args:
+      hooks_config: dict[string: list[string]]: mapping from event to a list of
+        entry points.
+    """
+    for event, entry_points in hooks_config.items():
+        for entry_point in entry_points:
+            listener = load_entry_point(entry_point)
+            register(event, listener)
+            _CONFIG_LISTENERS.append((event, listener))
+
+
+def unregister_config():
+    """Unregisters all the listeners registered by register_from_config."""
+    while _CONFIG_LISTENERS:
+        unregister(*_CONFIG_LISTENERS.pop())
@@ -14,15 +14,129 @@
 """Functions for invoking a lint command."""
 
 import collections
+import contextlib
 import functools
+import hashlib
+import io
+import json
 import os
 import os.path
 import re
 import string
 import subprocess
-
+import time
+
+import gitlint.distributed as distributed
+import gitlint.engine as engine
+import gitlint.hooks as hooks
+import gitlint.parallelism as parallelism
+import gitlint.remote_cache as remote_cache
+import gitlint.timings as timings
 import gitlint.utils as utils
 
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+# Largest output of a linter, in characters, kept in memory to upload it to the
+# remote cache. Larger outputs are only saved in the local caches.
+MAX_RETAINED_OUTPUT = 4 * 1024 * 1024
+
+# Fields of a comment, in the order of the groups of the filter of a linter.
+COMMENT_FIELDS = ('line', 'column', 'message', 'severity', 'message_id')
+
+
+class Comment(Mapping):
+    """A problem found by a linter.
+
+    It keeps the fields in COMMENT_FIELDS as attributes, taking a fraction of
+    the memory of a dict, as there may be millions of them with --force. The
+    hot paths, like format, use the attributes, while the read-only mapping
+    view, with just the fields given by the linter as keys, is kept for the
+    JSON output and the custom linters. Other fields, which custom linters may
+    give, are kept in extra, only shown in the mapping view. Comments are
+    ordered by line and then by column, the comments without them coming
+    first.
+    """
+
+    __slots__ = COMMENT_FIELDS + ('extra', )
+
+    # pylint: disable=too-many-arguments
+    def __init__(self,
+                 line=None,
+                 column=None,
+                 message=None,
+                 severity=None,
+                 message_id=None,
+                 **extra):
+        self.line = line
+        self.column = column
+        self.message = message
+        self.severity = severity
+        self.message_id = message_id
+        self.extra = extra or None
+
+    def __getitem__(self, key):
+        if key in COMMENT_FIELDS:
+            value = getattr(self, key)
+        else:
+            value = self.extra.get(key) if self.extra else None
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        for field in COMMENT_FIELDS:
+            if getattr(self, field) is not None:
+                yield field
+        if self.extra:
+            for key, value in self.extra.items():
+                if value is not None:
+                    yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __lt__(self, other):
+        return self.sort_key() < other.sort_key()
+
+    def sort_key(self):
+        return (-1 if self.line is None else self.line, -1
+                if self.column is None else self.column)
+
+    def format(self):
+        """Returns the comment formatted like gitlint.format_comment."""
+        text = ''
+        if self.line is not None:
+            text = 'line %s' % (self.line, )
+            if self.column is not None:
+                text += ', col %s' % (self.column, )
+            text += ': '
+        elif self.column is not None:
+            text = 'col %s: ' % (self.column, )
+        if self.severity is not None:
+            text += '%s: ' % (self.severity, )
+        if self.message_id is not None:
+            text += '[%s]: ' % (self.message_id, )
+        if self.message is not None:
+            text += self.message
+        return text
+
+    def __repr__(self):
+        # This method should never be executed, only in failing tests.
+        return 'Comment(%r)' % dict(self)  # pragma: no cover
+
+
+_INTERNED = {}
+
+
+def _intern(value):
+    """Returns a single copy of the strings repeated across comments."""
+    if value is None:
+        return None
+    return _INTERNED.setdefault(value, value)
+
 
 class Partial(functools.partial):
     """Wrapper around functools partial to support equality comparisons."""
@@ -39,7 +153,7 @@ class Partial(functools.partial):
 
 
 def missing_requirements_command(missing_programs, installation_string,
-                                 filename, unused_lines):
+                                 filename, unused_lines, **unused_kwargs):
     """Pseudo-command to be used when requirements are missing."""
     verb = 'is'
     if len(missing_programs) > 1:
@@ -55,13 +169,39 @@ def missing_requirements_command(missing_programs, installation_string,
 
 
 # TODO(skreft): add test case for result already in cache.
-def lint_command(name, program, arguments, filter_regex, filename, lines):
+def lint_command(name,
+                 program,
+                 arguments,
+                 filter_regex,
+                 filename,
+                 lines,
+                 fingerprint=None,
+                 content=None,
+                 stdin_arguments=None,
+                 stdin_display_name=None,
+                 file_hash=None,
+                 max_processes=None,
+                 jobs=1,
+                 repository_root=None):
     """Executes a lint program and filter the output.
 
     Executes the lint tool 'program' with arguments 'arguments' over the file
     'filename' returning only those lines matching the regular expression
     'filter_regex'.
 
+    If a fingerprint is given, the output is looked up in the cache keyed by
+    content and then in the remote cache, so it is shared by all the branches,
+    worktrees and clones with the same file. The key is made of the git blob id
+    of the content, which is computed unless given as file_hash, and of the
+    path relative to repository_root, see utils.content_key. Otherwise the
+    cache keyed by path is used. On a miss the linter runs in the distributed
+    workers if they are enabled, or locally otherwise. The output of local runs
+    is filtered and saved as it is read, so it is never held in memory whole.
+
+    If content is given, it is linted instead of the content of filename. The
+    content is passed through stdin if the linter supports it, that is if
+    stdin_arguments is given, or through a scratch file otherwise.
+
     Args:
       name: string: the name of the linter.
       program: string: lint program.
@@ -70,55 +210,507 @@ def lint_command(name, program, arguments, filter_regex, filename, lines):
       filename: string: filename to lint.
       lines: list[int]|None: list of lines that we want to capture. If None,
         then all lines will be captured.
+      fingerprint: string|None: portable id of the linter configuration, see
+        _fingerprint.
+      content: bytes|None: the content to lint, if not the one in filename.
+      stdin_arguments: list[string]|None: arguments replacing the filename to
+        read the content from stdin. '{FILENAME}' is replaced by filename.
+      stdin_display_name: string|None: name used by the linter for the content
+        read from stdin, like 'stdin'. It is replaced by filename in the
+        output.
+      file_hash: string|None: the git blob id of the content of filename, if
+        already known, like for the files unmodified since the index.
+      max_processes: int|None: the maximum number of processes of this linter
+        running at once, for linters using lots of memory.
+      jobs: int: the number of job slots taken by each process of this linter,
+        for linters running their own workers, like pylint -j.
+      repository_root: string|None: the root of the repository, to which the
+        paths in the keys of the cache are relative.
 
     Returns: dict: a dict with the extracted info from the message.
     """
-    output = utils.get_output_from_cache(name, filename)
-
-    if output is None:
-        call_arguments = [program] + arguments + [filename]
-        try:
-            output = subprocess.check_output(
-                call_arguments, stderr=subprocess.STDOUT)
-        except subprocess.CalledProcessError as error:
-            output = error.output
-        except OSError:
-            return {
-                filename: {
-                    'error': [('Could not execute "%s".%sMake sure all ' +
-                               'required programs are installed') %
-                              (' '.join(call_arguments), os.linesep)]
+    hooks.emit(hooks.LINTER_START, linter=name, filename=filename)
+    start = time.time()
+    with timings.span(name, timings.LINTER, filename=filename):
+        if content is not None:
+            file_hash = utils.blob_hash(content)
+        elif fingerprint is not None and file_hash is None:
+            with timings.span(
+                    'content_hash', timings.CACHE, filename=filename):
+                file_hash = utils.content_hash(filename)
+        path = _relative_path(filename, repository_root)
+        key = None
+        if fingerprint is not None:
+            key = utils.content_key(path, file_hash)
+        output = _get_output_from_cache(name, filename, fingerprint, key)
+        if output is None and fingerprint is not None:
+            with timings.span(
+                    'get_output_from_remote_cache',
+                    timings.CACHE,
+                    linter=name,
+                    filename=filename):
+                output = remote_cache.get_output(fingerprint, filename, key)
+            if output is not None:
+                utils.save_output_in_content_cache(fingerprint, filename,
+                                                   output, key)
+        cache_hit = output is not None
+
+        def parse(output_lines):
+            return _parse_comments(output_lines, filter_regex, filename, lines)
+
+        result = None
+        if output is None:
+            with utils.single_flight(
+                    _single_flight_key(name, filename, fingerprint,
+                                       key)) as waited:
+                # Another run may have linted the same content meanwhile.
+                if waited:
+                    output = _get_output_from_cache(name, filename,
+                                                    fingerprint, key)
+                    cache_hit = output is not None
+                if output is None and fingerprint is not None:
+                    output = _run_in_workers(name, filename, path, fingerprint,
+                                             content, key)
+                if output is None:
+                    result = _run_linter(name, program, arguments, filename,
+                                         fingerprint, content, key,
+                                         stdin_arguments, stdin_display_name,
+                                         parse, max_processes, jobs)
+            if output is None and result is None:
+                result = {
+                    filename: {
+                        'error':
+                        [('Could not execute "%s".%sMake sure all ' +
+                          'required programs are installed') %
+                         (' '.join([program] + arguments + [filename]),
+                          os.linesep)]
+                    }
                 }
-            }
-        output = output.decode('utf-8')
-        utils.save_output_in_cache(name, filename, output)
+                hooks.emit(
+                    hooks.LINTER_END,
+                    linter=name,
+                    filename=filename,
+                    duration=time.time() - start,
+                    cache_hit=cache_hit,
+                    result=result[filename])
+                return result
+
+        if result is None:
+            result = parse(output.split(os.linesep))
+
+    hooks.emit(
+        hooks.LINTER_END,
+        linter=name,
+        filename=filename,
+        duration=time.time() - start,
+        cache_hit=cache_hit,
+        result={'comments': result})
+    return {filename: {'comments': result}}
+
 
-    output_lines = output.split(os.linesep)
+def _parse_comments(output_lines, filter_regex, filename, lines):
+    """Extracts the comments from the lines of the output of a linter.
 
+    Args:
+      output_lines: iterable[string]: the lines of the output, which are
+        consumed one at a time.
+      filter_regex: string: regular expression to filter lines.
+      filename: string: the linted filename.
+      lines: list[int]|None: list of lines that we want to capture. If None,
+        then all lines will be captured.
+
+    Returns: list[Comment]: the comments.
+    """
     if lines is None:
         lines_regex = r'\d+'
     else:
         lines_regex = '|'.join(map(str, lines))
     lines_regex = '(%s)' % lines_regex
 
-    groups = ('line', 'column', 'message', 'severity', 'message_id')
     filtered_lines = utils.filter_lines(
         output_lines,
         filter_regex.format(lines=lines_regex, filename=re.escape(filename)),
-        groups=groups)
+        groups=COMMENT_FIELDS)
+
+    comments = []
+    for line, column, message, severity, message_id in filtered_lines:
+        comments.append(
+            Comment(
+                line=None if line is None else int(line),
+                column=None if column is None else int(column),
+                message=message,
+                severity=None
+                if severity is None else _intern(severity.title()),
+                message_id=_intern(message_id)))
+    return comments
+
+
+def _get_output_from_cache(name, filename, fingerprint, key):
+    """Returns the output from the local cache, or None if not there.
+
+    Linters with a fingerprint use the cache keyed by content, the rest the
+    cache keyed by path.
+    """
+    with timings.span(
+            'get_output_from_cache', timings.CACHE, linter=name,
+            filename=filename):
+        if fingerprint is None:
+            return utils.get_output_from_cache(name, filename)
+        return utils.get_output_from_content_cache(fingerprint, filename, key)
 
-    result = []
-    for data in filtered_lines:
-        comment = dict(p for p in zip(groups, data) if p[1] is not None)
-        if 'line' in comment:
-            comment['line'] = int(comment['line'])
-        if 'column' in comment:
-            comment['column'] = int(comment['column'])
-        if 'severity' in comment:
-            comment['severity'] = comment['severity'].title()
-        result.append(comment)
 
-    return {filename: {'comments': result}}
+def _relative_path(filename, repository_root):
+    """Returns the path of filename used in the keys of the cache."""
+    if repository_root is None:
+        return filename
+    return os.path.relpath(filename, repository_root)
+
+
+def _single_flight_key(name, filename, fingerprint, key):
+    """Returns the key identifying the run of a linter over filename.
+
+    With a fingerprint the key is the one of the cache keyed by content, so runs
+    over the same file in different clones wait for each other.
+    """
+    if fingerprint is None:
+        return '%s:%s' % (name, os.path.abspath(filename))
+    return '%s:%s' % (fingerprint, key)
+
+
+def _execute(name,
+             program,
+             arguments,
+             filename,
+             consume,
+             stdin=None,
+             max_processes=None,
+             jobs=1):
+    """Runs the linter in the engine, passing its output to consume.
+
+    The lines are read as the linter writes them, so the output is never held
+    in memory as a whole.
+
+    Args:
+      name: string: the name of the linter.
+      program: string: lint program.
+      arguments: list[string]: the arguments for the program.
+      filename: string: the file being linted.
+      consume: callable(iterator[string]): processes the lines of the output,
+        with their line endings. It has to consume all of them.
+      stdin: bytes|None: the content to pass through stdin.
+      max_processes: int|None: the maximum number of processes of this linter
+        running at once.
+      jobs: int: the number of job slots taken while the linter runs.
+
+    Returns: the value returned by consume, or None if the program could not be
+      executed.
+    """
+    call_arguments = [program] + arguments
+    limit = None if max_processes is None else (name, max_processes)
+    with parallelism.slots(jobs), timings.span(
+            program, timings.SUBPROCESS, linter=name, filename=filename):
+        try:
+            process = engine.popen(
+                call_arguments,
+                content=stdin,
+                limit=limit,
+                stderr=subprocess.STDOUT)
+        except OSError:
+            return None
+
+        def output_lines():
+            for line in iter(process.stdout.readline, b''):
+                yield line.decode('utf-8')
+            # The output of a killed linter is incomplete, so it must not be
+            # parsed nor cached.
+            if engine.is_cancelled():
+                raise engine.Cancelled()
+
+        try:
+            return consume(output_lines())
+        except BaseException:
+            process.kill()
+            raise
+        finally:
+            process.stdout.close()
+            process.wait()
+
+
+class _BoundedBuffer(object):
+    """Keeps the chunks written to it, unless they exceed max_size."""
+
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._size = 0
+        self._chunks = []
+
+    def write(self, chunk):
+        if self._chunks is None:
+            return
+        self._size += len(chunk)
+        if self._size > self._max_size:
+            self._chunks = None
+        else:
+            self._chunks.append(chunk)
+
+    def getvalue(self):
+        """Returns the chunks joined, or None if they exceeded max_size."""
+        if self._chunks is None:
+            return None
+        return ''.join(self._chunks)
+
+
+@contextlib.contextmanager
+def _output_writer(name, filename, fingerprint, content, key):
+    """Saves the output of a linter in the caches as it is produced.
+
+    The local caches are written atomically when the block exits without
+    errors. The remote cache only gets the output if it is not longer than
+    MAX_RETAINED_OUTPUT, so the memory used does not depend on its size.
+
+    Yields: callable(string): function writing the next line of the output.
+    """
+    if fingerprint is None:
+        if content is None:
+            with utils.cache_writer(name, filename) as write:
+                yield write
+        else:
+            yield lambda unused_output: None
+        return
+
+    with utils.content_cache_writer(fingerprint, filename, key) as write_entry:
+        if not remote_cache.is_enabled():
+            yield write_entry
+            return
+
+        retained = _BoundedBuffer(MAX_RETAINED_OUTPUT)
+
+        def write(output):
+            write_entry(output)
+            retained.write(output)
+
+        yield write
+    output = retained.getvalue()
+    if output is not None:
+        remote_cache.save_output(fingerprint, filename, output, key)
+
+
+def _run_linter(name,
+                program,
+                arguments,
+                filename,
+                fingerprint,
+                content,
+                key,
+                stdin_arguments,
+                stdin_display_name,
+                consume,
+                max_processes=None,
+                jobs=1):
+    """Runs the linter over filename, streaming its output into the caches.
+
+    The lines of the output are passed to consume as they are read, while they
+    are written to the caches, which are only updated if consume succeeds.
+
+    If content is given, the linter reads it from stdin or from a scratch file,
+    whose name is replaced by filename in the output.
+
+    Args:
+      consume: callable(iterator[string]): processes the lines of the output,
+        without their line endings. It has to consume all of them.
+      max_processes: int|None: the maximum number of processes of this linter
+        running at once.
+      jobs: int: the number of job slots taken by each process of the linter.
+
+    Returns: the value returned by consume, or None if the program could not be
+      executed.
+    """
+    execute = functools.partial(
+        _execute, max_processes=max_processes, jobs=jobs)
+
+    def save_and_consume(output_lines, rewrite=None):
+        with _output_writer(name, filename, fingerprint, content,
+                            key) as write:
+
+            def tee():
+                for line in output_lines:
+                    if rewrite is not None:
+                        line = rewrite(line)
+                    write(line)
+                    yield line.rstrip('\r\n')
+
+            return consume(tee())
+
+    if content is None:
+        return execute(name, program, arguments + [filename], filename,
+                       save_and_consume)
+    if stdin_arguments is not None:
+        rewrite = None
+        if stdin_display_name:
+
+            def rewrite(line):
+                if line.startswith(stdin_display_name):
+                    return filename + line[len(stdin_display_name):]
+                return line
+
+        return execute(
+            name,
+            program,
+            arguments + [
+                argument.replace('{FILENAME}', filename)
+                for argument in stdin_arguments
+            ],
+            filename,
+            functools.partial(save_and_consume, rewrite=rewrite),
+            stdin=content)
+    with utils.scratch_file(filename, content) as scratch_filename:
+        return execute(
+            name, program, arguments + [scratch_filename], filename,
+            functools.partial(
+                save_and_consume,
+                rewrite=lambda line: line.replace(scratch_filename, filename)))
+
+
+def _run_in_workers(name, filename, path, fingerprint, content, key):
+    """Runs the linter in the distributed workers, saving its output.
+
+    Args:
+      path: string: the path of filename relative to the repository root,
+        which the workers use in the keys of their caches.
+
+    Returns: string|None: the output of the linter, or None if the workers are
+      disabled or could not run it.
+    """
+    if not distributed.is_enabled():
+        return None
+    with timings.span(
+            'run_in_workers', timings.WORKER, linter=name, filename=filename):
+        if content is None:
+            with io.open(filename, 'rb') as f:
+                output = distributed.run(fingerprint, filename, f.read(), path)
+        else:
+            output = distributed.run(fingerprint, filename, content, path)
+    if output is not None:
+        _save_output(name, filename, fingerprint, content, key, output)
+    return output
+
+
+def _save_output(name, filename, fingerprint, content, key, output):
+    """Saves the output of a linter in the caches."""
+    with timings.span(
+            'save_output_in_cache', timings.CACHE, linter=name,
+            filename=filename):
+        if fingerprint is None:
+            if content is None:
+                utils.save_output_in_cache(name, filename, output)
+        else:
+            utils.save_output_in_content_cache(fingerprint, filename, output,
+                                               key)
+            remote_cache.save_output(fingerprint, filename, output, key)
+
+
+def commands_by_fingerprint(config):
+    """Returns the lint commands of config keyed by their fingerprint.
+
+    Args:
+      config: dict: the output of parse_yaml_config.
+
+    Returns: dict[string: Partial]: the commands of the installed linters.
+    """
+    commands = {}
+    for linter_commands in config.values():
+        for command in linter_commands:
+            fingerprint = command.keywords.get('fingerprint')
+            if command.func is lint_command and fingerprint:
+                commands[fingerprint] = command
+    return commands
+
+
+def linter_names(filename, config):
+    """Returns the names of the installed linters of filename in config."""
+    _, ext = os.path.splitext(filename)
+    return [
+        command.args[0] for command in config.get(ext, ())
+        if command.func is lint_command
+    ]
+
+
+def run_job(commands, fingerprint, path, content):
+    """Runs a job sent to a distributed worker.
+
+    Args:
+      commands: dict[string: Partial]: the output of commands_by_fingerprint.
+      fingerprint: string: the fingerprint of the linter to run.
+      path: string: the path of the file relative to the root of the
+        repository, already validated by the worker. The file does not need to
+        exist locally.
+      content: bytes: the content to lint.
+
+    Returns: string|None: the unfiltered output of the linter, with the
+      filename replaced by utils.FILENAME_PLACEHOLDER, or None if the program
+      could not be executed. Unlike in lint_command, the whole output is held
+      in memory, as it is sent back to the coordinator.
+
+    Raises: KeyError if there is no linter with the given fingerprint.
+    """
+    command = commands[fingerprint]
+    name, program, arguments = command.args[:3]
+    filename = os.path.join(
+        command.keywords.get('repository_root') or os.getcwd(), path)
+    key = utils.content_key(path, utils.blob_hash(content))
+    output = utils.get_output_from_content_cache(fingerprint, filename, key)
+    if output is None:
+        output = _run_linter(
+            name, program, arguments, filename, fingerprint, content, key,
+            command.keywords.get('stdin_arguments'),
+            command.keywords.get('stdin_display_name'), os.linesep.join,
+            command.keywords.get('max_processes'),
+            command.keywords.get('jobs', 1))
+    if output is None:
+        return None
+    return output.replace(filename, utils.FILENAME_PLACEHOLDER)
+
+
+def _comment_key(comment, content_lines):
+    """Returns what identifies a comment regardless of its line number.
+
+    Instead of the line number, it uses the text of the line, so the same
+    problem is recognized after the lines around it were added or removed.
+    """
+    line = comment.get('line')
+    text = ''
+    if line is not None and 0 < line <= len(content_lines):
+        text = content_lines[line - 1].decode('utf-8', 'replace').strip()
+    return (comment.get('severity'), comment.get('message_id'),
+            comment.get('message'), text)
+
+
+def new_comments(base_comments, base_content, comments, content):
+    """Returns the comments that are not in the base version of a file.
+
+    Comments are matched by their message and the text of their line, so each
+    comment of the base version cancels at most one identical comment.
+
+    Args:
+      base_comments: list[dict]: the comments of the base version.
+      base_content: bytes: the content of the base version.
+      comments: list[dict]: the comments of the current version.
+      content: bytes: the content of the current version.
+
+    Returns: list[dict]: the comments only in the current version, in order.
+    """
+    base_lines = base_content.splitlines()
+    remaining = collections.Counter(
+        _comment_key(comment, base_lines) for comment in base_comments)
+    lines = content.splitlines()
+    result = []
+    for comment in comments:
+        key = _comment_key(comment, lines)
+        if remaining[key] > 0:
+            remaining[key] -= 1
+        else:
+            result.append(comment)
+    return result
 
 
 def _replace_variables(data, variables):
@@ -127,6 +719,120 @@ def _replace_variables(data, variables):
     return [formatter.vformat(item, [], variables) for item in data]
 
 
+def get_versions_filename():
+    """Returns the file where the versions of the linters are kept."""
+    return os.path.join(os.path.expanduser('~'), '.git-lint', 'versions.json')
+
+
+def _load_versions():
+    try:
+        with io.open(get_versions_filename(), encoding='utf-8') as f:
+            versions = json.loads(f.read())
+        return versions if isinstance(versions, dict) else {}
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def _program_version(version_command, versions):
+    """Returns the output of the command asking a program for its version.
+
+    The output is kept in versions, keyed by the location, modification time
+    and size of the program, so it is only run again once the program changes,
+    like when it is upgraded.
+
+    Args:
+      version_command: list[string]: the program and the arguments making it
+        print its version, like ['pylint', '--version'].
+      versions: dict: the versions already known, updated in place.
+
+    Returns: string|None: the output, or None if the program was not found.
+    """
+    command, arguments = version_command[0], list(version_command[1:])
+    paths = utils.which(command)
+    if not paths:
+        return None
+    try:
+        path = os.path.realpath(paths[0])
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = json.dumps([path, repr(stat.st_mtime), stat.st_size, arguments])
+    if key not in versions:
+        try:
+            process = engine.popen(
+                [command] + arguments, content=b'', stderr=subprocess.STDOUT)
+        except OSError:
+            return None
+        try:
+            output = process.stdout.read()
+        finally:
+            process.wait()
+        versions[key] = output.decode('utf-8', 'replace')
+    return versions[key]
+
+
+def _config_files(arguments, config_files):
+    """Returns the files configuring a linter.
+
+    Those are the given config_files, like {REPO_HOME}/setup.cfg, plus the
+    existing files in the arguments, like --rcfile=FILE.
+    """
+    filenames = list(config_files)
+    for argument in arguments:
+        for candidate in (argument, argument.partition('=')[2]):
+            if candidate and os.path.isfile(candidate):
+                filenames.append(candidate)
+    return filenames
+
+
+def _file_hash(filename):
+    """Returns the hash of the content of filename, or None if missing."""
+    try:
+        with open(filename, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+# pylint: disable=too-many-arguments
+def _fingerprint(name,
+                 command,
+                 arguments,
+                 filter_regex,
+                 variables,
+                 version=None,
+                 config_files=()):
+    """Returns a portable id of the configuration of a linter.
+
+    The values of the variables are replaced back by their names, so the id
+    does not depend on where the repository or git-lint are located. The id
+    changes with the version of the linter and with the content of its
+    configuration files, so the cached outputs are not reused after those
+    change.
+
+    Args:
+      version: string|None: the output of the linter asked for its version.
+      config_files: list[string]: the files configuring the linter. Missing
+        files are part of the id too, as creating them changes the id.
+    """
+
+    def portable(value):
+        for variable, variable_value in sorted(
+                variables.items(), key=lambda item: -len(item[1] or '')):
+            if variable_value:
+                value = value.replace(variable_value, '{%s}' % variable)
+        return value
+
+    data = json.dumps([
+        name,
+        portable(command), [portable(argument) for argument in arguments],
+        filter_regex, None if version is None else portable(version),
+        sorted((portable(filename), _file_hash(filename))
+               for filename in set(config_files))
+    ])
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
 # TODO(skreft): validate data['filter'], ie check that only has valid fields.
 def parse_yaml_config(yaml_config, repo_home):
     """Converts a dictionary (parsed Yaml) to the internal representation."""
@@ -136,6 +842,8 @@ def parse_yaml_config(yaml_config, repo_home):
         'DEFAULT_CONFIGS': os.path.join(os.path.dirname(__file__), 'configs'),
         'REPO_HOME': repo_home,
     }
+    versions = _load_versions()
+    known_versions = len(versions)
 
     for name, data in yaml_config.items():
         command = _replace_variables([data['command']], variables)[0]
@@ -149,41 +857,118 @@ def parse_yaml_config(yaml_config, repo_home):
             linter_command = Partial(missing_requirements_command,
                                      not_found_programs, data['installation'])
         else:
-            linter_command = Partial(lint_command, name, command, arguments,
-                                     data['filter'])
+            options = {}
+            if 'stdin_arguments' in data:
+                # FILENAME is only known when running the linter.
+                options['stdin_arguments'] = _replace_variables(
+                    data['stdin_arguments'],
+                    dict(variables, FILENAME='{FILENAME}'))
+                options['stdin_display_name'] = data.get('stdin_display_name')
+            if 'max_processes' in data:
+                options['max_processes'] = int(data['max_processes'])
+            if 'jobs' in data:
+                options['jobs'] = int(data['jobs'])
+            version = None
+            if data.get('version_command'):
+                version = _program_version(
+                    _replace_variables(data['version_command'], variables),
+                    versions)
+            config_files = _config_files(
+                arguments,
+                _replace_variables(data.get('config_files', []), variables))
+            linter_command = Partial(
+                lint_command,
+                name,
+                command,
+                arguments,
+                data['filter'],
+                fingerprint=_fingerprint(name, command, arguments,
+                                         data['filter'], variables, version,
+                                         config_files),
+                repository_root=repo_home,
+                **options)
         for extension in data['extensions']:
             config[extension].append(linter_command)
 
+    if len(versions) != known_versions:
+        try:
+            utils.write_atomically(get_versions_filename(),
+                                   json.dumps(versions, sort_keys=True))
+        except (IOError, OSError):
+            pass
+
     return config
 
 
-def lint(filename, lines, config):
+def _as_comments(comments):
+    """Converts the comments given as dicts, like by custom linters."""
+    return [
+        Comment(**comment) if isinstance(comment, dict) else comment
+        for comment in comments
+    ]
+
+
+def _merge_comments(comments):
+    """Merges the sorted comments of several linters, keeping their order.
+
+    The outputs of most linters are already sorted, and sorted finds these runs
+    and merges them, taking a few comparisons per comment instead of sorting
+    them all again, faster than heapq.merge would. As sorted is stable, the
+    comments on the same line and column are kept in the order of the linters.
+
+    Args:
+      comments: list[Comment]: the comments of all the linters, one after the
+        other.
+    """
+    return sorted(comments, key=Comment.sort_key)
+
+
+def lint(filename, lines, config, content=None, file_hash=None):
     """Lints a file.
 
+    The linters of the file run at once, see parallelism.run_all, and their
+    outputs are merged in the order of the configuration.
+
     Args:
         filename: string: filename to lint.
         lines: list[int]|None: list of lines that we want to capture. If None,
           then all lines will be captured.
         config: dict[string: linter]: mapping from extension to a linter
           function.
+        content: bytes|None: the content to lint, if not the one in filename,
+          like the content staged in the index.
+        file_hash: string|None: the git blob id of the content of filename, if
+          already known.
 
     Returns: dict: if there were errors running the command then the field
       'error' will have the reasons in a list. if the lint process was skipped,
       then a field 'skipped' will be set with the reasons. Otherwise, the field
-      'comments' will have the messages.
+      'comments' will have the messages, as a list of Comment sorted by line.
     """
     _, ext = os.path.splitext(filename)
     if ext in config:
         output = collections.defaultdict(list)
-        for linter in config[ext]:
-            linter_output = linter(filename, lines)
+        options = {}
+        if content is not None:
+            options['content'] = content
+        elif file_hash is not None:
+            options['file_hash'] = file_hash
+        linter_outputs = parallelism.run_all([
+            functools.partial(linter, filename, lines, **options)
+            for linter in config[ext]
+        ])
+        comments = None
+        for linter_output in linter_outputs:
             for category, values in linter_output[filename].items():
-                output[category].extend(values)
-
-        if 'comments' in output:
-            output['comments'] = sorted(
-                output['comments'],
-                key=lambda x: (x.get('line', -1), x.get('column', -1)))
+                if category == 'comments':
+                    if comments is None:
+                        comments = []
+                    comments.extend(_as_comments(values))
+                else:
+                    output[category].extend(values)
+
+        if comments is not None:
+            output['comments'] = _merge_comments(comments)
 
         return {filename: dict(output)}
     else:
@@ -0,0 +1,157 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Functions to export the timings of a run as metrics.
+
+The metrics are written in the text exposition format understood by the
+textfile collector of the Prometheus node exporter.
+"""
+
+import collections
+import time
+
+import gitlint.timings as timings
+import gitlint.utils as utils
+
+# Upper bounds, in seconds, of the buckets of the latency histograms.
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape_label(value):
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape_label(str(value)))
+                             for name, value in labels)
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _metric(name, metric_type, help_text, samples):
+    """Formats a metric family.
+
+    Args:
+      name: string: name of the metric family.
+      metric_type: string: counter, gauge or histogram.
+      help_text: string: description of the metric.
+      samples: list[(string, list[(string, string)], number)]: the samples as
+        tuples of (suffix, labels, value).
+
+    Returns: list[string]: the formatted lines.
+    """
+    lines = [
+        '# HELP %s %s' % (name, help_text),
+        '# TYPE %s %s' % (name, metric_type),
+    ]
+    for suffix, labels, value in samples:
+        lines.append('%s%s%s %s' % (name, suffix, _format_labels(labels),
+                                    _format_value(value)))
+    return lines
+
+
+def _histogram_samples(labels, values):
+    samples = []
+    for bucket in LATENCY_BUCKETS:
+        samples.append(('_bucket', labels + [('le', bucket)],
+                        sum(1 for value in values if value <= bucket)))
+    samples.append(('_bucket', labels + [('le', '+Inf')], len(values)))
+    samples.append(('_sum', labels, float(sum(values))))
+    samples.append(('_count', labels, len(values)))
+    return samples
+
+
+def format_metrics(recorder, timestamp=None):
+    """Converts the recorded data into metrics.
+
+    Args:
+      recorder: timings.Recorder: the recorded data.
+      timestamp: float: time of the run, defaults to now.
+
+    Returns: string: the metrics in the text exposition format.
+    """
+    linter_latencies = collections.defaultdict(list)
+    subprocesses = collections.Counter()
+    files_linted = 0
+    for span in recorder.spans:
+        if span.category == timings.LINTER:
+            linter_latencies[span.name].append(span.wall)
+        elif span.category == timings.SUBPROCESS:
+            subprocesses[span.name] += 1
+        elif span.category == timings.FILE:
+            files_linted += 1
+
+    lines = []
+    lines.extend(
+        _metric('gitlint_files_linted_total', 'counter', 'Files linted.',
+                [('', [], files_linted)]))
+    lines.extend(
+        _metric('gitlint_linter_invocations_total', 'counter',
+                'Linter invocations, including cache hits.',
+                [('', [('linter', linter)], len(latencies))
+                 for linter, latencies in sorted(linter_latencies.items())]))
+    histogram_samples = []
+    for linter, latencies in sorted(linter_latencies.items()):
+        histogram_samples.extend(
+            _histogram_samples([('linter', linter)], latencies))
+    lines.extend(
+        _metric('gitlint_linter_duration_seconds', 'histogram',
+                'Duration of the linter invocations.', histogram_samples))
+    lines.extend(
+        _metric('gitlint_cache_hits_total', 'counter', 'Cache hits.',
+                [('', [], recorder.counters['cache_hits'])]))
+    lines.extend(
+        _metric('gitlint_cache_misses_total', 'counter', 'Cache misses.',
+                [('', [], recorder.counters['cache_misses'])]))
+    lines.extend(
+        _metric('gitlint_content_cache_hits_total', 'counter',
+                'Hits of the cache keyed by content.',
+                [('', [], recorder.counters['content_cache_hits'])]))
+    lines.extend(
+        _metric('gitlint_remote_cache_hits_total', 'counter',
+                'Hits of the remote cache.',
+                [('', [], recorder.counters['remote_cache_hits'])]))
+    lines.extend(
+        _metric('gitlint_remote_cache_errors_total', 'counter',
+                'Failed requests to the remote cache.',
+                [('', [], recorder.counters['remote_cache_errors'])]))
+    lines.extend(
+        _metric('gitlint_remote_cache_disabled_total', 'counter',
+                'Times the remote cache was disabled after repeated errors.',
+                [('', [], recorder.counters['remote_cache_disabled'])]))
+    lines.extend(
+        _metric('gitlint_subprocesses_total', 'counter',
+                'Subprocesses spawned, by command.',
+                [('', [('command', command)], count)
+                 for command, count in sorted(subprocesses.items())]))
+    lines.extend(
+        _metric('gitlint_last_run_timestamp_seconds', 'gauge',
+                'Time when the run finished.',
+                [('', [], float(timestamp or time.time()))]))
+
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics(recorder, filename):
+    """Atomically writes the metrics of the run to filename.
+
+    The metrics are first written to a temporary file in the same directory, so
+    the collector never reads a partially written file.
+    """
+    utils.write_atomically(filename, format_metrics(recorder))
@@ -0,0 +1,369 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Functions to decide how many linters run at once (--jobs).
+
+The default parallelism is the number of CPUs the process can actually use,
+as limited by its CPU affinity and the CPU quota of its cgroup, instead of the
+number of CPUs of the host.
+
+Each linter process takes job slots while it runs, one by default or as many
+as the jobs option of the linter, for linters starting their own workers like
+pylint -j. The slots come from a GNU make jobserver when git-lint is run from
+make -j, so the linters share the jobs of the build, and from a local pool
+otherwise.
+
+The linters of a file also run at once, so linting a file takes as long as its
+slowest linter instead of the sum of all of them, still within the slots.
+"""
+
+import contextlib
+import errno
+import math
+import multiprocessing
+import os
+import re
+import select
+import threading
+
+from concurrent import futures
+
+# Files with the CPU quota of the cgroup, relative to its directory, for cgroup
+# v2 and v1.
+CGROUP_ROOT = '/sys/fs/cgroup'
+CGROUP_V2_MAX = 'cpu.max'
+CGROUP_V1_DIRS = ('cpu', 'cpu,cpuacct', 'cpuacct,cpu')
+CGROUP_V1_QUOTA = 'cpu.cfs_quota_us'
+CGROUP_V1_PERIOD = 'cpu.cfs_period_us'
+
+# Seconds between the checks of the implicit slot while waiting for a token of
+# the jobserver.
+POLL_INTERVAL = 0.1
+
+_JOBSERVER_RE = re.compile(r'--jobserver-(?:auth|fds)=(\S+)')
+_JOBS_RE = re.compile(r'(?:^|\s)-j(\d+)(?:\s|$)')
+
+
+def _read(filename):
+    try:
+        with open(filename) as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def _cgroup_paths():
+    """Returns the paths of the cgroups of the process, by controller.
+
+    Returns: dict: the path of each controller in /proc/self/cgroup, with the
+      key '' for cgroup v2.
+    """
+    paths = {}
+    for line in (_read('/proc/self/cgroup') or '').splitlines():
+        parts = line.split(':', 2)
+        if len(parts) == 3:
+            for controller in parts[1].split(','):
+                paths[controller] = parts[2]
+    return paths
+
+
+def _quota_v2(directory):
+    """Returns the CPU quota in cpu.max, or None if unlimited or missing."""
+    value = _read(os.path.join(directory, CGROUP_V2_MAX))
+    if not value:
+        return None
+    parts = value.split()
+    if parts[0] == 'max' or len(parts) != 2:
+        return None
+    return float(parts[0]) / float(parts[1])
+
+
+def _quota_v1(directory):
+    """Returns the CPU quota in cpu.cfs_quota_us, or None if unlimited."""
+    quota = _read(os.path.join(directory, CGROUP_V1_QUOTA))
+    period = _read(os.path.join(directory, CGROUP_V1_PERIOD))
+    if not quota or not period or int(quota) <= 0:
+        return None
+    return float(quota) / float(period)
+
+
+def cgroup_cpu_quota():
+    """Returns the CPUs allowed by the cgroup CPU quota, or None if unlimited.
+
+    The cgroup of the process is looked up both as mounted in the host and at
+    the root of the cgroup filesystem, as seen in containers.
+
+    Returns: float|None: the quota, which may be fractional, like 1.5.
+    """
+    paths = _cgroup_paths()
+    try:
+        v2_path = paths.get('', '/').lstrip('/')
+        for directory in (os.path.join(CGROUP_ROOT, v2_path), CGROUP_ROOT):
+            quota = _quota_v2(directory)
+            if quota is not None:
+                return quota
+        v1_path = paths.get('cpu', '/').lstrip('/')
+        for name in CGROUP_V1_DIRS:
+            for directory in (os.path.join(CGROUP_ROOT, name, v1_path),
+                              os.path.join(CGROUP_ROOT, name)):
+                quota = _quota_v1(directory)
+                if quota is not None:
+                    return quota
+    except ValueError:
+        # Unexpected format.
+        pass
+    return None
+
+
+def available_cpus():
+    """Returns the number of CPUs the process can use, at least 1.
+
+    It is the number of CPUs in the affinity of the process, further limited
+    by the CPU quota of its cgroup, rounded up.
+    """
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # Not available in Python 2 nor outside Linux.
+        count = multiprocessing.cpu_count()
+    quota = cgroup_cpu_quota()
+    if quota is not None:
+        count = min(count, int(math.ceil(quota)))
+    return max(1, count)
+
+
+class _Pool(object):
+    """Local pool of slots, used when not running under a jobserver."""
+
+    def __init__(self, size):
+        self.size = size
+        self._free = size
+        self._condition = threading.Condition()
+
+    def acquire(self, count):
+        with self._condition:
+            while self._free < count:
+                self._condition.wait()
+            self._free -= count
+        return count
+
+    def release(self, tokens):
+        with self._condition:
+            self._free += tokens
+            self._condition.notify_all()
+
+
+class Jobserver(object):
+    """Client of a GNU make jobserver.
+
+    Like every make job, git-lint has an implicit slot, so its first linter
+    runs without a token. Every other one reads a token from the jobserver and
+    writes it back once done.
+
+    Args:
+      read_fd: int: file descriptor to read the tokens from.
+      write_fd: int: file descriptor to write the tokens back to.
+      size: int|None: the number of jobs of make (-j), if known.
+    """
+
+    def __init__(self, read_fd, write_fd, size=None):
+        self.size = size
+        self._read_fd = read_fd
+        self._write_fd = write_fd
+        self._implicit = True
+        self._lock = threading.Lock()
+        # Only one thread reads tokens at a time, so several linters taking
+        # many slots do not deadlock holding some each.
+        self._read_lock = threading.Lock()
+
+    def _take_implicit(self):
+        with self._lock:
+            implicit, self._implicit = self._implicit, False
+            return implicit
+
+    def _read_token(self):
+        """Reads a token, returning None if none arrived in POLL_INTERVAL."""
+        try:
+            readable = select.select([self._read_fd], [], [], POLL_INTERVAL)[0]
+        except select.error as error:
+            if error.args[0] != errno.EINTR:
+                raise
+            return None
+        if not readable:
+            return None
+        try:
+            token = os.read(self._read_fd, 1)
+        except OSError as error:
+            # Another process took the token first.
+            if error.errno not in (errno.EAGAIN, errno.EINTR):
+                raise
+            return None
+        if not token:
+            raise OSError(errno.EPIPE, 'The jobserver was closed')
+        return token
+
+    def acquire(self, count):
+        tokens = []
+        with self._read_lock:
+            try:
+                while len(tokens) < count:
+                    # The implicit slot may be released while waiting for a
+                    # token, hence the polling.
+                    if None not in tokens and self._take_implicit():
+                        tokens.append(None)
+                        continue
+                    token = self._read_token()
+                    if token is not None:
+                        tokens.append(token)
+            except BaseException:
+                self.release(tokens)
+                raise
+        return tokens
+
+    def release(self, tokens):
+        for token in tokens:
+            if token is None:
+                with self._lock:
+                    self._implicit = True
+            else:
+                os.write(self._write_fd, token)
+
+    def close(self):
+        if self._read_fd != self._write_fd:
+            os.close(self._write_fd)
+        os.close(self._read_fd)
+
+
+def jobserver_from_makeflags(makeflags):
+    """Connects to the jobserver described by MAKEFLAGS.
+
+    Both the file descriptors (--jobserver-auth=R,W or --jobserver-fds=R,W)
+    and the named pipes (--jobserver-auth=fifo:PATH) are supported.
+
+    Returns: Jobserver|None: the jobserver, or None if MAKEFLAGS does not
+      describe one.
+
+    Raises: ValueError if the jobserver is not accessible, like when the make
+      rule running git-lint is not marked as recursive with '+'.
+    """
+    matches = _JOBSERVER_RE.findall(makeflags or '')
+    if not matches:
+        return None
+    auth = matches[-1]
+    match = _JOBS_RE.search(makeflags)
+    size = int(match.group(1)) if match else None
+    try:
+        if auth.startswith('fifo:'):
+            # Unlike the inherited descriptors, the fifo is opened by git-lint
+            # alone, so it can be non blocking: a token taken by another
+            # process between the select and the read does not block the read
+            # holding the read lock.
+            fd = os.open(auth[len('fifo:'):], os.O_RDWR | os.O_NONBLOCK)
+            return Jobserver(fd, fd, size)
+        read_fd, write_fd = [int(fd) for fd in auth.split(',')]
+        if read_fd < 0:
+            # make -j1 passes -1,-1.
+            return None
+        # The descriptors have to be duplicated, as they may be closed by
+        # other code not expecting them to be in use.
+        return Jobserver(os.dup(read_fd), os.dup(write_fd), size)
+    except (OSError, ValueError) as error:
+        raise ValueError(
+            'Could not use the jobserver %s (%s), the make rule running '
+            'git-lint may need a "+"' % (auth, error))
+
+
+_POOL = None
+_EXECUTOR = None
+
+
+def start(size, makeflags=None):
+    """Starts handing out job slots, from the jobserver if there is one.
+
+    It also starts the threads running the linters of a file at once.
+
+    Args:
+      size: int: the number of slots of the local pool.
+      makeflags: string|None: the MAKEFLAGS environment variable.
+
+    Returns: the jobserver or the local pool.
+
+    Raises: ValueError if the jobserver in makeflags is not accessible.
+    """
+    global _POOL, _EXECUTOR  # pylint: disable=global-statement
+    pool = jobserver_from_makeflags(makeflags)
+    if pool is None:
+        pool = _Pool(size)
+    _POOL = pool
+    _EXECUTOR = futures.ThreadPoolExecutor(max_workers=size)
+    return pool
+
+
+def stop():
+    """Stops handing out job slots, returning the pool used until now."""
+    global _POOL, _EXECUTOR  # pylint: disable=global-statement
+    pool, _POOL = _POOL, None
+    executor, _EXECUTOR = _EXECUTOR, None
+    if executor is not None:
+        executor.shutdown()
+    if isinstance(pool, Jobserver):
+        pool.close()
+    return pool
+
+
+@contextlib.contextmanager
+def slots(count=1):
+    """Takes count job slots while running the enclosed code.
+
+    The count is capped to the size of the pool, or to 1 if it is not known,
+    so a linter never waits for more slots than exist. It is a no-op when the
+    slots are not handed out.
+    """
+    pool = _POOL
+    if pool is None:
+        yield
+        return
+    count = max(1, min(count, pool.size or 1))
+    tokens = pool.acquire(count)
+    try:
+        yield
+    finally:
+        pool.release(tokens)
+
+
+def run_all(functions):
+    """Calls all the functions at once, returning their results in order.
+
+    The first function runs in the calling thread and the others in the
+    threads started by start, as the caller would otherwise just wait for
+    them. They are called one after another when the threads are not started.
+
+    Args:
+      functions: list[callable]: the functions, which take no arguments.
+
+    Returns: list: the result of each function.
+
+    Raises: the exception of the first function failing, in order. The
+      functions not started yet are not called.
+    """
+    executor = _EXECUTOR
+    if executor is None or len(functions) < 2:
+        return [function() for function in functions]
+    pending = [executor.submit(function) for function in functions[1:]]
+    try:
+        results = [functions[0]()]
+        results.extend(future.result() for future in pending)
+    finally:
+        for future in pending:
+            future.cancel()
+    return results
@@ -0,0 +1,160 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Functions to profile the CPU or memory usage of a run (--profile).
+
+The CPU profile is written with pstats, so it can be inspected with
+python -m pstats or tools like snakeviz. The memory profile is a tracemalloc
+snapshot, which can be loaded with tracemalloc.Snapshot.load.
+"""
+
+import cProfile
+import pstats
+import sys
+import threading
+
+try:
+    # pstats writes str, which is bytes in Python 2.
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+CPU = 'cpu'
+MEMORY = 'mem'
+MODES = (CPU, MEMORY)
+
+# Number of entries shown in the summary.
+TOP_ENTRIES = 20
+
+
+class CpuProfiler(object):
+    """Profiles the calling thread and all the threads started afterwards.
+
+    Since Python 3.12 a profile covers all the threads, and only one can be
+    active at a time. Before, each thread needs its own profile, which is
+    started by threading.setprofile.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profiles = []
+        self._per_thread = sys.version_info < (3, 12)
+
+    def _profile_thread(self, unused_frame, unused_event, unused_arg):
+        """Replaces itself with a new profile in the thread just started."""
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+    def start(self):
+        if self._per_thread:
+            threading.setprofile(self._profile_thread)
+        self._profile_thread(None, None, None)
+
+    def checkpoint(self):
+        pass
+
+    def stop(self):
+        if self._per_thread:
+            threading.setprofile(None)
+        self._profiles[0].disable()
+
+    def _stats(self, stream=None):
+        stats = pstats.Stats(self._profiles[0], stream=stream)
+        for profile in self._profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def write(self, filename):
+        self._stats().dump_stats(filename)
+
+    def summary(self):
+        stream = StringIO()
+        self._stats(stream).sort_stats('cumulative').print_stats(TOP_ENTRIES)
+        return stream.getvalue()
+
+
+class MemoryProfiler(object):
+    """Traces the memory allocations of all threads with tracemalloc.
+
+    The snapshot is taken at checkpoint, which is called before the output is
+    rendered, when all the results are still in memory.
+    """
+
+    def __init__(self):
+        # tracemalloc is not available in Python 2.
+        import tracemalloc  # pylint: disable=import-error
+        self._tracemalloc = tracemalloc
+        self._snapshot = None
+        self._peak = 0
+
+    def start(self):
+        self._tracemalloc.start(25)
+
+    def checkpoint(self):
+        self._snapshot = self._tracemalloc.take_snapshot()
+
+    def stop(self):
+        if self._snapshot is None:
+            self.checkpoint()
+        self._peak = self._tracemalloc.get_traced_memory()[1]
+        self._tracemalloc.stop()
+
+    def write(self, filename):
+        self._snapshot.dump(filename)
+
+    def summary(self):
+        lines = ['Peak traced memory: %.1f KiB' % (self._peak / 1024.0)]
+        for stat in self._snapshot.statistics('lineno')[:TOP_ENTRIES]:
+            lines.append(str(stat))
+        return '\n'.join(lines) + '\n'
+
+
+_PROFILER = None
+
+
+def start(mode):
+    """Starts profiling in the given mode, returning the profiler.
+
+    Raises: ValueError if the mode is not supported.
+    """
+    global _PROFILER  # pylint: disable=global-statement
+    if mode == CPU:
+        _PROFILER = CpuProfiler()
+    elif mode == MEMORY:
+        try:
+            _PROFILER = MemoryProfiler()
+        except ImportError:
+            raise ValueError('Memory profiling requires Python 3')
+    else:
+        raise ValueError('Invalid profile mode "%s", expected one of: %s' %
+                         (mode, ', '.join(MODES)))
+    _PROFILER.start()
+    return _PROFILER
+
+
+def checkpoint():
+    """Marks the point of the run where the memory usage is expected to peak."""
+    profiler = _PROFILER
+    if profiler is not None:
+        profiler.checkpoint()
+
+
+def stop():
+    """Stops profiling, returning the profiler used until now (if any)."""
+    global _PROFILER  # pylint: disable=global-statement
+    profiler, _PROFILER = _PROFILER, None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
@@ -0,0 +1,279 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Client and reference server of the remote cache.
+
+The remote cache is a content addressed store shared by several machines,
+consulted when the output of a linter is not in the local caches. Its protocol
+is plain HTTP, where each entry of the cache keyed by content is a resource:
+
+  GET /<linter fingerprint>/<file key>  returns the output or 404.
+  PUT /<linter fingerprint>/<file key>  stores the output in the body.
+
+where the file key depends on the content and on the path relative to the
+repository root, see utils.content_key.
+
+As with the local cache keyed by content, the linted filename is replaced by a
+placeholder in the stored outputs. The remote cache is best effort: any error
+talking to the server is treated as a miss, and after MAX_CONSECUTIVE_ERRORS
+errors in a row the remote cache is not used for the rest of the run, so a
+server down does not cost a timeout per linter.
+"""
+
+import io
+import os
+import os.path
+import threading
+from concurrent import futures
+
+try:
+    import http.server as http_server
+    import socketserver
+    from urllib import request as urllib_request
+except ImportError:
+    import BaseHTTPServer as http_server
+    import SocketServer as socketserver
+    import urllib2 as urllib_request
+
+import gitlint.cache as cache
+import gitlint.timings as timings
+import gitlint.utils as utils
+
+# Seconds to wait for the server before treating a request as a miss.
+DEFAULT_TIMEOUT = 2
+
+# Number of threads uploading the new outputs.
+UPLOAD_WORKERS = 2
+
+# Failed requests in a row after which the remote cache is disabled.
+MAX_CONSECUTIVE_ERRORS = 3
+
+# Largest entry, in bytes, accepted by the reference server.
+MAX_ENTRY_SIZE = 16 * 1024 * 1024
+
+
+class _Request(urllib_request.Request):
+    """Request with an explicit method, urllib2 only supports GET and POST."""
+
+    def __init__(self, url, method, data=None):
+        urllib_request.Request.__init__(self, url, data=data)
+        self._method = method
+
+    def get_method(self):
+        return self._method
+
+
+class Client(object):
+    """Client of a remote cache server.
+
+    Entries are uploaded in the background, so put does not block the linting.
+    After MAX_CONSECUTIVE_ERRORS failed requests in a row the client is
+    disabled, and the next requests are not sent.
+    """
+
+    def __init__(self, url, timeout=DEFAULT_TIMEOUT):
+        self._url = url.rstrip('/')
+        self._timeout = timeout
+        self._executor = futures.ThreadPoolExecutor(max_workers=UPLOAD_WORKERS)
+        self._lock = threading.Lock()
+        self._errors = 0
+        self.disabled = False
+
+    def _entry_url(self, fingerprint, key):
+        return '%s/%s/%s' % (self._url, fingerprint, key)
+
+    def _request(self, request):
+        if self.disabled:
+            return None
+        content = None
+        try:
+            response = urllib_request.urlopen(request, timeout=self._timeout)
+            try:
+                content = response.read()
+            finally:
+                response.close()
+        except Exception as error:  # pylint: disable=broad-except
+            if getattr(error, 'code', None) != 404:
+                self._failed()
+                return None
+        with self._lock:
+            self._errors = 0
+        return content
+
+    def _failed(self):
+        timings.increment('remote_cache_errors')
+        with self._lock:
+            self._errors += 1
+            if self.disabled or self._errors < MAX_CONSECUTIVE_ERRORS:
+                return
+            self.disabled = True
+        timings.increment('remote_cache_disabled')
+
+    def get(self, fingerprint, key):
+        """Returns the stored output, or None if missing or on errors."""
+        content = self._request(
+            _Request(self._entry_url(fingerprint, key), 'GET'))
+        if content is None:
+            return None
+        return content.decode('utf-8')
+
+    def put(self, fingerprint, key, output):
+        """Schedules the upload of output, returning a future."""
+        return self._executor.submit(
+            self._request,
+            _Request(
+                self._entry_url(fingerprint, key),
+                'PUT',
+                data=output.encode('utf-8')))
+
+    def close(self):
+        """Waits for the pending uploads."""
+        self._executor.shutdown(wait=True)
+
+
+_CLIENT = None
+
+
+def enable(url, timeout=DEFAULT_TIMEOUT):
+    """Starts using the remote cache at url, returning the client."""
+    global _CLIENT  # pylint: disable=global-statement
+    _CLIENT = Client(url, timeout=timeout)
+    return _CLIENT
+
+
+def disable():
+    """Stops using the remote cache, waiting for the pending uploads."""
+    global _CLIENT  # pylint: disable=global-statement
+    client, _CLIENT = _CLIENT, None
+    if client is not None:
+        client.close()
+
+
+def is_enabled():
+    """Returns whether the remote cache is enabled."""
+    return _CLIENT is not None
+
+
+def get_output(fingerprint, filename, key):
+    """Returns the output stored remotely for the content of filename, if any.
+
+    Args:
+      fingerprint: string: the fingerprint of the linter configuration.
+      filename: string: path of the filename for which we are retrieving the
+        output.
+      key: string: the key of the file, see utils.content_key.
+
+    Returns: a string with the output, or None if it is not in the cache or the
+      remote cache is disabled.
+    """
+    client = _CLIENT
+    if client is None:
+        return None
+
+    output = client.get(fingerprint, key)
+    if output is None:
+        return None
+    timings.increment('remote_cache_hits')
+    return output.replace(utils.FILENAME_PLACEHOLDER, filename)
+
+
+def save_output(fingerprint, filename, output, key):
+    """Uploads output in the background, if the remote cache is enabled.
+
+    Args:
+      fingerprint: string: the fingerprint of the linter configuration.
+      filename: string: path of the filename for which we are saving the output.
+      output: string: full output (not yet filetered) of the lint command.
+      key: string: the key of the file, see utils.content_key.
+    """
+    client = _CLIENT
+    if client is not None:
+        client.put(fingerprint, key,
+                   output.replace(filename, utils.FILENAME_PLACEHOLDER))
+
+
+class RequestHandler(http_server.BaseHTTPRequestHandler):
+    """Serves the entries stored in the directory of the server."""
+
+    def _entry_filename(self):
+        name = self.path.strip('/')
+        if not cache.is_valid_entry(name):
+            self.send_error(400, 'Invalid entry')
+            return None
+        return os.path.join(self.server.directory, *name.split('/'))
+
+    def _send(self, code, content=b''):
+        self.send_response(code)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(content)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        filename = self._entry_filename()
+        if filename is None:
+            return
+        try:
+            with io.open(filename, 'rb') as f:
+                content = f.read()
+        except (IOError, OSError):
+            self.send_error(404, 'Not found')
+            return
+        self._send(200, content)
+
+    do_HEAD = do_GET
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        filename = self._entry_filename()
+        if filename is None:
+            return
+        try:
+            length = int(self.headers.get('Content-Length'))
+        except (TypeError, ValueError):
+            self.send_error(411, 'Length required')
+            return
+        if length > MAX_ENTRY_SIZE:
+            self.send_error(413, 'Entry too large')
+            return
+        content = self.rfile.read(length)
+        # Entries are keyed by content, so an existing one is already valid.
+        if os.path.exists(filename):
+            self._send(204)
+            return
+        try:
+            utils.write_atomically(filename, content.decode('utf-8'))
+        except UnicodeDecodeError:
+            self.send_error(400, 'Invalid encoding')
+            return
+        self._send(201)
+
+
+class Server(socketserver.ThreadingMixIn, http_server.HTTPServer):
+    """Reference server of the remote cache, storing the entries on disk."""
+
+    daemon_threads = True
+
+    def __init__(self, address, directory):
+        http_server.HTTPServer.__init__(self, address, RequestHandler)
+        self.directory = directory
+
+
+def serve(server):
+    """Serves the requests until interrupted."""
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
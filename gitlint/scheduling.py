@@ -0,0 +1,117 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Functions to prioritize the files linted with a time budget (--deadline).
+
+The wall time of each linter, when it actually runs instead of being found in
+the caches, is averaged across runs in ~/.git-lint/costs.json. With a deadline
+the files with the most modified lines are linted first and, among them, the
+files with the cheapest linters, so the budget covers as many of the relevant
+problems as possible.
+"""
+
+import io
+import json
+import os.path
+import threading
+
+import gitlint.utils as utils
+
+# Weight of the latest duration in the moving average of the cost of a linter.
+SMOOTHING = 0.3
+
+
+def get_costs_filename():
+    """Returns the file where the costs of the linters are kept."""
+    return os.path.join(os.path.expanduser('~'), '.git-lint', 'costs.json')
+
+
+class LinterCosts(object):
+    """Thread safe moving averages of the wall time of each linter.
+
+    Args:
+      costs: dict[string: float]|None: the initial cost of each linter.
+    """
+
+    def __init__(self, costs=None):
+        self._lock = threading.Lock()
+        self.costs = dict(costs or {})
+        self.changed = False
+
+    def record(self, linter, duration):
+        with self._lock:
+            previous = self.costs.get(linter)
+            if previous is None:
+                self.costs[linter] = duration
+            else:
+                self.costs[
+                    linter] = previous + SMOOTHING * (duration - previous)
+            self.changed = True
+
+    def on_linter_end(self, unused_event, data):
+        """Listener of hooks.LINTER_END recording the linters that ran."""
+        if not data['cache_hit']:
+            self.record(data['linter'], data['duration'])
+
+    def estimate(self, linters):
+        """Returns the cost of running linters, counting 0 for unknown ones."""
+        return sum(self.costs.get(linter, 0.0) for linter in linters)
+
+
+def load_costs(filename=None):
+    """Loads the costs saved by previous runs, if any.
+
+    Returns: LinterCosts: the costs, empty if they could not be read.
+    """
+    try:
+        with io.open(filename or get_costs_filename(), encoding='utf-8') as f:
+            costs = json.loads(f.read())
+        if not isinstance(costs, dict):
+            raise ValueError('Invalid costs')
+        return LinterCosts(
+            dict((linter, float(cost)) for linter, cost in costs.items()))
+    except (IOError, OSError, ValueError, TypeError):
+        return LinterCosts()
+
+
+def save_costs(costs, filename=None):
+    """Atomically saves the costs, if they changed during the run.
+
+    Errors are ignored, as the costs are only used to sort the files.
+    """
+    if not costs.changed:
+        return
+    try:
+        utils.write_atomically(filename or get_costs_filename(),
+                               json.dumps(costs.costs, sort_keys=True))
+    except (IOError, OSError):
+        pass
+
+
+def prioritize(files, modified_line_counts, costs):
+    """Sorts the files in the order they should be linted with a deadline.
+
+    Args:
+      files: list[tuple]: the data of the files, starting with their filename.
+      modified_line_counts: list[int]: the number of modified lines of each
+        file.
+      costs: list[float]: the estimated cost of linting each file.
+
+    Returns: list[tuple]: the files with the most modified lines first, then
+      the cheapest ones, and then by filename.
+    """
+
+    def priority(index):
+        return (-modified_line_counts[index], costs[index], files[index][0])
+
+    return [files[index] for index in sorted(range(len(files)), key=priority)]
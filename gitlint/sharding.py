@@ -0,0 +1,149 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Functions to split a run across machines and to merge their results.
+
+A run is split with --shard=I/N, which lints only the files of the I-th of N
+shards. A file belongs to a shard by a stable hash of its path relative to the
+repository root, so every machine agrees on the partition without talking to
+each other. When the cost of linting the files was recorded in a previous
+report, those files are instead distributed so every shard gets a similar
+amount of work.
+
+The --json reports of the shards are combined with 'git-lint merge'.
+"""
+
+import collections
+import hashlib
+import heapq
+
+import gitlint.timings as timings
+
+
+def parse_shard(value):
+    """Parses a shard given as 'I/N', where 1 <= I <= N.
+
+    Returns: tuple(int, int): the 1-based index of the shard and the number of
+      shards.
+
+    Raises: ValueError if value is not a valid shard.
+    """
+    try:
+        index, count = [int(part) for part in value.split('/')]
+    except ValueError:
+        raise ValueError('Invalid shard "%s", expected I/N' % value)
+    if not 1 <= index <= count:
+        raise ValueError('Invalid shard "%s", expected 1 <= I <= N' % value)
+    return index, count
+
+
+def hash_shard(filename, count):
+    """Returns the 1-based shard of filename, by a stable hash of its name."""
+    digest = hashlib.sha1(filename.encode('utf-8')).hexdigest()
+    return int(digest[:15], 16) % count + 1
+
+
+def costs_from_report(report):
+    """Returns the cost of each file recorded in a --json --timings report.
+
+    Args:
+      report: dict: the parsed report.
+
+    Returns: dict[string: float]: the wall time spent by all the linters of
+      each file, keyed by the filename relative to the repository root.
+    """
+    costs = collections.defaultdict(float)
+    for job in report.get('timings', {}).get('jobs', []):
+        costs[job['filename']] += job['wall']
+    return dict(costs)
+
+
+def assign_shards(costs, count):
+    """Distributes the files so the shards get a similar total cost.
+
+    The most expensive files are assigned first, each to the shard with the
+    least cost so far. Ties are broken by name, so the result only depends on
+    the costs.
+
+    Args:
+      costs: dict[string: float]: the cost of each file.
+      count: int: the number of shards.
+
+    Returns: dict[string: int]: the 1-based shard of each file.
+    """
+    loads = [(0.0, index) for index in range(1, count + 1)]
+    shards = {}
+    for filename, cost in sorted(
+            costs.items(), key=lambda item: (-item[1], item[0])):
+        load, index = heapq.heappop(loads)
+        shards[filename] = index
+        heapq.heappush(loads, (load + cost, index))
+    return shards
+
+
+def shard_filter(index, count, costs=None):
+    """Returns a predicate telling whether a file belongs to the shard.
+
+    Args:
+      index: int: the 1-based index of the shard.
+      count: int: the number of shards.
+      costs: dict[string: float]|None: the recorded cost of the files. Files
+        without a recorded cost are assigned by hash.
+
+    Returns: callable(string): receiving the filename relative to the
+      repository root.
+    """
+    shards = assign_shards(costs or {}, count)
+
+    def in_shard(filename):
+        shard = shards.get(filename)
+        if shard is None:
+            shard = hash_shard(filename, count)
+        return shard == index
+
+    return in_shard
+
+
+def return_code(report):
+    """Returns the exit code of main for the results in a --json report."""
+    results = [
+        result for filename, result in report.items() if filename != 'timings'
+    ]
+    if any(result.get('comments') for result in results):
+        return 1
+    if any(result.get('error') for result in results):
+        return 4
+    return 0
+
+
+def merge_reports(reports):
+    """Merges the --json reports of several shards into one.
+
+    Args:
+      reports: list[dict]: the parsed reports. If a file is in more than one
+        report, the result of the last one is kept.
+
+    Returns: dict: a report with the results of all the files and, if any of
+      the reports had them, the merged timings.
+    """
+    merged = {}
+    summaries = []
+    for report in reports:
+        for filename, result in report.items():
+            if filename == 'timings':
+                summaries.append(result)
+            else:
+                merged[filename] = result
+    if summaries:
+        merged['timings'] = timings.merge_summaries(summaries)
+    return merged
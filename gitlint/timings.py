@@ -0,0 +1,378 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Functions to collect timing and resource usage information of a run.
+
+Recording is disabled by default, in which case span and increment are no-ops.
+The recorded data can be summarized for humans (--timings) or exported in the
+Trace Event Format (--trace).
+
+The CPU time and max RSS of a span are those of the subprocesses reaped by its
+thread while it is open, as reported by the engine for each of them, so they
+are not mixed with the subprocesses of other threads. The work a span hands to
+other threads is measured in it too when wrapped with propagate, like the git
+blame of each file run by the pool of workers during a phase. The totals of
+the process and all its subprocesses are reported once per run.
+"""
+
+import collections
+import contextlib
+import os.path
+import resource
+import threading
+import time
+
+Span = collections.namedtuple('Span',
+                              ('name', 'category', 'start', 'wall',
+                               'child_cpu', 'max_rss', 'thread_id', 'args'))
+
+# Categories of the spans. Only PHASE, VCS and LINTER are reported by summary,
+# the rest are only exported in traces.
+PHASE = 'phase'
+VCS = 'vcs'
+LINTER = 'linter'
+FILE = 'file'
+SUBPROCESS = 'subprocess'
+# Reads from a subprocess already running, like git cat-file --batch.
+IO = 'io'
+CACHE = 'cache'
+RENDER = 'render'
+WORKER = 'worker'
+
+
+class Recorder(object):
+    """Thread safe container of the spans and counters of a run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans = []
+        self.counters = collections.Counter()
+        self.thread_names = {}
+
+    def add_span(self, span):
+        with self._lock:
+            self.spans.append(span)
+            if span.thread_id not in self.thread_names:
+                self.thread_names[span.thread_id] = (
+                    threading.current_thread().name)
+
+    def increment(self, counter, value=1):
+        with self._lock:
+            self.counters[counter] += value
+
+
+_RECORDER = None
+
+
+def enable():
+    """Starts recording spans and counters, returning the recorder."""
+    global _RECORDER  # pylint: disable=global-statement
+    _RECORDER = Recorder()
+    return _RECORDER
+
+
+def disable():
+    """Stops recording, returning the recorder used until now (if any)."""
+    global _RECORDER  # pylint: disable=global-statement
+    recorder, _RECORDER = _RECORDER, None
+    return recorder
+
+
+class _ChildUsage(object):
+    """CPU time and max RSS of the subprocesses reaped during a span.
+
+    It is thread safe, as the span may be propagated to other threads.
+    """
+
+    __slots__ = ('cpu', 'max_rss', '_lock')
+
+    def __init__(self):
+        self.cpu = None
+        self.max_rss = None
+        self._lock = threading.Lock()
+
+    def add(self, cpu, max_rss):
+        with self._lock:
+            self.cpu = (self.cpu or 0.0) + cpu
+            self.max_rss = max(self.max_rss or 0, max_rss)
+
+
+# The usage of the spans open in each thread.
+_OPEN_SPANS = threading.local()
+
+
+def record_child(usage):
+    """Adds the usage of a subprocess to the spans open in the thread.
+
+    Args:
+      usage: resource.struct_rusage: the usage of the subprocess, as returned
+        by os.wait4.
+    """
+    for child_usage in getattr(_OPEN_SPANS, 'usages', ()):
+        child_usage.add(usage.ru_utime + usage.ru_stime, usage.ru_maxrss)
+
+
+def propagate(function):
+    """Wraps function to measure its subprocesses in the spans open now.
+
+    Args:
+      function: callable: the work to run in another thread, like in a pool.
+
+    Returns: callable: function, adding the usage of the subprocesses reaped
+      while it runs to the spans open in the calling thread.
+    """
+    usages = list(getattr(_OPEN_SPANS, 'usages', ()))
+    if not usages:
+        return function
+
+    def propagated(*args, **kwargs):
+        own_usages = _OPEN_SPANS.__dict__.setdefault('usages', [])
+        own_usages.extend(usages)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            for child_usage in usages:
+                own_usages.remove(child_usage)
+
+    return propagated
+
+
+@contextlib.contextmanager
+def span(name, category, **args):
+    """Records the wall time, child CPU time and max RSS of the enclosed code.
+
+    The child CPU time and max RSS are None if no subprocess was measured.
+
+    Args:
+      name: string: name of the span, like 'modified_files' or the linter name.
+      category: string: one of the categories defined in this module.
+      args: extra information to attach to the span, like the filename.
+    """
+    recorder = _RECORDER
+    if recorder is None:
+        yield
+        return
+
+    usages = _OPEN_SPANS.__dict__.setdefault('usages', [])
+    child_usage = _ChildUsage()
+    usages.append(child_usage)
+    start = time.time()
+    try:
+        yield
+    finally:
+        # Spans in generators may not be closed in the reverse order.
+        if child_usage in usages:
+            usages.remove(child_usage)
+        recorder.add_span(
+            Span(name, category, start,
+                 time.time() - start, child_usage.cpu, child_usage.max_rss,
+                 threading.current_thread().ident, args))
+
+
+def _run_usage():
+    """Returns the CPU time and max RSS of the process and its subprocesses."""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        'cpu': own.ru_utime + own.ru_stime,
+        'child_cpu': children.ru_utime + children.ru_stime,
+        'max_rss': own.ru_maxrss,
+        'child_max_rss': children.ru_maxrss,
+    }
+
+
+def increment(counter, value=1):
+    """Increments the counter if recording is enabled."""
+    recorder = _RECORDER
+    if recorder is not None:
+        recorder.increment(counter, value)
+
+
+def _add_usage(phase, child_cpu, max_rss):
+    """Adds the child usage of a span to a phase, None if not measured."""
+    if child_cpu is not None:
+        phase['child_cpu'] = (phase['child_cpu'] or 0.0) + child_cpu
+    if max_rss is not None:
+        phase['max_rss'] = max(phase['max_rss'] or 0, max_rss)
+
+
+def summary(recorder, root=None):
+    """Summarizes the recorded data as a json serializable dictionary.
+
+    Args:
+      recorder: Recorder: the recorded data.
+      root: string: if given, filenames are reported relative to it.
+
+    Returns: dict: with the keys 'phases', aggregated by name with the CPU
+      time and max RSS of their subprocesses, 'jobs', one per (linter, file)
+      job, 'cache', with the number of hits of each cache and
+      the number of misses of the local caches, and 'run', with the CPU time
+      and max RSS of the process and of its subprocesses.
+    """
+    phases = collections.OrderedDict()
+    jobs = []
+    for item in sorted(recorder.spans, key=lambda item: item.start):
+        if item.category == LINTER:
+            filename = item.args.get('filename', '')
+            if root and filename:
+                filename = os.path.relpath(filename, root)
+            jobs.append({
+                'linter': item.name,
+                'filename': filename,
+                'wall': item.wall,
+                'child_cpu': item.child_cpu,
+                'max_rss': item.max_rss,
+            })
+            continue
+        if item.category not in (PHASE, VCS):
+            continue
+        phase = phases.setdefault(
+            item.name, {
+                'name': item.name,
+                'count': 0,
+                'wall': 0.0,
+                'child_cpu': None,
+                'max_rss': None,
+            })
+        phase['count'] += 1
+        phase['wall'] += item.wall
+        _add_usage(phase, item.child_cpu, item.max_rss)
+
+    return {
+        'phases': list(phases.values()),
+        'jobs': jobs,
+        'cache': {
+            'hits': recorder.counters['cache_hits'],
+            'misses': recorder.counters['cache_misses'],
+            'content_hits': recorder.counters['content_cache_hits'],
+            'remote_hits': recorder.counters['remote_cache_hits'],
+        },
+        'run': _run_usage(),
+    }
+
+
+def merge_summaries(summaries):
+    """Merges the output of summary of several runs, like the shards of one.
+
+    The phases with the same name are aggregated, the jobs concatenated, the
+    cache counters and the CPU times added, and the max RSS are the largest.
+    """
+    phases = collections.OrderedDict()
+    jobs = []
+    cache = collections.OrderedDict(
+        (key, 0) for key in ('hits', 'misses', 'content_hits', 'remote_hits'))
+    run = {'cpu': 0.0, 'child_cpu': 0.0, 'max_rss': 0, 'child_max_rss': 0}
+    for summary_data in summaries:
+        for item in summary_data['phases']:
+            phase = phases.setdefault(
+                item['name'], {
+                    'name': item['name'],
+                    'count': 0,
+                    'wall': 0.0,
+                    'child_cpu': None,
+                    'max_rss': None,
+                })
+            phase['count'] += item['count']
+            phase['wall'] += item['wall']
+            # The reports of older versions only have the wall time.
+            _add_usage(phase, item.get('child_cpu'), item.get('max_rss'))
+        jobs.extend(summary_data['jobs'])
+        for key, value in summary_data['cache'].items():
+            cache[key] = cache.get(key, 0) + value
+        for key, value in summary_data.get('run', {}).items():
+            if key.endswith('max_rss'):
+                run[key] = max(run[key], value)
+            else:
+                run[key] += value
+
+    return {
+        'phases': list(phases.values()),
+        'jobs': jobs,
+        'cache': dict(cache),
+        'run': run,
+    }
+
+
+def _format_usage(value, value_format):
+    return '-' if value is None else value_format % value
+
+
+def format_summary(summary_data):
+    """Formats the output of summary as a list of lines for humans."""
+    row_format = '{0:<40} {1:>6} {2:>9} {3:>9} {4:>11}'
+    lines = [
+        row_format.format('Phase', 'Count', 'Wall (s)', 'CPU (s)',
+                          'Max RSS (KB)')
+    ]
+    for phase in summary_data['phases']:
+        lines.append(
+            row_format.format(phase['name'], phase['count'],
+                              '%.3f' % phase['wall'],
+                              _format_usage(phase.get('child_cpu'), '%.3f'),
+                              _format_usage(phase.get('max_rss'), '%d')))
+    for job in summary_data['jobs']:
+        lines.append(
+            row_format.format('%s %s' % (job['linter'], job['filename']), 1,
+                              '%.3f' % job['wall'],
+                              _format_usage(job['child_cpu'], '%.3f'),
+                              _format_usage(job['max_rss'], '%d')))
+    run = summary_data.get('run')
+    if run:
+        lines.append(
+            'Run: %.3f s CPU and %d KB max RSS, subprocesses: %.3f s '
+            'CPU and %d KB max RSS' % (run['cpu'], run['max_rss'],
+                                       run['child_cpu'], run['child_max_rss']))
+    cache = summary_data['cache']
+    lines.append('Cache: %d hits, %d misses, %d content hits, %d remote hits' %
+                 (cache['hits'], cache['misses'], cache['content_hits'],
+                  cache['remote_hits']))
+    return lines
+
+
+def trace_events(recorder):
+    """Converts the recorded spans to the Trace Event Format.
+
+    Each thread gets its own track, named after the thread, so the utilization
+    of the pool of workers can be seen in the trace viewer.
+
+    Args:
+      recorder: Recorder: the recorded data.
+
+    Returns: dict: a json serializable object in the Trace Event Format.
+    """
+    pid = os.getpid()
+    thread_ids = {}
+    events = []
+    for item in sorted(recorder.spans, key=lambda item: item.start):
+        tid = thread_ids.setdefault(item.thread_id, len(thread_ids) + 1)
+        events.append({
+            'name': item.name,
+            'cat': item.category,
+            'ph': 'X',
+            'ts': int(item.start * 1e6),
+            'dur': int(item.wall * 1e6),
+            'pid': pid,
+            'tid': tid,
+            'args': item.args,
+        })
+    for thread_id, tid in thread_ids.items():
+        events.append({
+            'name': 'thread_name',
+            'ph': 'M',
+            'pid': pid,
+            'tid': tid,
+            'args': {
+                'name': recorder.thread_names.get(thread_id, str(tid))
+            },
+        })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
@@ -13,13 +13,25 @@
 # limitations under the License.
 """Common function used across modules."""
 
+import collections
+import contextlib
+import difflib
+import fcntl
+import hashlib
 import io
 import os
 import re
+import shutil
+import subprocess
+import tempfile
+import time
 
 # This can be just pathlib when 2.7 and 3.4 support is dropped.
 import pathlib2 as pathlib
 
+import gitlint.engine as engine
+import gitlint.timings as timings
+
 
 def filter_lines(lines, filter_regex, groups=None):
     """Filters out the lines not matching the pattern.
@@ -43,6 +55,195 @@ def filter_lines(lines, filter_regex, groups=None):
                 yield tuple(matched_groups.get(group) for group in groups)
 
 
+def check_output(command, **kwargs):
+    """Runs command in the engine, recording it in the timings.
+
+    Args:
+      command: list[string]: the program and its arguments.
+      kwargs: extra arguments for subprocess.check_output.
+
+    Returns: bytes: the output of the command.
+    """
+    with timings.span(' '.join(command[:2]), timings.SUBPROCESS):
+        return engine.check_output(command, **kwargs)
+
+
+def output_fields(command, separator=b'\0', ok_returncodes=(0, ), **kwargs):
+    """Runs command, yielding the fields of its output as they are produced.
+
+    Unlike check_output the output is never held in memory as a whole, so it can
+    be used for commands listing a huge number of files.
+
+    Args:
+      command: list[string]: the program and its arguments.
+      separator: bytes: the separator of the fields, like b'\0' for -z.
+      ok_returncodes: tuple[int]: exit codes not considered a failure.
+      kwargs: extra arguments for subprocess.Popen, like cwd.
+
+    Yields: bytes: the non empty fields.
+
+    Raises: subprocess.CalledProcessError if the command fails.
+    """
+    with timings.span(' '.join(command[:2]), timings.SUBPROCESS):
+        process = engine.popen(command, **kwargs)
+        try:
+            pending = b''
+            for chunk in iter(lambda: process.stdout.read(65536), b''):
+                fields = (pending + chunk).split(separator)
+                pending = fields.pop()
+                for field in fields:
+                    if field:
+                        yield field
+            if engine.is_cancelled():
+                raise engine.Cancelled()
+            if pending:
+                yield pending
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+    if returncode not in ok_returncodes:
+        raise subprocess.CalledProcessError(returncode, command)
+
+
+def ordered_map(executor, function, iterable, max_pending):
+    """Like executor.map, but consuming iterable as the results are needed.
+
+    executor.map submits all the items before returning, so the whole input
+    has to be known in advance. Instead, at most max_pending items are in flight
+    at any time, which keeps the memory bounded for huge inputs.
+
+    Args:
+      executor: futures.Executor: where to run the function.
+      function: callable: the function to apply to every item.
+      iterable: the items, which may be a generator.
+      max_pending: int: maximum number of submitted items not yet yielded.
+
+    If the results stop being consumed, by an error or by closing the
+    generator, the pending items not started yet are cancelled.
+
+    Yields: the results of the function, in the order of the items.
+    """
+    pending = collections.deque()
+    try:
+        for item in iterable:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def changed_lines(old_content, new_content):
+    """Returns the lines of new_content that are not in old_content.
+
+    Args:
+      old_content: bytes|None: the original content. None means that all the
+        lines are new.
+      new_content: bytes: the modified content.
+
+    Returns: list[int]|None: the numbers of the added or modified lines, or
+      None if all lines are new.
+    """
+    if old_content is None:
+        return None
+    matcher = difflib.SequenceMatcher(
+        None,
+        old_content.splitlines(),
+        new_content.splitlines(),
+        autojunk=False)
+    lines = []
+    for tag, _, _, start, end in matcher.get_opcodes():
+        if tag in ('replace', 'insert'):
+            lines.extend(range(start + 1, end + 1))
+    return lines
+
+
+# Header of a hunk of a unified diff, capturing the new range of lines.
+_HUNK_REGEX = re.compile(
+    br'^@@ -\d+(?:,\d+)? \+(?P<start>\d+)(?:,(?P<count>\d+))? @@')
+
+# Path quoted by git, like "a/q\"t.py", and the escapes in it.
+_QUOTED_PATH_REGEX = re.compile(br'^"((?:[^"\\]|\\.)*)"')
+_ESCAPE_REGEX = re.compile(br'\\([0-7]{3}|.)')
+_ESCAPES = {
+    b'a': b'\a',
+    b'b': b'\b',
+    b't': b'\t',
+    b'n': b'\n',
+    b'v': b'\v',
+    b'f': b'\f',
+    b'r': b'\r',
+}
+
+
+def _unescape(match):
+    escape = match.group(1)
+    if len(escape) == 3:
+        return bytes(bytearray([int(escape, 8)]))
+    return _ESCAPES.get(escape, escape)
+
+
+def _diff_path(name):
+    """Returns the path in a diff header, unquoting it if git quoted it.
+
+    Args:
+      name: bytes: the path, like b'b/foo.py' or b'"b/\\303\\251.py"'.
+
+    Returns: string: the path without its a/ or b/ prefix.
+    """
+    match = _QUOTED_PATH_REGEX.match(name)
+    if match:
+        name = _ESCAPE_REGEX.sub(_unescape, match.group(1))
+    return name[2:].decode('utf-8')
+
+
+def diff_changes(diff):
+    """Returns the added lines of each file in a diff in the git format.
+
+    Args:
+      diff: bytes: the output of git diff or hg diff --git, ideally with -U0.
+
+    Returns: list[(string, list[int]|None)]: the path of each added or
+      modified file, relative to the root, and its added lines, or None if
+      all the lines are new. Deleted files are omitted.
+    """
+    changes = []
+    path = None
+    lines = []
+    for line in diff.split(b'\n'):
+        if line.startswith(b'diff --git '):
+            if path is not None:
+                changes.append((path, lines))
+            # Without renames the header is 'diff --git a/<path> b/<path>',
+            # with both paths quoted if they have special characters.
+            header = line[len(b'diff --git '):]
+            if not header.startswith(b'"'):
+                header = header[:(len(header) - 1) // 2]
+            path = _diff_path(header)
+            lines = []
+        elif path is None:
+            continue
+        elif line.startswith(b'new file mode'):
+            lines = None
+        elif line.startswith(b'deleted file mode'):
+            path = None
+        elif line.startswith((b'+++ b/', b'+++ "b/')):
+            # Git appends a tab to the paths with spaces.
+            path = _diff_path(line[len(b'+++ '):].rstrip(b'\t'))
+        elif lines is not None:
+            match = _HUNK_REGEX.match(line)
+            if match:
+                start = int(match.group('start'))
+                count = int(match.group('count') or 1)
+                lines.extend(range(start, start + count))
+    if path is not None:
+        changes.append((path, lines))
+    return changes
+
+
 # TODO(skreft): add test
 def which(program):
     """Returns a list of paths where the program is found."""
@@ -64,12 +265,45 @@ def programs_not_in_path(programs):
     return [program for program in programs if not which(program)]
 
 
-def _open_for_write(filename):
-    """Opens filename for writing, creating the directories if needed."""
-    dirname = os.path.dirname(filename)
+@contextlib.contextmanager
+def atomic_writer(filename):
+    """Opens filename for writing, so readers see either all or nothing of it.
+
+    The content is written to a temporary file in the same directory, which is
+    renamed to filename when the block exits. If the block raises an exception
+    the temporary file is removed instead, leaving filename untouched.
+
+    Args:
+      filename: string: path of the file to write.
+
+    Yields: a text file object.
+    """
+    dirname = os.path.dirname(os.path.abspath(filename))
     pathlib.Path(dirname).mkdir(parents=True, exist_ok=True)
+    file_descriptor, temp_filename = tempfile.mkstemp(
+        dir=dirname, prefix='.%s.' % os.path.basename(filename))
+    try:
+        with io.open(file_descriptor, 'w', encoding='utf-8') as f:
+            yield f
+        os.chmod(temp_filename, 0o644)
+        os.rename(temp_filename, filename)
+    except BaseException:
+        os.remove(temp_filename)
+        raise
 
-    return io.open(filename, 'w')
+
+def write_atomically(filename, content):
+    """Writes content to filename, so readers see either all or nothing of it.
+
+    Args:
+      filename: string: path of the file to write.
+      content: string|bytes: the content of the file. Bytes, like the str
+        returned by json.dumps in Python 2, are decoded as UTF-8.
+    """
+    if isinstance(content, bytes):
+        content = content.decode('utf-8')
+    with atomic_writer(filename) as f:
+        f.write(content)
 
 
 def _get_cache_filename(name, filename):
@@ -97,20 +331,256 @@ def get_output_from_cache(name, filename):
     cache_filename = _get_cache_filename(name, filename)
     if (os.path.exists(cache_filename)
             and os.path.getmtime(filename) < os.path.getmtime(cache_filename)):
-        with io.open(cache_filename) as f:
+        timings.increment('cache_hits')
+        with io.open(cache_filename, encoding='utf-8') as f:
             return f.read()
 
+    timings.increment('cache_misses')
     return None
 
 
+@contextlib.contextmanager
+def cache_writer(name, filename):
+    """Opens the cache location of filename to write an output as produced.
+
+    The output is written atomically when the block exits, so concurrent runs
+    never read a partially written output.
+
+    Args:
+      name: string: name of the linter.
+      filename: string: path of the filename for which we are saving the output.
+
+    Yields: callable(string): function writing the next chunk of the output.
+    """
+    with atomic_writer(_get_cache_filename(name, filename)) as f:
+        yield f.write
+
+
 def save_output_in_cache(name, filename, output):
     """Saves output in the cache location.
 
+    The output is written atomically, so concurrent runs never read a partially
+    written output.
+
     Args:
       name: string: name of the linter.
       filename: string: path of the filename for which we are saving the output.
       output: string: full output (not yet filetered) of the lint command.
     """
-    cache_filename = _get_cache_filename(name, filename)
-    with _open_for_write(cache_filename) as f:
-        f.write(output)
+    with cache_writer(name, filename) as write:
+        write(output)
+
+
+# Placeholder for the linted filename in the outputs stored in the content
+# cache, so they can be reused for the same file in a different clone.
+FILENAME_PLACEHOLDER = '\x00FILENAME\x00'
+
+
+def blob_hash(content):
+    """Returns the git blob id (SHA1) of content, given as bytes."""
+    blob = hashlib.sha1(('blob %d\0' % len(content)).encode('ascii'))
+    blob.update(content)
+    return blob.hexdigest()
+
+
+def content_hash(filename):
+    """Returns the git blob id (SHA1) of the content of filename."""
+    with io.open(filename, 'rb') as f:
+        return blob_hash(f.read())
+
+
+def content_key(path, file_hash):
+    """Returns the key of a file in the cache keyed by content.
+
+    The key depends on the path of the file relative to the root of the
+    repository as well as on its content, as the output of many linters does,
+    for example because of per directory configurations or module names. So
+    the entries are shared by all the branches, worktrees and clones, but not
+    by copies of a file in different directories.
+
+    Args:
+      path: string: the path of the file relative to the repository root.
+      file_hash: string: the git blob id of the content of the file.
+
+    Returns: string: the SHA1 of both, in hexadecimal.
+    """
+    key = hashlib.sha1(path.replace(os.sep, '/').encode('utf-8'))
+    key.update(b'\0')
+    key.update(file_hash.encode('ascii'))
+    return key.hexdigest()
+
+
+def get_content_cache_dir():
+    """Returns the directory of the cache keyed by content."""
+    return os.path.join(os.path.expanduser('~'), '.git-lint', 'objects')
+
+
+def _get_content_cache_filename(fingerprint, key):
+    return os.path.join(get_content_cache_dir(), fingerprint, key)
+
+
+def get_output_from_content_cache(fingerprint, filename, key):
+    """Returns the output stored for the content of filename, if any.
+
+    Unlike get_output_from_cache, the entries do not depend on the location of
+    the repository, so they can be shared across clones and machines.
+
+    Args:
+      fingerprint: string: the fingerprint of the linter configuration.
+      filename: string: path of the filename for which we are retrieving the
+        output.
+      key: string: the key of the file, see content_key.
+
+    Returns: a string with the output, or None if it is not in the cache.
+    """
+    cache_filename = _get_content_cache_filename(fingerprint, key)
+    if not os.path.exists(cache_filename):
+        timings.increment('cache_misses')
+        return None
+
+    timings.increment('content_cache_hits')
+    with io.open(cache_filename, encoding='utf-8') as f:
+        return f.read().replace(FILENAME_PLACEHOLDER, filename)
+
+
+@contextlib.contextmanager
+def content_cache_writer(fingerprint, filename, key):
+    """Opens the cache entry of the content of filename, like cache_writer.
+
+    Args:
+      fingerprint: string: the fingerprint of the linter configuration.
+      filename: string: path of the filename for which we are saving the output.
+      key: string: the key of the file, see content_key.
+
+    Yields: callable(string): function writing the next chunk of the output.
+      The chunks should be whole lines, so filename is never split among them.
+    """
+    cache_filename = _get_content_cache_filename(fingerprint, key)
+    with atomic_writer(cache_filename) as f:
+
+        def write(output):
+            f.write(output.replace(filename, FILENAME_PLACEHOLDER))
+
+        yield write
+
+
+def save_output_in_content_cache(fingerprint, filename, output, key):
+    """Saves output in the cache keyed by the content of filename.
+
+    Args:
+      fingerprint: string: the fingerprint of the linter configuration.
+      filename: string: path of the filename for which we are saving the output.
+      output: string: full output (not yet filetered) of the lint command.
+      key: string: the key of the file, see content_key.
+    """
+    with content_cache_writer(fingerprint, filename, key) as write:
+        write(output)
+
+
+# Seconds waited for the lock of single_flight before running the work
+# without it, in case the holder is stuck.
+LOCK_TIMEOUT = 300
+
+
+def get_lock_dir():
+    """Returns the directory of the lock files used by single_flight."""
+    return os.path.join(os.path.expanduser('~'), '.git-lint', 'locks')
+
+
+def _lock(lock_filename, timeout):
+    """Locks lock_filename, returning its file descriptor and whether it waited.
+
+    The lock is polled, sleeping longer each time, for up to timeout seconds.
+    The lock files are removed when released, so after acquiring the lock it
+    checks that the file was not removed meanwhile, retrying otherwise.
+
+    Returns: tuple(int|None, bool): the file descriptor, None if the lock was
+      not acquired in time, and whether it waited.
+    """
+    waited = False
+    deadline = time.time() + timeout
+    delay = 0.01
+    while True:
+        file_descriptor = os.open(lock_filename, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(file_descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            os.close(file_descriptor)
+            waited = True
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None, waited
+            time.sleep(min(delay, remaining))
+            delay = min(2 * delay, 1)
+            continue
+        try:
+            if os.fstat(file_descriptor).st_ino == os.stat(
+                    lock_filename).st_ino:
+                return file_descriptor, waited
+        except OSError:
+            pass
+        os.close(file_descriptor)
+
+
+@contextlib.contextmanager
+def single_flight(key, timeout=LOCK_TIMEOUT):
+    """Runs the enclosed code in one thread or process at a time per key.
+
+    It uses advisory locks on a file under get_lock_dir, so it works across
+    processes. The context manager yields whether it had to wait for another
+    holder of the lock, in which case the caller may find its work done. If the
+    lock is not acquired within timeout seconds the code runs without it.
+
+    Args:
+      key: string: identifier of the work, like the linter and the content.
+      timeout: float: seconds to wait for the lock.
+    """
+    lock_dir = get_lock_dir()
+    pathlib.Path(lock_dir).mkdir(parents=True, exist_ok=True)
+    lock_filename = os.path.join(lock_dir,
+                                 hashlib.sha1(key.encode('utf-8')).hexdigest())
+    file_descriptor, waited = _lock(lock_filename, timeout)
+    if waited:
+        timings.increment('single_flight_waits')
+    if file_descriptor is None:
+        timings.increment('single_flight_timeouts')
+        yield waited
+        return
+    try:
+        yield waited
+    finally:
+        try:
+            os.remove(lock_filename)
+        except OSError:
+            pass
+        os.close(file_descriptor)
+
+
+def _scratch_root():
+    """Returns the directory for scratch files, preferring a tmpfs."""
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return None
+
+
+@contextlib.contextmanager
+def scratch_file(filename, content):
+    """Writes content to a temporary file with the same basename as filename.
+
+    The file is removed when exiting the block. Keeping the basename makes the
+    linters see the same extension and report names similar to the original.
+
+    Args:
+      filename: string: the file whose content is being materialized.
+      content: bytes: the content of the file.
+
+    Yields: string: the path of the temporary file.
+    """
+    directory = tempfile.mkdtemp(prefix='git-lint-', dir=_scratch_root())
+    try:
+        scratch_filename = os.path.join(directory, os.path.basename(filename))
+        with io.open(scratch_filename, 'wb') as f:
+            f.write(content)
+        yield scratch_filename
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -13,9 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-# First part return the files being commited, excluding deleted files.
-git diff-index -z --cached HEAD --name-only --diff-filter=ACMRTUXB |
-xargs --null --no-run-if-empty git lint;
+# Lint the content being committed, as staged in the index.
+git lint --staged;
 
 if [ "$?" != "0" ]; then
   echo "There are some problems with the modified files.";
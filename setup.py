@@ -33,7 +33,7 @@ setup(
     long_description=LONG_DESCRIPTION,
     author='Sebastian Kreft',
     url='http://github.com/sk-/git-lint',
-    packages=find_packages(exclude=['test']),
+    packages=find_packages(exclude=['test', 'benchmarks']),
     package_dir={'gitlint': 'gitlint'},
     package_data={
         'gitlint': ['configs/*'],
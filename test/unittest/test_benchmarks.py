@@ -0,0 +1,78 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+from benchmarks import harness
+from benchmarks import parsing
+
+
+class HarnessTest(unittest.TestCase):
+    def test_measure(self):
+        calls = []
+        result = harness.measure(
+            lambda: calls.append('run'),
+            repeat=3,
+            setup=lambda: calls.append('setup'))
+
+        self.assertEqual(['setup', 'run'] * 3, calls)
+        self.assertEqual(3, result['repeat'])
+        self.assertLessEqual(result['min'], result['median'])
+        self.assertLessEqual(result['median'], result['max'])
+
+    def test_compare(self):
+        baseline = {
+            'fast': {
+                'median': 1.0
+            },
+            'slow': {
+                'median': 1.0
+            },
+        }
+        results = {
+            'fast': {
+                'median': 1.2
+            },
+            'slow': {
+                'median': 1.5
+            },
+            'new': {
+                'median': 10.0
+            },
+        }
+
+        self.assertEqual([('slow', 1.0, 1.5)],
+                         harness.compare(results, baseline, threshold=0.25))
+        self.assertEqual([], harness.compare(results, baseline, threshold=1))
+
+
+class ParsingTest(unittest.TestCase):
+    def test_generate_output(self):
+        templates = ['header', '{filename}:{line}: message']
+        self.assertEqual(['header', 'foo.py:1: message', 'header'],
+                         parsing.generate_output(templates, 3, 'foo.py'))
+        self.assertEqual(['header'],
+                         parsing.generate_output(templates, 1, 'foo.py'))
+
+    def test_benchmark_linter(self):
+        results = parsing.benchmark_linter(
+            'linter', {
+                'extensions': ['.py'],
+                'command': 'linter',
+                'filter': r'^{filename}:(?P<line>{lines}): (?P<message>.+)',
+            }, ['{filename}:{line}: message'], 20, 1)
+
+        self.assertEqual([
+            'linter.20.filter_lines.all', 'linter.20.filter_lines.modified',
+            'linter.20.format_comment', 'linter.20.lint_command'
+        ], sorted(results))
@@ -0,0 +1,159 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+import mock
+
+import gitlint.cache as cache
+import gitlint.timings as timings
+import gitlint.utils as utils
+
+FINGERPRINT = 'f' * 40
+HASH1 = '1' * 40
+HASH2 = '2' * 40
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        patcher = mock.patch(
+            'gitlint.utils.get_content_cache_dir', return_value=self.cache_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _write_entry(self, file_hash, content, fingerprint=FINGERPRINT):
+        directory = os.path.join(self.cache_dir, fingerprint)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with io.open(os.path.join(directory, file_hash), 'w') as f:
+            f.write(content)
+
+    def _read_entry(self, file_hash, fingerprint=FINGERPRINT):
+        with io.open(os.path.join(self.cache_dir, fingerprint,
+                                  file_hash)) as f:
+            return f.read()
+
+    def test_content_key(self):
+        key = utils.content_key('src/foo.py', HASH1)
+
+        self.assertTrue(cache.is_valid_entry('%s/%s' % (FINGERPRINT, key)))
+        self.assertEqual(key, utils.content_key('src/foo.py', HASH1))
+        self.assertEqual(
+            key, utils.content_key(os.path.join('src', 'foo.py'), HASH1))
+        self.assertNotEqual(key, utils.content_key('src/foo.py', HASH2))
+        self.assertNotEqual(key, utils.content_key('lib/foo.py', HASH1))
+
+    def test_content_cache_is_independent_of_location(self):
+        recorder = timings.enable()
+        self.addCleanup(timings.disable)
+        key = utils.content_key('foo.py', HASH1)
+
+        utils.save_output_in_content_cache(FINGERPRINT, '/clone1/foo.py',
+                                           '/clone1/foo.py:1: error', key)
+
+        self.assertEqual(
+            '/clone2/foo.py:1: error',
+            utils.get_output_from_content_cache(FINGERPRINT, '/clone2/foo.py',
+                                                key))
+        self.assertIsNone(
+            utils.get_output_from_content_cache(
+                FINGERPRINT, '/clone2/bar.py',
+                utils.content_key('bar.py', HASH1)))
+        self.assertIsNone(
+            utils.get_output_from_content_cache('0' * 40, '/clone2/foo.py',
+                                                key))
+        self.assertEqual(1, recorder.counters['content_cache_hits'])
+
+    def test_export_import(self):
+        self._write_entry(HASH1, u'output1')
+        self._write_entry(HASH2, u'output2')
+        self._write_entry('not-a-hash', u'ignored')
+        bundle = io.BytesIO()
+
+        self.assertEqual(2, cache.export_bundle(bundle))
+
+        shutil.rmtree(os.path.join(self.cache_dir, FINGERPRINT))
+        bundle.seek(0)
+        self.assertEqual(2, cache.import_bundle(bundle))
+        self.assertEqual(u'output1', self._read_entry(HASH1))
+        self.assertEqual(u'output2', self._read_entry(HASH2))
+
+    def test_export_keys(self):
+        self._write_entry(HASH1, u'output1')
+        self._write_entry(HASH2, u'output2')
+        bundle = io.BytesIO()
+
+        self.assertEqual(1, cache.export_bundle(bundle, set([HASH2])))
+
+        bundle.seek(0)
+        with tarfile.open(fileobj=bundle, mode='r:gz') as archive:
+            self.assertEqual(['%s/%s' % (FINGERPRINT, HASH2)],
+                             archive.getnames())
+
+    def test_export_empty_cache(self):
+        bundle = io.BytesIO()
+
+        with mock.patch(
+                'gitlint.utils.get_content_cache_dir',
+                return_value=os.path.join(self.cache_dir, 'missing')):
+            self.assertEqual(0, cache.export_bundle(bundle))
+
+    def test_import_skips_existing_entries(self):
+        self._write_entry(HASH1, u'output1')
+        bundle = io.BytesIO()
+        cache.export_bundle(bundle)
+        self._write_entry(HASH1, u'local')
+
+        bundle.seek(0)
+        self.assertEqual(0, cache.import_bundle(bundle))
+        self.assertEqual(u'local', self._read_entry(HASH1))
+
+    def test_import_ignores_invalid_names(self):
+        bundle = io.BytesIO()
+        with tarfile.open(fileobj=bundle, mode='w:gz') as archive:
+            for name in ('../../evil', '%s/%s/..' % (FINGERPRINT, HASH1)):
+                info = tarfile.TarInfo(name)
+                info.size = 4
+                archive.addfile(info, io.BytesIO(b'evil'))
+
+        bundle.seek(0)
+        self.assertEqual(0, cache.import_bundle(bundle))
+        self.assertEqual([], os.listdir(self.cache_dir))
+
+    def test_import_invalid_bundle(self):
+        with self.assertRaises(ValueError):
+            cache.import_bundle(io.BytesIO(b'not a bundle'))
+
+    def test_keys_since(self):
+        filename = os.path.join(self.cache_dir, 'foo.txt')
+        with io.open(filename, 'wb') as f:
+            f.write(b'hello\n')
+        vcs = mock.Mock()
+        vcs.files_changed_since.return_value = [
+            filename, os.path.join(self.cache_dir, 'deleted.txt')
+        ]
+
+        self.assertEqual(
+            set([
+                utils.content_key('foo.txt',
+                                  'ce013625030ba8dba906f756967f9e9ca394464a')
+            ]), cache.keys_since(vcs, self.cache_dir, 'HEAD'))
+        vcs.files_changed_since.assert_called_once_with(self.cache_dir, 'HEAD')
@@ -0,0 +1,213 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+import gitlint.distributed as distributed
+import gitlint.timings as timings
+import gitlint.utils as utils
+
+# pylint: disable=protected-access
+
+FINGERPRINT = 'f' * 40
+
+
+class DistributedTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.recorder = timings.enable()
+        self.addCleanup(timings.disable)
+        self.jobs = []
+
+    def run_job(self, fingerprint, path, content):
+        self.jobs.append((fingerprint, path, content))
+        if fingerprint != FINGERPRINT:
+            raise KeyError(fingerprint)
+        return u'%s: %s \u2713' % (utils.FILENAME_PLACEHOLDER,
+                                   content.decode('utf-8'))
+
+    def start_worker(self, address, run_job=None, slots=2, token=None):
+        server = distributed.make_worker(
+            address, run_job or self.run_job, slots, token=token)
+        thread = threading.Thread(target=distributed.serve, args=(server, ))
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+        return distributed.worker_address(server)
+
+    def coordinator(self, addresses, token=None):
+        coordinator = distributed.Coordinator(
+            addresses, timeout=5, token=token)
+        self.addCleanup(coordinator.close)
+        return coordinator
+
+    def test_parse_address(self):
+        self.assertEqual((socket.AF_INET, ('localhost', 8743)),
+                         distributed.parse_address('localhost:8743'))
+        self.assertEqual((socket.AF_UNIX, '/tmp/worker.sock'),
+                         distributed.parse_address('unix:/tmp/worker.sock'))
+        for address in ('localhost', 'localhost:port', ':8743'):
+            with self.assertRaises(ValueError):
+                distributed.parse_address(address)
+
+    def test_run(self):
+        addresses = [
+            self.start_worker('unix:' +
+                              os.path.join(self.directory, 'worker.sock')),
+            self.start_worker('localhost:0', slots=1),
+        ]
+        coordinator = self.coordinator(addresses)
+
+        self.assertEqual(3, coordinator.slots)
+        self.assertEqual(
+            u'/repo/a.py: content \u2713',
+            coordinator.run(FINGERPRINT, '/repo/a.py', b'content', 'a.py'))
+        self.assertEqual([(FINGERPRINT, 'a.py', b'content')], self.jobs)
+        self.assertEqual(1, self.recorder.counters['worker_jobs'])
+
+    def test_validate_path(self):
+        self.assertEqual('src/a.py', distributed.validate_path('src/a.py'))
+        for path in ('', '/etc/passwd', '../a.py', 'src/../../a.py', '-rf',
+                     '--rcfile=/tmp/x'):
+            with self.assertRaises(ValueError):
+                distributed.validate_path(path)
+
+    def test_run_invalid_path(self):
+        coordinator = self.coordinator([self.start_worker('localhost:0')])
+
+        # Not even sent to the workers.
+        self.assertIsNone(
+            coordinator.run(FINGERPRINT, '/repo/a.py', b'', '../a.py'))
+        self.assertIsNone(coordinator.run(FINGERPRINT, '/repo/a.py', b''))
+        self.assertEqual([], self.jobs)
+
+    def test_worker_rejects_invalid_path(self):
+        address = self.start_worker('localhost:0')
+        connection = distributed._Connection(address, 5)
+        self.addCleanup(connection.close)
+
+        for path in ('/etc/passwd', '../a.py', '-rf', None):
+            self.assertIn(
+                'Invalid job',
+                connection.request({
+                    'fingerprint': FINGERPRINT,
+                    'path': path,
+                    'content': ''
+                })['error'])
+        self.assertEqual([], self.jobs)
+
+    def test_run_token(self):
+        address = self.start_worker('localhost:0', token='secret')
+
+        self.assertEqual(0, self.coordinator([address]).slots)
+        self.assertEqual(0, self.coordinator([address], token='guess').slots)
+        coordinator = self.coordinator([address], token='secret')
+        self.assertEqual(2, coordinator.slots)
+        self.assertEqual(
+            u'/repo/a.py: content \u2713',
+            coordinator.run(FINGERPRINT, '/repo/a.py', b'content', 'a.py'))
+        self.assertEqual(2, self.recorder.counters['worker_errors'])
+
+    def test_run_unknown_fingerprint(self):
+        coordinator = self.coordinator([self.start_worker('localhost:0')])
+
+        self.assertIsNone(coordinator.run('0' * 40, '/repo/a.py', b'', 'a.py'))
+        self.assertEqual(1, len(self.jobs))
+        self.assertEqual(0, self.recorder.counters['worker_jobs'])
+
+    def test_run_many_jobs(self):
+        coordinator = self.coordinator([
+            self.start_worker('localhost:0', slots=3),
+            self.start_worker('localhost:0', slots=3)
+        ])
+        results = []
+
+        def run(index):
+            results.append(
+                coordinator.run(FINGERPRINT, str(index), b'content',
+                                str(index)))
+
+        threads = [
+            threading.Thread(target=run, args=(index, )) for index in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(
+            sorted(u'%d: content \u2713' % index for index in range(20)),
+            sorted(results))
+
+    def test_run_retries_failed_connections(self):
+        calls = []
+
+        def run_job(fingerprint, path, content):
+            calls.append(path)
+            if len(calls) == 1:
+                # Kills the connection, as the handler does not expect it.
+                raise RuntimeError('crash')
+            return self.run_job(fingerprint, path, content)
+
+        coordinator = self.coordinator(
+            [self.start_worker('localhost:0', run_job=run_job, slots=1)])
+
+        self.assertEqual(
+            u'/repo/a.py: content \u2713',
+            coordinator.run(FINGERPRINT, '/repo/a.py', b'content', 'a.py'))
+        self.assertEqual(['a.py', 'a.py'], calls)
+        self.assertEqual(1, self.recorder.counters['worker_retries'])
+
+    def test_run_gives_up_after_max_attempts(self):
+        def run_job(unused_fingerprint, unused_path, unused_content):
+            raise RuntimeError('crash')
+
+        coordinator = self.coordinator(
+            [self.start_worker('localhost:0', run_job=run_job, slots=1)])
+
+        self.assertIsNone(
+            coordinator.run(FINGERPRINT, '/repo/a.py', b'', 'a.py'))
+        self.assertEqual(distributed.MAX_ATTEMPTS - 1,
+                         self.recorder.counters['worker_retries'])
+
+    def test_run_without_workers(self):
+        unused_socket = os.path.join(self.directory, 'missing.sock')
+        coordinator = self.coordinator(['unix:' + unused_socket])
+
+        self.assertEqual(0, coordinator.slots)
+        self.assertIsNone(
+            coordinator.run(FINGERPRINT, '/repo/a.py', b'', 'a.py'))
+        self.assertEqual(1, self.recorder.counters['worker_errors'])
+
+    def test_enable_disable(self):
+        self.assertFalse(distributed.is_enabled())
+        self.assertEqual(0, distributed.slots())
+        self.assertIsNone(distributed.run(FINGERPRINT, '/repo/a.py', b''))
+
+        distributed.enable([self.start_worker('localhost:0', slots=2)])
+        self.addCleanup(distributed.disable)
+        self.assertTrue(distributed.is_enabled())
+        self.assertEqual(2, distributed.slots())
+        self.assertEqual(
+            u'/repo/a.py: content \u2713',
+            distributed.run(FINGERPRINT, '/repo/a.py', b'content', 'a.py'))
+
+        distributed.disable()
+        self.assertFalse(distributed.is_enabled())
@@ -0,0 +1,197 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import subprocess
+import sys
+import threading
+import time
+import unittest
+from concurrent import futures
+
+import mock
+
+import gitlint.engine as engine
+import gitlint.timings as timings
+
+# pylint: disable=protected-access
+
+
+class EngineTestMixin(object):
+    """Tests run with both engines, which are created by make_engine."""
+
+    def setUp(self):
+        self.engine = self.make_engine()
+        self.addCleanup(self.engine.close)
+
+    def make_engine(self):
+        raise NotImplementedError()
+
+    def test_popen(self):
+        content = b''.join(b'line %d\n' % i for i in range(100000))
+        process = self.engine.popen(['cat'], content=content)
+        lines = list(iter(process.stdout.readline, b''))
+        self.assertEqual(0, process.wait())
+        self.assertEqual(100000, len(lines))
+        self.assertEqual(b'line 99999\n', lines[-1])
+
+    def test_popen_not_found(self):
+        with self.assertRaises(OSError):
+            self.engine.popen(['some_unexistent_program_name'])
+
+    def test_check_output(self):
+        self.assertEqual(
+            b'foo\n',
+            self.engine.check_output(
+                ['sh', '-c', 'echo foo >&2'], stderr=subprocess.STDOUT))
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.engine.check_output(['false'])
+
+    def test_check_output_cancel(self):
+        # Like git blame, which has to be killed on cancel too.
+        executor = futures.ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        output = executor.submit(self.engine.check_output, ['sleep', '30'])
+        while not self.engine._processes and not output.done():
+            time.sleep(0.01)
+
+        self.engine.cancel()
+        with self.assertRaises(engine.Cancelled):
+            output.result(timeout=5)
+        with self.assertRaises(engine.Cancelled):
+            self.engine.check_output(['true'])
+
+    def test_limit(self):
+        first = self.engine.popen(['cat'], content=b'', limit=('l', 1))
+        executor = futures.ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        second = executor.submit(self.engine.popen, ['true'], limit=('l', 1))
+        with self.assertRaises(futures.TimeoutError):
+            second.result(timeout=0.2)
+        # Other keys are not limited.
+        self.engine.popen(['true'], limit=('other', 1)).wait()
+
+        first.stdout.read()
+        first.wait()
+        self.assertEqual(0, second.result(timeout=5).wait())
+
+    def test_cancel(self):
+        process = self.engine.popen(['sleep', '30'])
+        done = threading.Event()
+        waiter = threading.Thread(target=lambda: (process.wait(), done.set()))
+        waiter.start()
+
+        self.engine.cancel()
+        waiter.join(5)
+        self.assertTrue(done.is_set())
+        self.assertTrue(self.engine.is_cancelled())
+        with self.assertRaises(engine.Cancelled):
+            self.engine.popen(['true'])
+
+    def test_cancel_kills_group(self):
+        # The shell waits for sleep, which keeps the output open.
+        process = self.engine.popen(['sh', '-c', 'sleep 30; echo done'])
+        done = threading.Event()
+        waiter = threading.Thread(
+            target=lambda: (process.stdout.read(), done.set()))
+        waiter.start()
+
+        self.engine.cancel()
+        waiter.join(5)
+        self.assertTrue(done.is_set())
+        process.wait()
+
+
+class ThreadEngineTest(EngineTestMixin, unittest.TestCase):
+    def make_engine(self):
+        return engine.ThreadEngine()
+
+    def test_records_child_usage(self):
+        recorder = timings.enable()
+        self.addCleanup(timings.disable)
+        with timings.span('linter', timings.LINTER):
+            process = self.engine.popen(['sh', '-c', 'exit 3'])
+            process.stdout.read()
+            self.assertEqual(3, process.wait())
+
+        span = recorder.spans[0]
+        self.assertGreaterEqual(span.child_cpu, 0)
+        self.assertGreater(span.max_rss, 0)
+
+    def test_wait_killed(self):
+        process = self.engine.popen(['sleep', '30'])
+        process.kill()
+        self.assertEqual(-9, process.wait())
+
+
+@unittest.skipUnless(sys.version_info >= (3, 8),
+                     'The asyncio engine requires Python 3.8')
+class AsyncioEngineTest(EngineTestMixin, unittest.TestCase):
+    def make_engine(self):
+        return engine.AsyncioEngine(4)
+
+    def test_max_subprocesses(self):
+        limited = engine.AsyncioEngine(1)
+        self.addCleanup(limited.close)
+        first = limited.popen(['cat'], content=b'')
+        executor = futures.ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown)
+        second = executor.submit(limited.popen, ['true'])
+        with self.assertRaises(futures.TimeoutError):
+            second.result(timeout=0.2)
+
+        first.stdout.read()
+        first.wait()
+        self.assertEqual(0, second.result(timeout=5).wait())
+
+
+class ModuleTest(unittest.TestCase):
+    def tearDown(self):
+        engine.stop()
+
+    def test_start_invalid(self):
+        with self.assertRaises(ValueError):
+            engine.start('foo')
+
+    def test_start_threads(self):
+        self.assertIsInstance(
+            engine.start(engine.THREADS), engine.ThreadEngine)
+        self.assertEqual(b'foo\n', engine.check_output(['echo', 'foo']))
+
+    def test_start_jobs(self):
+        engine.start(engine.THREADS, 3)
+        self.assertEqual(3, engine.concurrency())
+
+    @unittest.skipUnless(sys.version_info >= (3, 8),
+                         'The asyncio engine requires Python 3.8')
+    def test_start_asyncio_jobs(self):
+        started = engine.start(engine.ASYNCIO, 3)
+        # The jobs are only the default of the subprocesses.
+        self.assertEqual(6, engine.concurrency())
+        self.assertEqual(6, started.max_subprocesses)
+
+    def test_default_jobs(self):
+        with mock.patch('gitlint.parallelism.available_cpus', return_value=5):
+            engine.start(engine.THREADS)
+            self.assertEqual(5, engine.concurrency())
+
+    @unittest.skipUnless(sys.version_info >= (3, 8),
+                         'The asyncio engine requires Python 3.8')
+    def test_start_asyncio(self):
+        started = engine.start(engine.ASYNCIO, 4, max_subprocesses=8)
+        # Not limited by the jobs, the threads only wait for the loop.
+        self.assertEqual(8, engine.concurrency())
+        process = engine.popen(['echo', 'foo'])
+        self.assertEqual(b'foo\n', process.stdout.read())
+        self.assertEqual(0, process.wait())
+        self.assertIs(started, engine.stop())
+        self.assertIsInstance(engine._ENGINE, engine.ThreadEngine)
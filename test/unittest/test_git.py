@@ -11,6 +11,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import io
 import os
 import subprocess
 import unittest
@@ -18,23 +19,25 @@ import unittest
 import mock
 
 import gitlint.git as git
+import gitlint.timings as timings
 
 # pylint: disable=too-many-public-methods
 
 
 class GitTest(unittest.TestCase):
-    @mock.patch('subprocess.check_output', return_value=b'/home/user/repo\n')
+    @mock.patch(
+        'gitlint.engine.check_output', return_value=b'/home/user/repo\n')
     def test_repository_root_ok(self, check_output):
         self.assertEqual('/home/user/repo', git.repository_root())
         check_output.assert_called_once_with(
             ['git', 'rev-parse', '--show-toplevel'], stderr=subprocess.STDOUT)
 
-    @mock.patch('subprocess.check_output')
+    @mock.patch('gitlint.engine.check_output')
     def test_repository_root_error(self, check_output):
         check_output.side_effect = subprocess.CalledProcessError(1, '', '')
         self.assertEqual(None, git.repository_root())
 
-    @mock.patch('subprocess.check_output')
+    @mock.patch('gitlint.engine.check_output')
     def test_modified_files(self, check_output):
         check_output.return_value = os.linesep.join([
             'A  docs/file1.txt', 'M  data/file2.json', 'D  file3.py',
@@ -53,7 +56,7 @@ class GitTest(unittest.TestCase):
             '--ignore-submodules=all'
         ])
 
-    @mock.patch('subprocess.check_output')
+    @mock.patch('gitlint.engine.check_output')
     def test_modified_files_tracked_only(self, check_output):
         check_output.return_value = os.linesep.join([
             'A  docs/file1.txt', 'M  data/file2.json', 'D  file3.py',
@@ -70,7 +73,7 @@ class GitTest(unittest.TestCase):
             '--ignore-submodules=all'
         ])
 
-    @mock.patch('subprocess.check_output')
+    @mock.patch('gitlint.engine.check_output')
     def test_modified_files_with_spaces(self, check_output):
         check_output.return_value = os.linesep.join(
             ['A  "docs/file 1.txt"', 'M  "data/file 2.json"']).encode('utf-8')
@@ -84,7 +87,7 @@ class GitTest(unittest.TestCase):
             '--ignore-submodules=all'
         ])
 
-    @mock.patch('subprocess.check_output', return_value=b'')
+    @mock.patch('gitlint.engine.check_output', return_value=b'')
     def test_modified_files_nothing_changed(self, check_output):
         self.assertEqual({}, git.modified_files('/home/user/repo'))
         check_output.assert_called_once_with([
@@ -92,7 +95,7 @@ class GitTest(unittest.TestCase):
             '--ignore-submodules=all'
         ])
 
-    @mock.patch('subprocess.check_output')
+    @mock.patch('gitlint.engine.check_output')
     def test_modified_files_with_commit(self, check_output):
         check_output.return_value = os.linesep.join([
             'M\ttest/e2etest/data/bash/error.sh',
@@ -116,7 +119,7 @@ class GitTest(unittest.TestCase):
         with self.assertRaises(AssertionError):
             git.modified_files('foo/bar')
 
-    @mock.patch('subprocess.check_output')
+    @mock.patch('gitlint.engine.check_output')
     def test_modified_lines(self, check_output):
         check_output.return_value = os.linesep.join([
             'baz', '0000000000000000000000000000000000000000 2 2 4', 'foo',
@@ -141,7 +144,7 @@ class GitTest(unittest.TestCase):
         ] * 3
         self.assertEqual(expected_calls, check_output.call_args_list)
 
-    @mock.patch('subprocess.check_output')
+    @mock.patch('gitlint.engine.check_output')
     def test_modified_lines_with_commit(self, check_output):
         check_output.return_value = os.linesep.join([
             'baz', '0123456789abcdef31410123456789abcdef3141 2 2 4', 'foo',
@@ -189,13 +192,260 @@ class GitTest(unittest.TestCase):
                              git.modified_lines('/home/user/repo/foo/bar.txt',
                                                 None)))
 
-    @mock.patch('subprocess.check_output', return_value=b'0a' * 20 + b'\n')
+    @mock.patch('gitlint.engine.check_output', return_value=b'0a' * 20 + b'\n')
     def test_last_commit(self, check_output):
         self.assertEqual('0a' * 20, git.last_commit())
         check_output.assert_called_once_with(
             ['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT)
 
-    @mock.patch('subprocess.check_output')
+    @mock.patch('gitlint.engine.check_output')
     def test_last_commit_not_in_repo(self, check_output):
         check_output.side_effect = subprocess.CalledProcessError(255, '', '')
         self.assertEqual(None, git.last_commit())
+
+    @mock.patch('gitlint.engine.check_output')
+    def test_files_changed_since(self, check_output):
+        check_output.return_value = b'docs/file1.txt\0file2.py\0'
+
+        self.assertEqual(
+            ['/home/user/repo/docs/file1.txt', '/home/user/repo/file2.py'],
+            git.files_changed_since('/home/user/repo', 'v1.0'))
+        check_output.assert_called_once_with(
+            ['git', 'diff', '--name-only', '-z', 'v1.0', '--'])
+
+    @mock.patch('gitlint.engine.check_output')
+    def test_staged_files(self, check_output):
+        check_output.return_value = b'M\0docs/file1.txt\0A\0file2.py\0'
+
+        self.assertEqual({
+            '/home/user/repo/docs/file1.txt': 'M ',
+            '/home/user/repo/file2.py': 'A ',
+        }, git.staged_files('/home/user/repo'))
+        check_output.assert_called_once_with([
+            'git', 'diff', '--cached', '--name-status', '-z', '--no-renames',
+            '--diff-filter=AM'
+        ])
+
+    @mock.patch('subprocess.Popen')
+    def test_staged_contents(self, popen):
+        popen.return_value.stdout = io.BytesIO(b'\n'.join([
+            b'0a' * 20 + b' blob 6', b'line1\n', b':missing.py missing',
+            b'0b' * 20 + b' blob 0', b''
+        ]))
+
+        self.assertEqual(
+            {
+                '/home/user/repo/foo.py': b'line1\n',
+                '/home/user/repo/empty.py': b'',
+            },
+            git.staged_contents('/home/user/repo', [
+                '/home/user/repo/foo.py', '/home/user/repo/missing.py',
+                '/home/user/repo/empty.py'
+            ]))
+        popen.assert_called_once_with(
+            ['git', 'cat-file', '--batch'],
+            cwd='/home/user/repo',
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE)
+        self.assertEqual([
+            mock.call(b':foo.py\n'),
+            mock.call(b':missing.py\n'),
+            mock.call(b':empty.py\n')
+        ], popen.return_value.stdin.write.call_args_list)
+
+    @mock.patch('gitlint.engine.check_output')
+    def test_staged_modified_lines(self, check_output):
+        check_output.return_value = b'\n'.join([
+            b'diff --git a/foo.py b/foo.py', b'--- a/foo.py', b'+++ b/foo.py',
+            b'@@ -3 +3 @@ def foo():', b'-a', b'+b', b'@@ -10,0 +11,2 @@',
+            b'+c', b'+d', b'@@ -20,2 +22,0 @@', b'-e', b'-f'
+        ])
+
+        self.assertEqual([3, 11, 12],
+                         git.staged_modified_lines('/home/user/repo/foo.py',
+                                                   'M '))
+        check_output.assert_called_once_with([
+            'git', 'diff', '--cached', '-U0', '--no-color', '--no-ext-diff',
+            '--', '/home/user/repo/foo.py'
+        ])
+
+    def test_staged_modified_lines_new_addition(self):
+        self.assertEqual(
+            None, git.staged_modified_lines('/home/user/repo/foo.py', 'A '))
+
+    def test_staged_modified_lines_no_info(self):
+        self.assertEqual([],
+                         git.staged_modified_lines('/home/user/repo/foo.py',
+                                                   None))
+
+    @mock.patch('os.path.isfile', side_effect=lambda name: 'sub' not in name)
+    @mock.patch('gitlint.utils.output_fields')
+    def test_tracked_files(self, output_fields, unused_isfile):
+        sha = b'1' * 40
+        output_fields.side_effect = [
+            iter([b'dirty.py']),
+            iter([
+                b'100644 ' + sha + b' 0\ta.py',
+                b'100644 ' + sha + b' 0\tdocs/b.txt',
+                b'100644 ' + sha + b' 0\tdirty.py',
+                b'120000 ' + sha + b' 0\tlink',
+                b'100644 ' + sha + b' 1\tconflict.py',
+                b'100644 ' + sha + b' 2\tconflict.py',
+                b'160000 ' + sha + b' 0\tsub',
+            ])
+        ]
+
+        self.assertEqual([
+            ('/home/user/repo/a.py', '1' * 40),
+            ('/home/user/repo/docs/b.txt', '1' * 40),
+            ('/home/user/repo/dirty.py', None),
+            ('/home/user/repo/link', None),
+            ('/home/user/repo/conflict.py', None),
+        ], list(git.tracked_files('/home/user/repo')))
+        self.assertEqual([
+            mock.call(
+                ['git', 'diff-files', '--name-only', '-z', '--', '.'],
+                cwd='/home/user/repo'),
+            mock.call(
+                ['git', 'ls-files', '-s', '-z', '--', '.'],
+                cwd='/home/user/repo')
+        ], output_fields.call_args_list)
+
+    @mock.patch('os.path.isfile', return_value=True)
+    @mock.patch('gitlint.utils.output_fields', return_value=iter([]))
+    def test_tracked_files_with_paths(self, output_fields, unused_isfile):
+        self.assertEqual(
+            [],
+            list(
+                git.tracked_files(
+                    '/home/user/repo',
+                    ['/home/user/repo/docs', '/home/user/repo/a'])))
+        output_fields.assert_called_with(
+            ['git', 'ls-files', '-s', '-z', '--', 'docs', 'a'],
+            cwd='/home/user/repo')
+
+    @mock.patch('gitlint.engine.check_output', return_value=b'1111\n2222\n')
+    def test_commits(self, check_output):
+        self.assertEqual(['1111', '2222'],
+                         git.commits('/home/user/repo', 'v1..v2'))
+        check_output.assert_called_once_with(
+            ['git', 'rev-list', '--no-merges', '--reverse', 'v1..v2', '--'],
+            stderr=subprocess.STDOUT)
+
+    @mock.patch('gitlint.engine.check_output', return_value=b'1111\n')
+    def test_commits_no_walk(self, check_output):
+        self.assertEqual(['1111'],
+                         git.commits('/home/user/repo', 'HEAD', walk=False))
+        check_output.assert_called_once_with(
+            ['git', 'rev-list', '--no-merges', '--no-walk', 'HEAD', '--'],
+            stderr=subprocess.STDOUT)
+
+    @mock.patch('gitlint.engine.check_output')
+    def test_commit_changes(self, check_output):
+        check_output.return_value = b'\n'.join([
+            b'diff --git a/foo.py b/foo.py', b'--- a/foo.py', b'+++ b/foo.py',
+            b'@@ -3 +3 @@', b'-a', b'+b', b'diff --git a/new.py b/new.py',
+            b'new file mode 100644', b'--- /dev/null', b'+++ b/new.py',
+            b'@@ -0,0 +1 @@', b'+new'
+        ])
+
+        self.assertEqual([('/home/user/repo/foo.py', [3]),
+                          ('/home/user/repo/new.py', None)],
+                         git.commit_changes('/home/user/repo', '1111'))
+        check_output.assert_called_once_with([
+            'git', '-c', 'core.quotePath=false', 'diff-tree', '-r', '--root',
+            '--no-commit-id', '-p', '-U0', '--no-renames', '--diff-filter=AM',
+            '--no-color', '--no-ext-diff', '1111'
+        ])
+
+    @mock.patch('gitlint.engine.check_output')
+    def test_commit_changes_non_ascii(self, check_output):
+        check_output.return_value = b'\n'.join([
+            u'diff --git a/caf\xe9.py b/caf\xe9.py'.encode('utf-8'),
+            u'+++ b/caf\xe9.py'.encode('utf-8'), b'@@ -3 +3 @@',
+            b'diff --git "a/q\\"t.py" "b/q\\"t.py"', b'+++ "b/q\\"t.py"',
+            b'@@ -1 +1 @@'
+        ])
+
+        self.assertEqual([(u'/home/user/repo/caf\xe9.py', [3]),
+                          ('/home/user/repo/q"t.py', [1])],
+                         git.commit_changes('/home/user/repo', '1111'))
+
+    @mock.patch('subprocess.Popen')
+    def test_commit_reader(self, popen):
+        popen.return_value.stdout = io.BytesIO(b'\n'.join(
+            [b'0a' * 20 + b' blob 6', b'line1\n', b'1111:b.py missing', b'']))
+
+        reader = git.CommitReader('/home/user/repo')
+        self.assertEqual(b'line1\n',
+                         reader.read('1111', '/home/user/repo/a/b.py'))
+        self.assertIsNone(reader.read('1111', '/home/user/repo/b.py'))
+        reader.close()
+
+        self.assertEqual([
+            mock.call(b'1111:a/b.py\n'),
+            mock.call(b'1111:b.py\n'),
+        ], popen.return_value.stdin.write.call_args_list)
+        popen.return_value.wait.assert_called_once_with()
+
+    @mock.patch('subprocess.Popen')
+    def test_commit_reader_timings(self, popen):
+        popen.return_value.stdout = io.BytesIO(b'\n'.join(
+            [b'1111:a.py missing', b'1111:b.py missing', b'']))
+
+        recorder = timings.enable()
+        self.addCleanup(timings.disable)
+        reader = git.CommitReader('/home/user/repo')
+        reader.read('1111', '/home/user/repo/a.py')
+        reader.read('1111', '/home/user/repo/b.py')
+        reader.close()
+
+        # The reads are not subprocesses, only the start of cat-file is.
+        self.assertEqual([timings.SUBPROCESS, timings.IO, timings.IO],
+                         [span.category for span in recorder.spans])
+
+    @mock.patch('subprocess.Popen')
+    def test_commit_reader_not_blobs(self, popen):
+        popen.return_value.stdout = io.BytesIO(b'\n'.join([
+            b'1111:sp ace.py missing',
+            b'0a' * 20 + b' tree 5',
+            b'tree\n',
+            b'0b' * 20 + b' blob 6',
+            b'line1\n',
+            b'',
+        ]))
+
+        reader = git.CommitReader('/home/user/repo')
+        self.assertIsNone(reader.read('1111', '/home/user/repo/sp ace.py'))
+        self.assertIsNone(reader.read('1111', '/home/user/repo/a'))
+        self.assertEqual(b'line1\n',
+                         reader.read('1111', '/home/user/repo/a/b.py'))
+        reader.close()
+
+    @mock.patch('subprocess.Popen')
+    def test_commit_reader_exited(self, popen):
+        popen.return_value.stdout = io.BytesIO(b'')
+        popen.return_value.wait.return_value = 128
+
+        reader = git.CommitReader('/home/user/repo')
+        # Git exits on paths outside the repository, so they are not read.
+        self.assertIsNone(reader.read('1111', '/home/user/a.py'))
+        popen.return_value.stdin.write.assert_not_called()
+        with self.assertRaises(IOError) as context:
+            reader.read('1111', '/home/user/repo/a.py')
+        self.assertIn('exited with status 128', str(context.exception))
+
+    @mock.patch('gitlint.engine.check_output', return_value=b'content')
+    def test_committed_content(self, check_output):
+        self.assertEqual(
+            b'content',
+            git.committed_content('/home/user/repo', '/home/user/repo/a/b.py'))
+        check_output.assert_called_once_with(
+            ['git', 'cat-file', 'blob', 'HEAD:a/b.py'],
+            stderr=subprocess.STDOUT)
+
+    @mock.patch('gitlint.engine.check_output')
+    def test_committed_content_new_file(self, check_output):
+        check_output.side_effect = subprocess.CalledProcessError(128, '', '')
+        self.assertIsNone(
+            git.committed_content('/home/user/repo', '/home/user/repo/a.py'))
@@ -15,7 +15,9 @@
 import io
 import json
 import os
+import subprocess
 import sys
+import threading
 
 import mock
 from pyfakefs import fake_filesystem_unittest
@@ -108,7 +110,6 @@ class GitLintTest(fake_filesystem_unittest.TestCase):
         expected = {
             file_outside_repo: 'does not belong to repository',
             inexistent_file: 'does not exist',
-            directory_in_repo: 'Directories are not yet supported',
         }
 
         self.fs.create_file(file_outside_repo)
@@ -241,13 +242,10 @@ class GitLintTest(fake_filesystem_unittest.TestCase):
             self.filename: {
                 'skipped': ['skipped1', 'skipped2'],
                 'error': ['error1', 'error2'],
-                'comments': [{
-                    'line': 3,
-                    'message': 'message1'
-                }, {
-                    'line': 4,
-                    'message': 'message2'
-                }]
+                'comments': [
+                    gitlint.linters.Comment(line=3, message='message1'),
+                    gitlint.linters.Comment(line=4, message='message2'),
+                ]
             }
         }, {
             self.filename2: {
@@ -280,6 +278,1120 @@ class GitLintTest(fake_filesystem_unittest.TestCase):
                 ['git-lint', '--json'], stdout=self.stdout, stderr=None))
         self.assertEqual(expected_response, json.loads(self.stdout.getvalue()))
 
+    def test_main_timings(self):
+        lint_response = {self.filename: {'comments': []}}
+        self.lint.return_value = lint_response
+
+        self.assertEqual(
+            0,
+            gitlint.main(
+                ['git-lint', '--timings'], stdout=self.stdout, stderr=None))
+        self.assertIn('modified_files', self.stdout.getvalue())
+        self.assertIn('Cache: 0 hits, 0 misses, 0 content hits, 0 remote hits',
+                      self.stdout.getvalue())
+
+    def test_main_timings_json(self):
+        lint_response = {self.filename: {'comments': []}}
+        self.lint.return_value = lint_response
+
+        self.assertEqual(
+            0,
+            gitlint.main(
+                ['git-lint', '--json', '--timings'],
+                stdout=self.stdout,
+                stderr=None))
+        result = json.loads(self.stdout.getvalue())
+        self.assertEqual(
+            ['vcs_discovery', 'config', 'modified_files', 'modified_lines'],
+            [phase['name'] for phase in result['timings']['phases']])
+        self.assertEqual({
+            'hits': 0,
+            'misses': 0,
+            'content_hits': 0,
+            'remote_hits': 0
+        }, result['timings']['cache'])
+
+    def test_main_trace(self):
+        lint_response = {self.filename: {'comments': []}}
+        self.lint.return_value = lint_response
+        trace_filename = os.path.join(self.root, 'trace.json')
+
+        self.assertEqual(
+            0,
+            gitlint.main(
+                ['git-lint', '--trace', trace_filename],
+                stdout=self.stdout,
+                stderr=None))
+        self.assertNotIn('Cache:', self.stdout.getvalue())
+        with open(trace_filename) as f:
+            trace = json.load(f)
+        names = set(event['name'] for event in trace['traceEvents'])
+        self.assertTrue(
+            set(['vcs_discovery', 'modified_files', 'process_file',
+                 'render']).issubset(names))
+
+    def test_main_cache_export(self):
+        with mock.patch(
+                'gitlint.cache.export_bundle', return_value=3) as export:
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint', 'cache', 'export'],
+                    stdout=self.stdout,
+                    stderr=self.stderr))
+        export.assert_called_once_with(self.stdout, keys=None)
+        self.assertEqual('Exported 3 cache entries' + os.linesep,
+                         self.stderr.getvalue())
+        self.lint.assert_not_called()
+
+    def test_main_cache_export_since(self):
+        with mock.patch('gitlint.cache.export_bundle', return_value=1) as \
+                export, mock.patch('gitlint.git.files_changed_since',
+                                   return_value=[self.filename]):
+            self.fs.create_file(self.filename, contents='hello\n')
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint', 'cache', 'export', '--since=HEAD'],
+                    stdout=self.stdout,
+                    stderr=self.stderr))
+        export.assert_called_once_with(
+            self.stdout,
+            keys=set([
+                gitlint.utils.content_key(
+                    'changed.py', 'ce013625030ba8dba906f756967f9e9ca394464a')
+            ]))
+
+    def test_main_cache_import(self):
+        self.fs.create_file('/bundle.tar.gz', contents='bundle')
+        with mock.patch(
+                'gitlint.cache.import_bundle', return_value=2) as import_:
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint', 'cache', 'import', '/bundle.tar.gz'],
+                    stdout=self.stdout,
+                    stderr=self.stderr))
+        self.assertEqual(1, import_.call_count)
+
+    def test_main_cache_import_invalid(self):
+        self.fs.create_file('/bundle.tar.gz', contents='bundle')
+        with mock.patch(
+                'gitlint.cache.import_bundle',
+                side_effect=ValueError('Invalid bundle')):
+            self.assertEqual(
+                2,
+                gitlint.main(
+                    ['git-lint', 'cache', 'import', '/bundle.tar.gz'],
+                    stdout=self.stdout,
+                    stderr=self.stderr))
+        self.assertIn('Invalid bundle', self.stderr.getvalue())
+
+    def test_main_remote_cache(self):
+        self.lint.return_value = {self.filename: {'comments': []}}
+        with mock.patch('gitlint.remote_cache.enable') as enable, \
+                mock.patch('gitlint.remote_cache.disable') as disable:
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint', '--remote-cache=http://cache:8742'],
+                    stdout=self.stdout,
+                    stderr=None))
+        enable.assert_called_once_with('http://cache:8742')
+        disable.assert_called_once_with()
+
+    def test_main_remote_cache_from_environment(self):
+        self.lint.return_value = {self.filename: {'comments': []}}
+        with mock.patch('gitlint.remote_cache.enable') as enable, \
+                mock.patch('gitlint.remote_cache.disable'), \
+                mock.patch.dict(
+                    os.environ,
+                    {'GIT_LINT_REMOTE_CACHE': 'http://cache:8742'}):
+            self.assertEqual(
+                0, gitlint.main(['git-lint'], stdout=self.stdout, stderr=None))
+        enable.assert_called_once_with('http://cache:8742')
+
+    def test_main_cache_serve(self):
+        with mock.patch('gitlint.remote_cache.Server') as server, \
+                mock.patch('gitlint.remote_cache.serve') as serve:
+            server.return_value.server_address = ('127.0.0.1', 9000)
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    [
+                        'git-lint', 'cache', 'serve', '--port=9000',
+                        '--directory=/cache'
+                    ],
+                    stdout=self.stdout,
+                    stderr=self.stderr))
+        server.assert_called_once_with(('localhost', 9000), '/cache')
+        serve.assert_called_once_with(server.return_value)
+        self.assertEqual(
+            'Serving /cache on http://localhost:9000/' + os.linesep,
+            self.stderr.getvalue())
+
+    def test_main_cache_serve_invalid_port(self):
+        self.assertEqual(
+            2,
+            gitlint.main(
+                ['git-lint', 'cache', 'serve', '--port=foo'],
+                stdout=self.stdout,
+                stderr=self.stderr))
+        self.assertIn('Could not start the cache server',
+                      self.stderr.getvalue())
+
+    def test_main_workers(self):
+        self.lint.return_value = {self.filename: {'comments': []}}
+        with mock.patch('gitlint.distributed.enable') as enable, \
+                mock.patch('gitlint.distributed.disable') as disable:
+            enable.return_value.slots = 0
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint', '--workers=host1:1,unix:/w.sock'],
+                    stdout=self.stdout,
+                    stderr=self.stderr))
+        enable.assert_called_once_with(['host1:1', 'unix:/w.sock'], token=None)
+        disable.assert_called_once_with()
+        self.assertIn('Could not connect to any worker',
+                      self.stderr.getvalue())
+
+    def test_main_worker(self):
+        with mock.patch.dict(os.environ,
+                             {'GIT_LINT_WORKER_TOKEN': 'secret'}), \
+                mock.patch('gitlint.distributed.make_worker') as make_worker, \
+                mock.patch('gitlint.distributed.serve') as serve, \
+                mock.patch('gitlint.distributed.worker_address',
+                           return_value='unix:/w.sock'):
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    [
+                        'git-lint', 'worker', '--listen=unix:/w.sock',
+                        '--slots=3'
+                    ],
+                    stdout=self.stdout,
+                    stderr=self.stderr))
+        make_worker.assert_called_once_with(
+            'unix:/w.sock', mock.ANY, 3, token='secret')
+        serve.assert_called_once_with(make_worker.return_value)
+        self.assertIn('Worker listening on unix:/w.sock with 3 slots',
+                      self.stderr.getvalue())
+
+    def test_main_worker_invalid_slots(self):
+        self.assertEqual(
+            2,
+            gitlint.main(
+                ['git-lint', 'worker', '--slots=0'],
+                stdout=self.stdout,
+                stderr=self.stderr))
+        self.assertIn('Could not start the worker', self.stderr.getvalue())
+
+    def test_main_staged(self):
+        def lint(filename, *unused_args, **unused_kwargs):
+            return {filename: {'comments': []}}
+
+        self.lint.side_effect = lint
+        with mock.patch('gitlint.git.staged_files',
+                        return_value={self.filename: 'M ',
+                                      self.filename2: 'A '}), \
+                mock.patch('gitlint.git.staged_contents',
+                           return_value={self.filename: b'staged',
+                                         self.filename2: b'new'}) as \
+                staged_contents, \
+                mock.patch('gitlint.git.staged_modified_lines',
+                           return_value=[2]) as staged_modified_lines:
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint', '--staged'], stdout=self.stdout, stderr=None))
+
+        staged_contents.assert_called_once_with(
+            self.root, [self.filename, self.filename2])
+        self.assertEqual(
+            [mock.call(self.filename, 'M '),
+             mock.call(self.filename2, 'A ')],
+            staged_modified_lines.call_args_list)
+        self.assertEqual([
+            mock.call(self.filename, [2], mock.ANY, content=b'staged'),
+            mock.call(self.filename2, [2], mock.ANY, content=b'new')
+        ], self.lint.call_args_list)
+        self.git_modified_files.assert_not_called()
+        self.git_modified_lines.assert_not_called()
+
+    def test_main_staged_with_filenames(self):
+        self.lint.return_value = {self.filename2: {'comments': []}}
+        self.fs.create_file(self.filename2)
+        with mock.patch('gitlint.git.staged_files',
+                        return_value={self.filename: 'M ',
+                                      self.filename2: 'A '}), \
+                mock.patch('gitlint.git.staged_contents',
+                           return_value={self.filename2: b'new'}) as \
+                staged_contents, \
+                mock.patch('gitlint.git.staged_modified_lines',
+                           return_value=None):
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint', '--staged', self.filename2],
+                    stdout=self.stdout,
+                    stderr=None))
+
+        staged_contents.assert_called_once_with(self.root, [self.filename2])
+        self.lint.assert_called_once_with(
+            self.filename2, None, mock.ANY, content=b'new')
+
+    def test_main_staged_hg(self):
+        self.git_repository_root.return_value = None
+        self.hg_repository_root.return_value = self.root
+        self.assertEqual(
+            2,
+            gitlint.main(
+                ['git-lint', '--staged'],
+                stdout=self.stdout,
+                stderr=self.stderr))
+        self.assertIn('--staged is only supported for git',
+                      self.stderr.getvalue())
+
+    def test_main_stdin_filename(self):
+        self.lint.return_value = {self.filename: {'comments': []}}
+        stdin = io.BytesIO(b'a\nB\nc\n')
+        with mock.patch(
+                'gitlint.git.committed_content',
+                return_value=b'a\nb\nc\n') as committed_content:
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint', '--stdin-filename', 'changed.py'],
+                    stdout=self.stdout,
+                    stderr=None,
+                    stdin=stdin))
+
+        committed_content.assert_called_once_with(self.root, self.filename)
+        self.lint.assert_called_once_with(
+            self.filename, [2], mock.ANY, content=b'a\nB\nc\n')
+        self.git_modified_files.assert_not_called()
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_main_stdin_filename_outside_repository(self):
+        self.assertEqual(
+            2,
+            gitlint.main(
+                ['git-lint', '--stdin-filename', '/tmp/foo.py'],
+                stdout=self.stdout,
+                stderr=self.stderr,
+                stdin=io.BytesIO(b'')))
+        self.assertIn('does not belong to repository', self.stderr.getvalue())
+        self.lint.assert_not_called()
+
+    def test_main_all(self):
+        def lint(filename, *unused_args, **unused_kwargs):
+            return {filename: {'comments': []}}
+
+        self.lint.side_effect = lint
+        with mock.patch(
+                'gitlint.git.tracked_files',
+                return_value=iter([(self.filename, None),
+                                   (self.filename2,
+                                    '1' * 40)])) as tracked_files:
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint', '--all'], stdout=self.stdout, stderr=None))
+
+        tracked_files.assert_called_once_with(self.root, [self.root])
+        self.assertEqual([
+            mock.call(self.filename, ' M', commit=None),
+            mock.call(self.filename2, None, commit=None)
+        ], self.git_modified_lines.call_args_list)
+        self.assertIn(os.path.basename(self.filename2), self.stdout.getvalue())
+
+    def test_main_all_force(self):
+        self.lint.return_value = {self.filename2: {'comments': []}}
+        with mock.patch(
+                'gitlint.git.tracked_files',
+                return_value=iter([(self.filename2, '1' * 40)])):
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint', '--all', '--force'],
+                    stdout=self.stdout,
+                    stderr=None))
+
+        self.git_modified_files.assert_not_called()
+        self.lint.assert_called_once_with(
+            self.filename2, None, mock.ANY, file_hash='1' * 40)
+
+    def test_main_all_with_filenames(self):
+        self.assertEqual(
+            2,
+            gitlint.main(
+                ['git-lint', '--all', self.filename],
+                stdout=self.stdout,
+                stderr=self.stderr))
+        self.assertIn('--all does not accept filenames',
+                      self.stderr.getvalue())
+
+    def test_main_directory(self):
+        def lint(filename, *unused_args, **unused_kwargs):
+            return {filename: {'comments': []}}
+
+        self.lint.side_effect = lint
+        directory = os.path.join(self.root, 'docs')
+        filename = os.path.join(directory, 'index.rst')
+        self.fs.create_file(self.filename)
+        self.fs.create_file(filename)
+        with mock.patch(
+                'gitlint.git.tracked_files',
+                return_value=iter([(filename, None),
+                                   (self.filename, None)])) as tracked_files:
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint', 'changed.py', 'docs'],
+                    stdout=self.stdout,
+                    stderr=None))
+
+        tracked_files.assert_called_once_with(self.root, [directory])
+        # Files given explicitly and also found in the directories are linted
+        # only once.
+        self.assertEqual([
+            mock.call(self.filename, [3, 14], mock.ANY),
+            mock.call(filename, [3, 14], mock.ANY)
+        ], self.lint.call_args_list)
+
+    def test_main_shard(self):
+        def lint(filename, *unused_args, **unused_kwargs):
+            return {filename: {'comments': []}}
+
+        self.lint.side_effect = lint
+        self.git_modified_files.return_value = {
+            self.filename: ' M',
+            self.filename2: ' M'
+        }
+        weights_filename = os.path.join(self.root, 'weights.json')
+        self.fs.create_file(
+            weights_filename,
+            contents=json.dumps({
+                'timings': {
+                    'jobs': [{
+                        'filename': 'changed.py',
+                        'wall': 2.0
+                    }, {
+                        'filename': 'foo.txt',
+                        'wall': 1.0
+                    }]
+                }
+            }))
+
+        linted = []
+        for shard in ('1/2', '2/2'):
+            self.lint.reset_mock()
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    [
+                        'git-lint', '--shard', shard, '--shard-weights',
+                        weights_filename
+                    ],
+                    stdout=self.stdout,
+                    stderr=None))
+            linted.append([call[0][0] for call in self.lint.call_args_list])
+
+        self.assertEqual([[self.filename], [self.filename2]], linted)
+
+    def test_main_shard_invalid(self):
+        self.assertEqual(
+            2,
+            gitlint.main(
+                ['git-lint', '--shard', '3/2'],
+                stdout=self.stdout,
+                stderr=self.stderr))
+        self.assertIn('Invalid shard', self.stderr.getvalue())
+        self.lint.assert_not_called()
+
+    def test_main_merge(self):
+        first = os.path.join(self.root, 'first.json')
+        second = os.path.join(self.root, 'second.json')
+        self.fs.create_file(
+            first, contents=json.dumps({
+                self.filename: {
+                    'comments': []
+                }
+            }))
+        self.fs.create_file(
+            second,
+            contents=json.dumps({
+                self.filename2: {
+                    'comments': [{
+                        'line': 1
+                    }]
+                }
+            }))
+
+        self.assertEqual(
+            1,
+            gitlint.main(
+                ['git-lint', 'merge', first, second],
+                stdout=self.stdout,
+                stderr=None))
+        self.assertEqual({
+            self.filename: {
+                'comments': []
+            },
+            self.filename2: {
+                'comments': [{
+                    'line': 1
+                }]
+            }
+        }, json.loads(self.stdout.getvalue()))
+
+    def test_main_merge_invalid(self):
+        self.assertEqual(
+            2,
+            gitlint.main(
+                ['git-lint', 'merge', 'missing.json'],
+                stdout=self.stdout,
+                stderr=self.stderr))
+        self.assertIn('Could not read report missing.json',
+                      self.stderr.getvalue())
+
+    def test_main_new_only(self):
+        self.fs.create_file(self.filename, contents='import os\n\nx = 1\n')
+
+        def lint(filename, unused_lines, unused_config, content=None):
+            comments = [{'line': 1, 'message': 'unused import os'}]
+            if content is None:
+                comments.append({'line': 3, 'message': 'invalid name x'})
+            return {filename: {'comments': comments}}
+
+        self.lint.side_effect = lint
+        with mock.patch('gitlint.git.committed_content',
+                        return_value=b'import os\nprint(os)\n') as \
+                committed_content:
+            self.assertEqual(
+                1,
+                gitlint.main(
+                    ['git-lint', '--new-only', '--json'],
+                    stdout=self.stdout,
+                    stderr=None))
+
+        committed_content.assert_called_once_with(self.root, self.filename)
+        self.assertEqual([
+            mock.call(self.filename, None, mock.ANY),
+            mock.call(
+                self.filename,
+                None,
+                mock.ANY,
+                content=b'import os\nprint(os)\n')
+        ], self.lint.call_args_list)
+        self.git_modified_lines.assert_not_called()
+        self.assertEqual(['invalid name x'], [
+            comment['message'] for comment in json.loads(
+                self.stdout.getvalue())[self.filename]['comments']
+        ])
+
+    def test_main_new_only_new_file(self):
+        self.fs.create_file(self.filename, contents='x = 1\n')
+        self.lint.return_value = {
+            self.filename: {
+                'comments': [{
+                    'line': 1,
+                    'message': 'invalid name x'
+                }]
+            }
+        }
+        with mock.patch('gitlint.git.committed_content', return_value=None):
+            self.assertEqual(
+                1,
+                gitlint.main(
+                    ['git-lint', '--new-only'],
+                    stdout=self.stdout,
+                    stderr=None))
+        self.lint.assert_called_once_with(self.filename, None, mock.ANY)
+        self.assertIn('invalid name x', self.stdout.getvalue())
+
+    def test_main_new_only_last_commit(self):
+        self.assertEqual(
+            2,
+            gitlint.main(
+                ['git-lint', '--new-only', '--last-commit'],
+                stdout=self.stdout,
+                stderr=self.stderr))
+        self.assertIn('--new-only can not be combined', self.stderr.getvalue())
+
+    def test_main_range(self):
+        def lint(filename, unused_lines, unused_config, content=None):
+            comments = []
+            if content == b'bad':
+                comments.append({'line': 1, 'message': 'bad'})
+            return {filename: {'comments': comments}}
+
+        self.lint.side_effect = lint
+        changes = {
+            '1111': [(self.filename, None)],
+            '2222': [(self.filename, [1]), (self.filename2, [2])],
+        }
+        contents = {
+            ('1111', self.filename): b'good',
+            ('2222', self.filename): b'bad',
+            ('2222', self.filename2): b'bad',
+        }
+        with mock.patch('gitlint.git.commits',
+                        return_value=['1111', '2222']) as commits, \
+                mock.patch('gitlint.git.commit_changes',
+                           side_effect=lambda root, commit: changes[commit]), \
+                mock.patch('gitlint.git.CommitReader') as commit_reader:
+            commit_reader.return_value.read.side_effect = (
+                lambda commit, filename: contents[(commit, filename)])
+            self.assertEqual(
+                1,
+                gitlint.main(
+                    ['git-lint', '--range=v1..v2', '--json'],
+                    stdout=self.stdout,
+                    stderr=None))
+
+        commits.assert_called_once_with(self.root, 'v1..v2', walk=True)
+        commit_reader.return_value.close.assert_called_once_with()
+        # The files are linted in parallel.
+        self.assertEqual(
+            sorted(
+                [
+                    mock.call(self.filename, None, mock.ANY, content=b'good'),
+                    mock.call(self.filename, [1], mock.ANY, content=b'bad'),
+                    mock.call(self.filename2, [2], mock.ANY, content=b'bad')
+                ],
+                key=str), sorted(self.lint.call_args_list, key=str))
+        self.git_modified_files.assert_not_called()
+        self.git_modified_lines.assert_not_called()
+        result = json.loads(self.stdout.getvalue())
+        self.assertEqual([
+            '1111:' + self.filename, '2222:' + self.filename,
+            '2222:' + self.filename2
+        ], sorted(result))
+        self.assertEqual([], result['1111:' + self.filename]['comments'])
+
+    def test_main_commit(self):
+        self.lint.return_value = {self.filename: {'comments': []}}
+        with mock.patch('gitlint.git.commits',
+                        return_value=['1111' * 10]) as commits, \
+                mock.patch('gitlint.git.commit_changes',
+                           return_value=[(self.filename, [1])]), \
+                mock.patch('gitlint.git.CommitReader') as commit_reader:
+            commit_reader.return_value.read.return_value = b'content'
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint', '--commit=HEAD~2'],
+                    stdout=self.stdout,
+                    stderr=None))
+
+        commits.assert_called_once_with(self.root, 'HEAD~2', walk=False)
+        self.assertIn('111111111111:changed.py', self.stdout.getvalue())
+
+    def test_main_commit_read_error(self):
+        with mock.patch('gitlint.git.commits', return_value=['1111']), \
+                mock.patch('gitlint.git.commit_changes',
+                           return_value=[(self.filename, [1])]), \
+                mock.patch('gitlint.git.CommitReader') as commit_reader:
+            commit_reader.return_value.read.side_effect = IOError(
+                'git cat-file exited')
+            self.assertEqual(
+                2,
+                gitlint.main(
+                    ['git-lint', '--commit=HEAD'],
+                    stdout=self.stdout,
+                    stderr=self.stderr))
+
+        self.assertIn('fatal: git cat-file exited', self.stderr.getvalue())
+        commit_reader.return_value.close.assert_called_once_with()
+
+    def test_main_commit_invalid(self):
+        with mock.patch(
+                'gitlint.git.commits',
+                side_effect=subprocess.CalledProcessError(128, '', '')):
+            self.assertEqual(
+                2,
+                gitlint.main(
+                    ['git-lint', '--commit=nope'],
+                    stdout=self.stdout,
+                    stderr=self.stderr))
+        self.assertIn('Invalid revision nope', self.stderr.getvalue())
+
+    def test_main_hooks(self):
+        lint_response = {self.filename: {'comments': []}}
+        self.lint.return_value = lint_response
+        events = []
+
+        def listener(event, unused_data):
+            events.append(event)
+
+        for event in gitlint.hooks.EVENTS:
+            gitlint.hooks.register(event, listener)
+            self.addCleanup(gitlint.hooks.unregister, event, listener)
+
+        self.assertEqual(0, gitlint.main([], stdout=self.stdout, stderr=None))
+        # linter_start and linter_end are not emitted as lint is mocked.
+        self.assertEqual([
+            gitlint.hooks.RUN_START, gitlint.hooks.FILE_DISCOVERED,
+            gitlint.hooks.FILE_DONE, gitlint.hooks.RUN_END
+        ], events)
+
+    def test_main_hooks_from_config(self):
+        lint_response = {self.filename: {'comments': []}}
+        self.lint.return_value = lint_response
+        self.fs.create_file(
+            os.path.join(self.root, '.gitlint.yaml'),
+            contents='hooks:\n  run_end:\n    - gitlint:format_comment\n')
+
+        with mock.patch('gitlint.format_comment') as listener:
+            self.assertEqual(0,
+                             gitlint.main([], stdout=self.stdout, stderr=None))
+            listener.assert_called_once_with(gitlint.hooks.RUN_END,
+                                             {'return_code': 0})
+        self.assertFalse(gitlint.hooks.has_listeners(gitlint.hooks.RUN_END))
+
+    def test_main_hooks_from_config_invalid(self):
+        self.fs.create_file(
+            os.path.join(self.root, '.gitlint.yaml'),
+            contents='hooks:\n  run_end:\n    - gitlint:inexistent\n')
+
+        self.assertEqual(
+            2, gitlint.main([], stdout=self.stdout, stderr=self.stderr))
+        self.assertIn('Could not load hooks', self.stderr.getvalue())
+
+    def test_main_profile_cpu(self):
+        lint_response = {self.filename: {'comments': []}}
+        self.lint.return_value = lint_response
+        profile_filename = os.path.join(self.root, 'cpu.prof')
+
+        self.assertEqual(
+            0,
+            gitlint.main(
+                [
+                    'git-lint', '--profile=cpu',
+                    '--profile-output=%s' % profile_filename
+                ],
+                stdout=self.stdout,
+                stderr=self.stderr))
+        self.assertTrue(os.path.exists(profile_filename))
+        self.assertIn('(_lint)', self.stderr.getvalue())
+
+    def test_main_profile_invalid_mode(self):
+        self.assertEqual(
+            2,
+            gitlint.main(
+                ['git-lint', '--profile=foo'],
+                stdout=self.stdout,
+                stderr=self.stderr))
+        self.assertIn('Invalid profile mode', self.stderr.getvalue())
+
+    def test_main_engine(self):
+        self.lint.return_value = {self.filename: {'comments': []}}
+        with mock.patch('gitlint.engine.start') as start:
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint', '--engine=asyncio', '--max-subprocesses=5'],
+                    stdout=self.stdout,
+                    stderr=self.stderr))
+        start.assert_called_once_with('asyncio', 0, 5)
+
+    def test_main_jobs(self):
+        self.lint.return_value = {self.filename: {'comments': []}}
+        with mock.patch('gitlint.engine.start') as start:
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint', '-j', '3'],
+                    stdout=self.stdout,
+                    stderr=self.stderr))
+        start.assert_called_once_with('threads', 3, 0)
+        self.assertEqual(
+            2,
+            gitlint.main(
+                ['git-lint', '--jobs=-1'],
+                stdout=self.stdout,
+                stderr=self.stderr))
+        self.assertIn('Invalid number of jobs', self.stderr.getvalue())
+
+    def test_main_jobserver(self):
+        self.lint.return_value = {self.filename: {'comments': []}}
+        makeflags = ' -j2 --jobserver-auth=3,4'
+        with mock.patch.dict(os.environ, {'MAKEFLAGS': makeflags}), \
+                mock.patch('gitlint.engine.concurrency', return_value=4), \
+                mock.patch('gitlint.parallelism.start') as start:
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint'], stdout=self.stdout, stderr=self.stderr))
+        start.assert_called_once_with(4, makeflags)
+
+    def test_main_jobserver_invalid(self):
+        self.lint.return_value = {self.filename: {'comments': []}}
+        makeflags = '--jobserver-fds=3,4'
+        with mock.patch.dict(os.environ, {'MAKEFLAGS': makeflags}), \
+                mock.patch('gitlint.engine.concurrency', return_value=4), \
+                mock.patch('gitlint.parallelism.start',
+                           side_effect=[ValueError('Could not use it'),
+                                        None]) as start:
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint'], stdout=self.stdout, stderr=self.stderr))
+        self.assertEqual([
+            mock.call(4, makeflags),
+            mock.call(4),
+        ], start.call_args_list)
+        self.assertIn('Could not use it, linting without it',
+                      self.stderr.getvalue())
+
+    def test_main_engine_invalid(self):
+        self.assertEqual(
+            2,
+            gitlint.main(
+                ['git-lint', '--engine=foo'],
+                stdout=self.stdout,
+                stderr=self.stderr))
+        self.assertIn('Invalid engine', self.stderr.getvalue())
+        self.assertEqual(
+            2,
+            gitlint.main(
+                ['git-lint', '--max-subprocesses=-1'],
+                stdout=self.stdout,
+                stderr=self.stderr))
+        self.assertIn('Invalid number of subprocesses', self.stderr.getvalue())
+
+    def _lint_files(self, results):
+        """Mocks the linters, returning the results of each relative filename.
+
+        Results that are exceptions are raised instead.
+        """
+        filenames = dict(
+            (os.path.join(self.root, name), name) for name in results)
+        self.git_modified_files.return_value = dict.fromkeys(filenames, ' M')
+
+        def lint(filename, unused_lines, unused_config):
+            result = results[filenames[filename]]
+            if callable(result):
+                result = result()
+            if isinstance(result, Exception):
+                raise result
+            return {filename: result}
+
+        self.lint.side_effect = lint
+
+    def test_main_fail_fast(self):
+        self._lint_files({
+            'a.py': {
+                'comments': []
+            },
+            'b.py': {
+                'comments': [{
+                    'line': 3,
+                    'message': 'error'
+                }]
+            },
+            'c.py': gitlint.engine.Cancelled(),
+        })
+        with mock.patch('gitlint.engine.cancel') as cancel:
+            self.assertEqual(
+                1,
+                gitlint.main(
+                    ['git-lint', '--fail-fast'],
+                    stdout=self.stdout,
+                    stderr=self.stderr))
+        cancel.assert_called_once_with()
+        self.assertIn('a.py', self.stdout.getvalue())
+        self.assertIn('line 3: error', self.stdout.getvalue())
+        self.assertNotIn('c.py', self.stdout.getvalue())
+        self.assertIn('Stopped after 1 problem(s)', self.stderr.getvalue())
+
+    def test_main_fail_fast_out_of_order(self):
+        cancelled = threading.Event()
+
+        def killed():
+            cancelled.wait(5)
+            return gitlint.engine.Cancelled()
+
+        self._lint_files({
+            'a.py': killed,
+            'b.py': {
+                'comments': [{
+                    'line': 3,
+                    'message': 'error'
+                }]
+            },
+        })
+        with mock.patch('gitlint.engine.concurrency', return_value=2), \
+                mock.patch('gitlint.engine.cancel',
+                           side_effect=cancelled.set):
+            self.assertEqual(
+                1,
+                gitlint.main(
+                    ['git-lint', '--json', '--fail-fast'],
+                    stdout=self.stdout,
+                    stderr=self.stderr))
+        self.assertTrue(cancelled.is_set())
+        self.assertEqual([os.path.join(self.root, 'b.py')],
+                         list(json.loads(self.stdout.getvalue())))
+
+    def test_main_fail_after(self):
+        self._lint_files({
+            'a.py': {
+                'comments': [{
+                    'line': 3,
+                    'message': 'error'
+                }]
+            },
+            'b.py': {
+                'comments': [{
+                    'line': 3,
+                    'message': 'error'
+                }]
+            },
+        })
+        with mock.patch('gitlint.engine.cancel') as cancel:
+            self.assertEqual(
+                1,
+                gitlint.main(
+                    ['git-lint', '--fail-after=3'],
+                    stdout=self.stdout,
+                    stderr=self.stderr))
+        self.assertFalse(cancel.called)
+        self.assertNotIn('Stopped', self.stderr.getvalue())
+
+        self._lint_files({
+            'a.py': {
+                'comments': [{
+                    'line': 3,
+                    'message': 'error'
+                }, {
+                    'line': 4,
+                    'message': 'error'
+                }]
+            },
+        })
+        with mock.patch('gitlint.engine.cancel') as cancel:
+            self.assertEqual(
+                1,
+                gitlint.main(
+                    ['git-lint', '--fail-after=1'],
+                    stdout=self.stdout,
+                    stderr=self.stderr))
+        cancel.assert_called_once_with()
+        # The problems found are reported, not the threshold.
+        self.assertIn('Stopped after 2 problem(s)', self.stderr.getvalue())
+
+        self.assertEqual(
+            2,
+            gitlint.main(
+                ['git-lint', '--fail-after=0'],
+                stdout=self.stdout,
+                stderr=self.stderr))
+        self.assertIn('Invalid number of problems 0', self.stderr.getvalue())
+
+    def test_main_deadline(self):
+        cancelled = threading.Event()
+
+        def slow():
+            cancelled.wait(5)
+            return gitlint.engine.Cancelled()
+
+        self._lint_files({
+            'a.py': {
+                'comments': [{
+                    'line': 1,
+                    'message': 'error'
+                }]
+            },
+            'b.py': {
+                'comments': []
+            },
+            'slow.py': slow,
+        })
+        self.git_modified_lines.side_effect = (
+            lambda filename, unused_extra_data, commit=None:
+            [1, 2, 3] if filename.endswith('b.py') else [1])
+        with mock.patch('gitlint.engine.concurrency', return_value=4), \
+                mock.patch('gitlint.engine.cancel',
+                           side_effect=cancelled.set), \
+                mock.patch('gitlint._lint_in_background',
+                           return_value=True) as background:
+            self.assertEqual(
+                1,
+                gitlint.main(
+                    ['git-lint', '--deadline=0.2'],
+                    stdout=self.stdout,
+                    stderr=self.stderr))
+        output = self.stdout.getvalue()
+        # The file with the most modified lines first.
+        self.assertLess(output.index('b.py'), output.index('a.py'))
+        self.assertIn('DEFERRED', output)
+        self.assertEqual(3, self.git_modified_lines.call_count)
+        background.assert_called_once_with(
+            mock.ANY, self.root, [os.path.join(self.root, 'slow.py')])
+        self.assertIn('Deferred 1 file(s), linting them in the background',
+                      self.stderr.getvalue())
+
+    def test_main_deadline_slow_modified_lines(self):
+        cancelled = threading.Event()
+        self._lint_files({
+            'a.py': {
+                'comments': []
+            },
+            'b.py': {
+                'comments': []
+            },
+            'c.py': {
+                'comments': []
+            },
+        })
+
+        def modified_lines(filename, unused_extra_data, commit=None):
+            if filename.endswith('c.py'):
+                # Like git blame, killed when the deadline passes.
+                cancelled.wait(5)
+            return [1, 2, 3] if filename.endswith('b.py') else [1]
+
+        self.git_modified_lines.side_effect = modified_lines
+        with mock.patch('gitlint.engine.concurrency', return_value=4), \
+                mock.patch('gitlint.engine.cancel',
+                           side_effect=cancelled.set) as cancel, \
+                mock.patch('gitlint._lint_in_background',
+                           return_value=True):
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint', '--deadline=0.4'],
+                    stdout=self.stdout,
+                    stderr=self.stderr))
+        output = self.stdout.getvalue()
+        # Without the modified lines of all the files in time, the files are
+        # sorted by the cost of their linters only.
+        self.assertLess(output.index('a.py'), output.index('b.py'))
+        self.assertLess(output.index('b.py'), output.index('c.py'))
+        cancel.assert_called_once_with()
+
+    def test_main_deadline_modified_lines_error(self):
+        self._lint_files({
+            'a.py': {
+                'comments': []
+            },
+            'b.py': {
+                'comments': []
+            },
+            'c.py': {
+                'comments': []
+            },
+        })
+        failed = []
+
+        def modified_lines(filename, unused_extra_data, commit=None):
+            if filename.endswith('c.py') and not failed:
+                failed.append(filename)
+                # Like git blame killed by the deadline.
+                raise subprocess.CalledProcessError(-9, ['git', 'blame'])
+            return [1, 2, 3] if filename.endswith('b.py') else [1]
+
+        self.git_modified_lines.side_effect = modified_lines
+        with mock.patch('gitlint._lint_in_background', return_value=True):
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint', '--deadline=10'],
+                    stdout=self.stdout,
+                    stderr=self.stderr))
+        output = self.stdout.getvalue()
+        # The file without modified lines is sorted last, and linted with
+        # the lines computed again.
+        self.assertLess(output.index('b.py'), output.index('a.py'))
+        self.assertLess(output.index('a.py'), output.index('c.py'))
+        self.assertNotIn('DEFERRED', output)
+        self.assertEqual(4, self.git_modified_lines.call_count)
+
+    def test_main_deadline_all_deferred(self):
+        cancelled = threading.Event()
+
+        def slow():
+            cancelled.wait(5)
+            return gitlint.engine.Cancelled()
+
+        self._lint_files({'a.py': slow})
+        with mock.patch('gitlint.engine.cancel',
+                        side_effect=cancelled.set), \
+                mock.patch('gitlint._lint_in_background',
+                           return_value=True):
+            # The deferred files are not problems: they are reported by the
+            # next runs, once linted in the background.
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint', '--deadline=0.1'],
+                    stdout=self.stdout,
+                    stderr=self.stderr))
+        self.assertIn('DEFERRED', self.stdout.getvalue())
+        self.assertNotIn('OK', self.stdout.getvalue())
+
+    def test_main_deadline_json(self):
+        cancelled = threading.Event()
+
+        def slow():
+            cancelled.wait(5)
+            return gitlint.engine.Cancelled()
+
+        self._lint_files({'a.py': slow})
+        with mock.patch('gitlint.engine.cancel',
+                        side_effect=cancelled.set), \
+                mock.patch('gitlint._lint_in_background',
+                           return_value=False):
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint', '--json', '--deadline=0.1'],
+                    stdout=self.stdout,
+                    stderr=self.stderr))
+        self.assertIn(
+            'deferred',
+            json.loads(self.stdout.getvalue())[os.path.join(self.root,
+                                                            'a.py')])
+        self.assertIn('Deferred 1 file(s)' + os.linesep,
+                      self.stderr.getvalue())
+
+    def test_main_deadline_costs(self):
+        self._lint_files({'a.py': {'comments': []}})
+        costs = gitlint.scheduling.LinterCosts()
+        with mock.patch('gitlint.scheduling.load_costs',
+                        return_value=costs), \
+                mock.patch('gitlint.scheduling.save_costs') as save_costs:
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint', '--deadline=10'],
+                    stdout=self.stdout,
+                    stderr=self.stderr))
+        save_costs.assert_called_once_with(costs)
+
+    def test_main_without_deadline_costs(self):
+        self._lint_files({'a.py': {'comments': []}})
+        with mock.patch('gitlint.scheduling.load_costs') as load_costs, \
+                mock.patch('gitlint.scheduling.save_costs') as save_costs:
+            self.assertEqual(
+                0,
+                gitlint.main(
+                    ['git-lint'], stdout=self.stdout, stderr=self.stderr))
+        load_costs.assert_not_called()
+        save_costs.assert_not_called()
+
+    def test_main_deadline_invalid(self):
+        self.assertEqual(
+            2,
+            gitlint.main(
+                ['git-lint', '--deadline=-1'],
+                stdout=self.stdout,
+                stderr=self.stderr))
+        self.assertIn('Invalid deadline -1', self.stderr.getvalue())
+
     def test_main_file_with_skipped_and_error(self):
         lint_response = {
             self.filename: {
@@ -464,6 +1576,15 @@ class GitLintTest(fake_filesystem_unittest.TestCase):
         self.assertEqual(['.py'], list(parsed_config.keys()))
         self.assertEqual(1, len(parsed_config['.py']))
 
+    def test_get_config_ignores_hooks(self):
+        config = """hooks:
+  run_end:
+  - foo:bar
+"""
+        self.fs.create_file(
+            os.path.join(self.root, '.gitlint.yaml'), contents=config)
+        self.assertEqual({}, gitlint.get_config(self.root))
+
     def test_get_config_from_default(self):
         parsed_config = gitlint.get_config(self.root)
         self.assertEqual(gitlint.get_config(None), parsed_config)
@@ -23,18 +23,19 @@ import gitlint.hg as hg
 
 
 class HgTest(unittest.TestCase):
-    @mock.patch('subprocess.check_output', return_value=b'/home/user/repo\n')
+    @mock.patch(
+        'gitlint.engine.check_output', return_value=b'/home/user/repo\n')
     def test_repository_root_ok(self, check_output):
         self.assertEqual('/home/user/repo', hg.repository_root())
         check_output.assert_called_once_with(
             ['hg', 'root'], stderr=subprocess.STDOUT)
 
-    @mock.patch('subprocess.check_output')
+    @mock.patch('gitlint.engine.check_output')
     def test_repository_root_error(self, check_output):
         check_output.side_effect = subprocess.CalledProcessError(255, '', '')
         self.assertEqual(None, hg.repository_root())
 
-    @mock.patch('subprocess.check_output')
+    @mock.patch('gitlint.engine.check_output')
     def test_modified_files(self, check_output):
         check_output.return_value = os.linesep.join([
             'A docs/file1.txt', 'M data/file2.json', 'R file3.py',
@@ -49,7 +50,7 @@ class HgTest(unittest.TestCase):
         }, hg.modified_files('/home/user/repo'))
         check_output.assert_called_once_with(['hg', 'status'])
 
-    @mock.patch('subprocess.check_output')
+    @mock.patch('gitlint.engine.check_output')
     def test_modified_files_tracked_only(self, check_output):
         check_output.return_value = os.linesep.join([
             'A docs/file1.txt', 'M data/file2.json', 'R file3.py',
@@ -63,12 +64,12 @@ class HgTest(unittest.TestCase):
         }, hg.modified_files('/home/user/repo', tracked_only=True))
         check_output.assert_called_once_with(['hg', 'status'])
 
-    @mock.patch('subprocess.check_output', return_value=b'')
+    @mock.patch('gitlint.engine.check_output', return_value=b'')
     def test_modified_files_nothing_changed(self, check_output):
         self.assertEqual({}, hg.modified_files('/home/user/repo'))
         check_output.assert_called_once_with(['hg', 'status'])
 
-    @mock.patch('subprocess.check_output')
+    @mock.patch('gitlint.engine.check_output')
     def test_modified_files_with_commit(self, check_output):
         check_output.return_value = os.linesep.join([
             'A docs/file1.txt', 'M data/file2.json', 'R file3.py',
@@ -89,7 +90,7 @@ class HgTest(unittest.TestCase):
         with self.assertRaises(AssertionError):
             hg.modified_files('foo/bar')
 
-    @mock.patch('subprocess.check_output')
+    @mock.patch('gitlint.engine.check_output')
     def test_modified_lines(self, check_output):
         check_output.return_value = os.linesep.join([
             '--- a/foo/bar/a.py',
@@ -109,7 +110,7 @@ class HgTest(unittest.TestCase):
         check_output.assert_called_once_with(
             ['hg', 'diff', '-U', '0', '/home/user/repo/foo/bar.txt'])
 
-    @mock.patch('subprocess.check_output')
+    @mock.patch('gitlint.engine.check_output')
     def test_modified_lines_with_commit(self, check_output):
         check_output.return_value = os.linesep.join([
             '--- a/foo/bar/a.py',
@@ -148,13 +149,92 @@ class HgTest(unittest.TestCase):
                              hg.modified_lines('/home/user/repo/foo/bar.txt',
                                                None)))
 
-    @mock.patch('subprocess.check_output', return_value=b'0a' * 20 + b'\n')
+    @mock.patch('gitlint.engine.check_output', return_value=b'0a' * 20 + b'\n')
     def test_last_commit(self, check_output):
         self.assertEqual('0a' * 20, hg.last_commit())
         check_output.assert_called_once_with(
             ['hg', 'parent', '--template={node}'], stderr=subprocess.STDOUT)
 
-    @mock.patch('subprocess.check_output')
+    @mock.patch('gitlint.engine.check_output')
     def test_last_commit_not_in_repo(self, check_output):
         check_output.side_effect = subprocess.CalledProcessError(255, '', '')
         self.assertEqual(None, hg.last_commit())
+
+    @mock.patch('gitlint.engine.check_output')
+    def test_files_changed_since(self, check_output):
+        check_output.return_value = b'docs/file1.txt\0file2.py\0'
+
+        self.assertEqual(
+            ['/home/user/repo/docs/file1.txt', '/home/user/repo/file2.py'],
+            hg.files_changed_since('/home/user/repo', 'v1.0'))
+        check_output.assert_called_once_with([
+            'hg', 'status', '--no-status', '--print0', '--modified', '--added',
+            '--rev', 'v1.0'
+        ])
+
+    @mock.patch('os.path.isfile', side_effect=lambda name: 'gone' not in name)
+    @mock.patch('gitlint.utils.output_fields')
+    def test_tracked_files(self, output_fields, unused_isfile):
+        output_fields.return_value = iter([b'a.py', b'docs/b.txt', b'gone'])
+
+        self.assertEqual([('/home/user/repo/a.py', None),
+                          ('/home/user/repo/docs/b.txt', None)],
+                         list(
+                             hg.tracked_files('/home/user/repo',
+                                              ['/home/user/repo'])))
+        output_fields.assert_called_once_with(
+            ['hg', 'files', '-0', '--', '.'],
+            ok_returncodes=(0, 1),
+            cwd='/home/user/repo')
+
+    @mock.patch('gitlint.engine.check_output', return_value=b'1111\n2222\n')
+    def test_commits(self, check_output):
+        self.assertEqual(['1111', '2222'],
+                         hg.commits('/home/user/repo', 'v1..v2'))
+        check_output.assert_called_once_with(
+            [
+                'hg', 'log', '--rev', 'sort(only(v2, v1) and not merge())',
+                '--template', '{node}\n'
+            ],
+            stderr=subprocess.STDOUT)
+
+    @mock.patch('gitlint.engine.check_output')
+    def test_commit_changes(self, check_output):
+        check_output.return_value = b'\n'.join([
+            b'diff --git a/foo.py b/foo.py', b'--- a/foo.py', b'+++ b/foo.py',
+            b'@@ -3,1 +3,2 @@', b'-a', b'+b', b'+c'
+        ])
+
+        self.assertEqual([('/home/user/repo/foo.py', [3, 4])],
+                         hg.commit_changes('/home/user/repo', '1111'))
+        check_output.assert_called_once_with(
+            ['hg', 'diff', '--git', '-U', '0', '--change', '1111'],
+            cwd='/home/user/repo')
+
+    @mock.patch('gitlint.engine.check_output')
+    def test_commit_reader(self, check_output):
+        check_output.side_effect = [
+            b'content', subprocess.CalledProcessError(1, '', '')
+        ]
+        reader = hg.CommitReader('/home/user/repo')
+
+        self.assertEqual(b'content', reader.read('1111', '/home/user/repo/a'))
+        self.assertIsNone(reader.read('1111', '/home/user/repo/b'))
+        check_output.assert_called_with(
+            ['hg', 'cat', '--rev', '1111', '/home/user/repo/b'],
+            stderr=subprocess.STDOUT)
+
+    @mock.patch('gitlint.engine.check_output', return_value=b'content')
+    def test_committed_content(self, check_output):
+        self.assertEqual(
+            b'content',
+            hg.committed_content('/home/user/repo', '/home/user/repo/a/b.py'))
+        check_output.assert_called_once_with(
+            ['hg', 'cat', '--rev', '.', '/home/user/repo/a/b.py'],
+            stderr=subprocess.STDOUT)
+
+    @mock.patch('gitlint.engine.check_output')
+    def test_committed_content_new_file(self, check_output):
+        check_output.side_effect = subprocess.CalledProcessError(1, '', '')
+        self.assertIsNone(
+            hg.committed_content('/home/user/repo', '/home/user/repo/a.py'))
@@ -0,0 +1,95 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+import mock
+
+import gitlint.hooks as hooks
+
+
+def listener(event, data):
+    """Dummy listener used to test entry points."""
+    return event, data
+
+
+class HooksTest(unittest.TestCase):
+    def tearDown(self):
+        hooks.unregister_config()
+        hooks._LISTENERS.clear()  # pylint: disable=protected-access
+
+    def test_emit_without_listeners(self):
+        self.assertFalse(hooks.has_listeners(hooks.RUN_START))
+        hooks.emit(hooks.RUN_START, foo=1)
+
+    def test_emit_listener_error(self):
+        failing = mock.Mock(side_effect=ValueError('broken'))
+        callback = mock.Mock()
+        hooks.register(hooks.LINTER_END, failing)
+        hooks.register(hooks.LINTER_END, callback)
+
+        with mock.patch('gitlint.hooks._LOGGER') as logger:
+            hooks.emit(hooks.LINTER_END, linter='pylint')
+        self.assertEqual(1, logger.exception.call_count)
+        callback.assert_called_once_with(hooks.LINTER_END,
+                                         {'linter': 'pylint'})
+
+    def test_register_and_emit(self):
+        callback = mock.Mock()
+        hooks.register(hooks.LINTER_END, callback)
+
+        self.assertTrue(hooks.has_listeners(hooks.LINTER_END))
+        hooks.emit(hooks.LINTER_END, linter='pylint', duration=1)
+        hooks.emit(hooks.LINTER_START, linter='pylint')
+        callback.assert_called_once_with(hooks.LINTER_END, {
+            'linter': 'pylint',
+            'duration': 1
+        })
+
+    def test_register_unknown_event(self):
+        with self.assertRaises(ValueError):
+            hooks.register('foo', mock.Mock())
+
+    def test_unregister(self):
+        callback = mock.Mock()
+        hooks.register(hooks.RUN_END, callback)
+        hooks.unregister(hooks.RUN_END, callback)
+
+        self.assertFalse(hooks.has_listeners(hooks.RUN_END))
+        hooks.emit(hooks.RUN_END)
+        self.assertFalse(callback.called)
+
+    def test_load_entry_point(self):
+        self.assertIs(listener, hooks.load_entry_point(__name__ + ':listener'))
+        self.assertIs(HooksTest.tearDown,
+                      hooks.load_entry_point(__name__ + ':HooksTest.tearDown'))
+
+    def test_load_entry_point_invalid(self):
+        with self.assertRaises(ValueError):
+            hooks.load_entry_point('module_without_function')
+        with self.assertRaises(ImportError):
+            hooks.load_entry_point('inexistent_module_foo:bar')
+        with self.assertRaises(AttributeError):
+            hooks.load_entry_point(__name__ + ':inexistent')
+
+    def test_register_from_config(self):
+        hooks.register_from_config({
+            hooks.RUN_START: [__name__ + ':listener'],
+            hooks.RUN_END: [__name__ + ':listener'],
+        })
+        self.assertTrue(hooks.has_listeners(hooks.RUN_START))
+        self.assertTrue(hooks.has_listeners(hooks.RUN_END))
+
+        hooks.unregister_config()
+        self.assertFalse(hooks.has_listeners(hooks.RUN_START))
+        self.assertFalse(hooks.has_listeners(hooks.RUN_END))
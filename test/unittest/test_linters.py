@@ -15,26 +15,55 @@
 from __future__ import unicode_literals
 
 import functools
+import io
+import itertools
+import json
 import os
+import shutil
 import subprocess
+import sys
+import tempfile
+import threading
 import unittest
 
 import mock
 
 import gitlint
 import gitlint.utils
+import gitlint.engine as engine
+import gitlint.hooks as hooks
 import gitlint.linters as linters
+import gitlint.parallelism as parallelism
 
 # pylint: disable=too-many-public-methods,protected-access
 
 
+def _processes(outputs):
+    """Returns mocks of the processes of a linter writing each of outputs."""
+    processes = []
+    for output in outputs:
+        process = mock.MagicMock()
+        process.stdout = io.BytesIO(output)
+        processes.append(process)
+    return processes
+
+
+def _popen_call(arguments):
+    return mock.call(
+        arguments,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        start_new_session=True)
+
+
 class LintersTest(unittest.TestCase):
     def test_lint_command_success(self):
-        with mock.patch('subprocess.check_output') as check_output, \
+        output = os.linesep.join(
+            ['Line 1:1: 1', 'Line 5:2: 5 ·', 'Line 7:3: 7',
+             'Line 9:4: 9']).encode('utf-8')
+        with mock.patch('subprocess.Popen',
+                        side_effect=_processes([output, output])) as popen, \
                 mock.patch('os.path.getmtime', side_effect=[1, 0, 1, 0]):
-            check_output.return_value = os.linesep.join(
-                ['Line 1:1: 1', 'Line 5:2: 5 ·', 'Line 7:3: 7',
-                 'Line 9:4: 9']).encode('utf-8')
             command = functools.partial(
                 linters.lint_command, 'l', 'linter', ['-f', '--compact'],
                 r'^Line (?P<line>{lines}):(?P<column>\d+): (?P<message>.*)$')
@@ -82,20 +111,485 @@ class LintersTest(unittest.TestCase):
                 },
             }, command(filename, lines=None))
             expected_calls = [
-                mock.call(
-                    ['linter', '-f', '--compact', 'foo.txt'],
-                    stderr=subprocess.STDOUT),
-                mock.call(
-                    ['linter', '-f', '--compact', 'foo.txt'],
-                    stderr=subprocess.STDOUT)
+                _popen_call(['linter', '-f', '--compact', 'foo.txt']),
+                _popen_call(['linter', '-f', '--compact', 'foo.txt'])
             ]
-            self.assertEqual(expected_calls, check_output.call_args_list)
+            self.assertEqual(expected_calls, popen.call_args_list)
+
+    def test_lint_command_emits_hooks(self):
+        events = []
+
+        def listener(event, data):
+            events.append((event, data))
+
+        for event in (hooks.LINTER_START, hooks.LINTER_END):
+            hooks.register(event, listener)
+            self.addCleanup(hooks.unregister, event, listener)
+        with mock.patch('subprocess.Popen',
+                        side_effect=_processes([b'Line 1: foo'])), \
+                mock.patch('os.path.getmtime', side_effect=[1, 0]):
+            linters.lint_command('l', 'linter', [],
+                                 '^Line (?P<line>{lines}): (?P<message>.*)$',
+                                 'foo.txt', None)
+
+        self.assertEqual([hooks.LINTER_START, hooks.LINTER_END],
+                         [event for event, _ in events])
+        self.assertEqual({'linter': 'l', 'filename': 'foo.txt'}, events[0][1])
+        end_data = events[1][1]
+        self.assertFalse(end_data['cache_hit'])
+        self.assertGreaterEqual(end_data['duration'], 0)
+        self.assertEqual({
+            'comments': [{
+                'line': 1,
+                'message': 'foo'
+            }]
+        }, end_data['result'])
+
+    def test_lint_command_remote_cache_hit(self):
+        with mock.patch('gitlint.utils.get_output_from_cache',
+                        return_value=None), \
+                mock.patch('gitlint.utils.get_output_from_content_cache',
+                           return_value=None), \
+                mock.patch('gitlint.remote_cache.get_output',
+                           return_value='Line 1: foo'), \
+                mock.patch('gitlint.utils.content_hash',
+                           return_value='0' * 40), \
+                mock.patch('gitlint.utils.save_output_in_content_cache') as \
+                save_output, \
+                mock.patch('subprocess.Popen') as popen:
+            self.assertEqual({
+                'foo.txt': {
+                    'comments': [{
+                        'line': 1,
+                        'message': 'foo'
+                    }]
+                }
+            },
+                             linters.lint_command(
+                                 'l',
+                                 'linter', [],
+                                 '^Line (?P<line>{lines}): (?P<message>.*)$',
+                                 'foo.txt',
+                                 None,
+                                 fingerprint='f' * 40))
+
+        save_output.assert_called_once_with(
+            'f' * 40, 'foo.txt', 'Line 1: foo',
+            gitlint.utils.content_key('foo.txt', '0' * 40))
+        popen.assert_not_called()
+
+    def test_lint_command_remote_cache_miss(self):
+        with mock.patch('gitlint.utils.get_output_from_cache',
+                        return_value=None), \
+                mock.patch('gitlint.utils.get_output_from_content_cache',
+                           return_value=None), \
+                mock.patch('gitlint.remote_cache.get_output',
+                           return_value=None), \
+                mock.patch('gitlint.utils.content_hash',
+                           return_value='0' * 40), \
+                mock.patch('gitlint.utils.content_cache_writer'), \
+                mock.patch('gitlint.remote_cache.is_enabled',
+                           return_value=True), \
+                mock.patch('gitlint.remote_cache.save_output') as \
+                save_output, \
+                mock.patch('subprocess.Popen',
+                           side_effect=_processes([b'Line 1: foo'])):
+            linters.lint_command(
+                'l',
+                'linter', [],
+                '^Line (?P<line>{lines}): (?P<message>.*)$',
+                'foo.txt',
+                None,
+                fingerprint='f' * 40)
+
+        save_output.assert_called_once_with(
+            'f' * 40, 'foo.txt', 'Line 1: foo',
+            gitlint.utils.content_key('foo.txt', '0' * 40))
+
+    def test_lint_command_remote_cache_output_too_long(self):
+        chunks = []
+        content_cache_writer = mock.MagicMock()
+        content_cache_writer.return_value.__enter__.return_value = \
+            chunks.append
+        with mock.patch('gitlint.utils.get_output_from_content_cache',
+                        return_value=None), \
+                mock.patch('gitlint.remote_cache.get_output',
+                           return_value=None), \
+                mock.patch('gitlint.utils.content_hash',
+                           return_value='0' * 40), \
+                mock.patch('gitlint.utils.content_cache_writer',
+                           content_cache_writer), \
+                mock.patch('gitlint.remote_cache.is_enabled',
+                           return_value=True), \
+                mock.patch('gitlint.remote_cache.save_output') as \
+                save_output, \
+                mock.patch('gitlint.linters.MAX_RETAINED_OUTPUT', 15), \
+                mock.patch('subprocess.Popen',
+                           side_effect=_processes(
+                               [b'Line 1: foo\nLine 2: bar\n'])):
+            self.assertEqual({
+                'foo.txt': {
+                    'comments': [{
+                        'line': 1,
+                        'message': 'foo'
+                    }, {
+                        'line': 2,
+                        'message': 'bar'
+                    }]
+                }
+            },
+                             linters.lint_command(
+                                 'l',
+                                 'linter', [],
+                                 '^Line (?P<line>{lines}): (?P<message>.*)$',
+                                 'foo.txt',
+                                 None,
+                                 fingerprint='f' * 40))
+
+        content_cache_writer.assert_called_once_with(
+            'f' * 40, 'foo.txt', gitlint.utils.content_key(
+                'foo.txt', '0' * 40))
+        self.assertEqual(['Line 1: foo\n', 'Line 2: bar\n'], chunks)
+        save_output.assert_not_called()
+
+    def test_lint_command_file_hash(self):
+        with mock.patch('gitlint.utils.get_output_from_cache') as \
+                get_output_from_cache, \
+                mock.patch('gitlint.utils.get_output_from_content_cache',
+                           return_value='Line 1: foo') as \
+                get_output_from_content_cache, \
+                mock.patch('gitlint.utils.content_hash') as content_hash:
+            self.assertEqual({
+                'foo.txt': {
+                    'comments': [{
+                        'line': 1,
+                        'message': 'foo'
+                    }]
+                }
+            },
+                             linters.lint_command(
+                                 'l',
+                                 'linter', [],
+                                 '^Line (?P<line>{lines}): (?P<message>.*)$',
+                                 'foo.txt',
+                                 None,
+                                 fingerprint='f' * 40,
+                                 file_hash='1' * 40,
+                                 repository_root=os.getcwd()))
+
+        get_output_from_content_cache.assert_called_once_with(
+            'f' * 40, 'foo.txt', gitlint.utils.content_key(
+                'foo.txt', '1' * 40))
+        get_output_from_cache.assert_not_called()
+        content_hash.assert_not_called()
+
+    def test_lint_command_single_flight(self):
+        single_flight = mock.MagicMock()
+        single_flight.return_value.__enter__.return_value = True
+        with mock.patch('gitlint.utils.get_output_from_cache',
+                        side_effect=[None, 'Line 1: foo']), \
+                mock.patch('gitlint.utils.single_flight', single_flight), \
+                mock.patch('subprocess.Popen') as popen:
+            self.assertEqual({
+                'foo.txt': {
+                    'comments': [{
+                        'line': 1,
+                        'message': 'foo'
+                    }]
+                }
+            },
+                             linters.lint_command(
+                                 'l', 'linter', [],
+                                 '^Line (?P<line>{lines}): (?P<message>.*)$',
+                                 'foo.txt', None))
+
+        single_flight.assert_called_once_with(
+            'l:%s' % os.path.abspath('foo.txt'))
+        popen.assert_not_called()
+
+    def test_lint_command_workers(self):
+        with mock.patch('gitlint.distributed.is_enabled', return_value=True), \
+                mock.patch('gitlint.distributed.run',
+                           return_value='Line 1: foo') as run, \
+                mock.patch('gitlint.utils.get_output_from_content_cache',
+                           return_value=None), \
+                mock.patch('gitlint.utils.save_output_in_content_cache') as \
+                save_output_in_content_cache, \
+                mock.patch('subprocess.Popen') as popen:
+            self.assertEqual({
+                '/repo/foo.py': {
+                    'comments': [{
+                        'line': 1,
+                        'message': 'foo'
+                    }]
+                }
+            },
+                             linters.lint_command(
+                                 'l',
+                                 'linter', [],
+                                 '^Line (?P<line>{lines}): (?P<message>.*)$',
+                                 '/repo/foo.py',
+                                 None,
+                                 fingerprint='f' * 40,
+                                 content=b'staged',
+                                 repository_root='/repo'))
+
+        run.assert_called_once_with('f' * 40, '/repo/foo.py', b'staged',
+                                    'foo.py')
+        save_output_in_content_cache.assert_called_once_with(
+            'f' * 40, '/repo/foo.py', 'Line 1: foo',
+            gitlint.utils.content_key('foo.py',
+                                      gitlint.utils.blob_hash(b'staged')))
+        popen.assert_not_called()
+
+    def test_lint_command_workers_fallback(self):
+        processes = _processes([b'Line 1: foo'])
+        with mock.patch('gitlint.distributed.is_enabled', return_value=True), \
+                mock.patch('gitlint.distributed.run', return_value=None), \
+                mock.patch('gitlint.utils.get_output_from_content_cache',
+                           return_value=None), \
+                mock.patch('gitlint.utils.content_cache_writer'), \
+                mock.patch('subprocess.Popen', side_effect=processes):
+            self.assertEqual({
+                '/repo/foo.py': {
+                    'comments': [{
+                        'line': 1,
+                        'message': 'foo'
+                    }]
+                }
+            },
+                             linters.lint_command(
+                                 'l',
+                                 'linter', [],
+                                 '^Line (?P<line>{lines}): (?P<message>.*)$',
+                                 '/repo/foo.py',
+                                 None,
+                                 fingerprint='f' * 40,
+                                 content=b'staged',
+                                 stdin_arguments=['-']))
+
+        processes[0].stdin.write.assert_called_once_with(b'staged')
+        processes[0].stdin.close.assert_called_once_with()
+
+    def test_new_comments(self):
+        base_content = b'import os\nimport sys\n\nprint(sys.argv)\n'
+        content = (b'import os\nimport sys\n\n\nprint(1)\n'
+                   b'print(  2)\nprint(  2)\n')
+        base_comments = [
+            {
+                'line': 4,
+                'message': 'E303 too many blank lines'
+            },
+            {
+                'line': 4,
+                'column': 1,
+                'message': 'print found'
+            },
+        ]
+        comments = [
+            {
+                'line': 1,
+                'message': 'unused import os'
+            },
+            {
+                'line': 2,
+                'message': 'unused import sys'
+            },
+            {
+                'line': 5,
+                'column': 1,
+                'message': 'print found'
+            },
+            {
+                'line': 6,
+                'message': 'whitespace after ('
+            },
+            {
+                'line': 7,
+                'message': 'whitespace after ('
+            },
+        ]
+
+        self.assertEqual(
+            comments, linters.new_comments([], base_content, comments,
+                                           content))
+        self.assertEqual([comments[1], comments[2], comments[3], comments[4]],
+                         linters.new_comments(base_comments + [comments[0]],
+                                              base_content, comments, content))
+        # Each comment of the base cancels a single comment.
+        shifted_base = [
+            {
+                'line': 1,
+                'message': 'whitespace after ('
+            },
+        ]
+        self.assertEqual([comments[4]],
+                         linters.new_comments(shifted_base, b'print(  2)\n',
+                                              comments[3:], content))
+
+    def test_run_job(self):
+        command = linters.Partial(
+            linters.lint_command,
+            'l',
+            'linter', ['-v'],
+            '^Line (?P<line>{lines}): (?P<message>.*)$',
+            fingerprint='f' * 40,
+            stdin_arguments=['-'],
+            stdin_display_name='stdin',
+            repository_root='/worker')
+        missing = linters.Partial(linters.missing_requirements_command,
+                                  ['foo'], 'install foo')
+        commands = linters.commands_by_fingerprint({
+            '.py': [command, missing],
+            '.pyi': [command]
+        })
+        self.assertEqual({'f' * 40: command}, commands)
+
+        with mock.patch('subprocess.Popen',
+                        side_effect=_processes([b'stdin:1: foo\n'
+                                                b'stdin:2: bar\n'])) as popen, \
+                mock.patch('gitlint.utils.get_output_from_content_cache',
+                           return_value=None), \
+                mock.patch('gitlint.utils.content_cache_writer'):
+            # The coordinator puts its own filename back.
+            self.assertEqual(
+                os.linesep.join([
+                    gitlint.utils.FILENAME_PLACEHOLDER + ':1: foo',
+                    gitlint.utils.FILENAME_PLACEHOLDER + ':2: bar'
+                ]), linters.run_job(commands, 'f' * 40, 'foo.py', b'content'))
+
+        self.assertEqual(['linter', '-v', '-'], popen.call_args[0][0])
+        with self.assertRaises(KeyError):
+            linters.run_job(commands, '0' * 40, 'foo.py', b'content')
+
+    def test_run_job_key(self):
+        commands = {
+            'f' * 40:
+            linters.Partial(
+                linters.lint_command,
+                'l',
+                'linter', [],
+                '.*',
+                fingerprint='f' * 40,
+                repository_root='/worker')
+        }
+        key = gitlint.utils.content_key('src/foo.py',
+                                        gitlint.utils.blob_hash(b'content'))
+
+        with mock.patch('gitlint.utils.get_output_from_content_cache',
+                        return_value='output') as \
+                get_output_from_content_cache:
+            self.assertEqual(
+                'output',
+                linters.run_job(commands, 'f' * 40, 'src/foo.py', b'content'))
+
+        get_output_from_content_cache.assert_called_once_with(
+            'f' * 40, '/worker/src/foo.py', key)
+
+    def test_lint_command_content(self):
+        linted_contents = []
+
+        chunks = []
+        content_cache_writer = mock.MagicMock()
+        content_cache_writer.return_value.__enter__.return_value = \
+            chunks.append
+
+        def popen(call_arguments, **unused_kwargs):
+            scratch_filename = call_arguments[-1]
+            with open(scratch_filename, 'rb') as f:
+                linted_contents.append(f.read())
+            return _processes(
+                [('%s:1: foo' % scratch_filename).encode('utf-8')])[0]
+
+        with mock.patch('subprocess.Popen', side_effect=popen), \
+                mock.patch('gitlint.utils.get_output_from_cache') as \
+                get_output_from_cache, \
+                mock.patch('gitlint.utils.cache_writer') as cache_writer, \
+                mock.patch('gitlint.utils.get_output_from_content_cache',
+                           return_value=None), \
+                mock.patch('gitlint.utils.content_cache_writer',
+                           content_cache_writer):
+            self.assertEqual({
+                '/repo/foo.py': {
+                    'comments': [{
+                        'line': 1,
+                        'message': 'foo'
+                    }]
+                }
+            },
+                             linters.lint_command(
+                                 'l',
+                                 'linter', [],
+                                 r'^{filename}:(?P<line>{lines}): '
+                                 r'(?P<message>.*)$',
+                                 '/repo/foo.py',
+                                 None,
+                                 fingerprint='f' * 40,
+                                 content=b'staged'))
+
+        self.assertEqual([b'staged'], linted_contents)
+        get_output_from_cache.assert_not_called()
+        cache_writer.assert_not_called()
+        content_cache_writer.assert_called_once_with(
+            'f' * 40, '/repo/foo.py',
+            gitlint.utils.content_key('/repo/foo.py',
+                                      gitlint.utils.blob_hash(b'staged')))
+        self.assertEqual(['/repo/foo.py:1: foo'], chunks)
+
+    def test_lint_command_content_from_stdin(self):
+        chunks = []
+        content_cache_writer = mock.MagicMock()
+        content_cache_writer.return_value.__enter__.return_value = \
+            chunks.append
+        processes = _processes([b'stdin:1: foo\nstdin:2: stdin'])
+        with mock.patch('subprocess.Popen', side_effect=processes) as popen, \
+                mock.patch('gitlint.utils.get_output_from_content_cache',
+                           return_value=None), \
+                mock.patch('gitlint.utils.content_cache_writer',
+                           content_cache_writer):
+            self.assertEqual({
+                '/repo/foo.py': {
+                    'comments': [{
+                        'line': 1,
+                        'message': 'foo'
+                    }, {
+                        'line': 2,
+                        'message': 'stdin'
+                    }]
+                }
+            },
+                             linters.lint_command(
+                                 'l',
+                                 'linter', ['-v'],
+                                 r'^{filename}:(?P<line>{lines}): '
+                                 r'(?P<message>.*)$',
+                                 '/repo/foo.py',
+                                 None,
+                                 fingerprint='f' * 40,
+                                 content=b'buffer',
+                                 stdin_arguments=['-', '--name={FILENAME}'],
+                                 stdin_display_name='stdin'))
+
+        popen.assert_called_once_with(
+            ['linter', '-v', '-', '--name=/repo/foo.py'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            start_new_session=True)
+        processes[0].stdin.write.assert_called_once_with(b'buffer')
+        content_cache_writer.assert_called_once_with(
+            'f' * 40, '/repo/foo.py',
+            gitlint.utils.content_key('/repo/foo.py',
+                                      gitlint.utils.blob_hash(b'buffer')))
+        self.assertEqual(['/repo/foo.py:1: foo\n', '/repo/foo.py:2: stdin'],
+                         chunks)
 
     def test_lint_command_all_fields(self):
-        with mock.patch('subprocess.check_output') as check_output, \
+        with mock.patch('subprocess.Popen',
+                        side_effect=_processes([
+                            b'ERROR: line 1, col 1: (W32) missing foo'
+                        ])), \
                 mock.patch('os.path.getmtime', side_effect=[1, 0, 1, 0]):
-            check_output.return_value = os.linesep.join(
-                ['ERROR: line 1, col 1: (W32) missing foo']).encode('utf-8')
             command = functools.partial(
                 linters.lint_command, 'l', 'linter', ['-f', '--compact'],
                 r'^(?P<severity>.*): line (?P<line>{lines})(, col ' +
@@ -119,9 +613,10 @@ class LintersTest(unittest.TestCase):
         output = os.linesep.join(
             ['Line 1: 1', 'Line 5: 5', 'Line 7: 7',
              'Line 9: 9']).encode('utf-8')
-        with mock.patch('subprocess.check_output',
-                        side_effect=subprocess.CalledProcessError(
-                            1, 'linter', output)) as check_output, \
+        processes = _processes([output, output])
+        for process in processes:
+            process.wait.return_value = 1
+        with mock.patch('subprocess.Popen', side_effect=processes) as popen, \
                 mock.patch('os.path.getmtime', side_effect=[1, 0, 1, 0]):
             command = functools.partial(
                 linters.lint_command, 'l', 'linter', ['-f', '--compact'],
@@ -164,18 +659,14 @@ class LintersTest(unittest.TestCase):
                 },
             }, command(filename, lines=None))
             expected_calls = [
-                mock.call(
-                    ['linter', '-f', '--compact', 'foo.txt'],
-                    stderr=subprocess.STDOUT),
-                mock.call(
-                    ['linter', '-f', '--compact', 'foo.txt'],
-                    stderr=subprocess.STDOUT)
+                _popen_call(['linter', '-f', '--compact', 'foo.txt']),
+                _popen_call(['linter', '-f', '--compact', 'foo.txt'])
             ]
-            self.assertEqual(expected_calls, check_output.call_args_list)
+            self.assertEqual(expected_calls, popen.call_args_list)
 
     def test_lint_command_not_found(self):
-        with mock.patch('subprocess.check_output',
-                        side_effect=OSError('Not found')) as check_output, \
+        with mock.patch('subprocess.Popen',
+                        side_effect=OSError('Not found')) as popen, \
                 mock.patch('os.path.getmtime', side_effect=[1, 0]):
             command = functools.partial(linters.lint_command, 'l', 'linter',
                                         ['-f', '--compact'],
@@ -186,11 +677,9 @@ class LintersTest(unittest.TestCase):
             output[filename]['error'] = []
             self.assertTrue({filename: {'error': ''}}, output)
             expected_calls = [
-                mock.call(
-                    ['linter', '-f', '--compact', 'foo.txt'],
-                    stderr=subprocess.STDOUT)
+                _popen_call(['linter', '-f', '--compact', 'foo.txt'])
             ]
-            self.assertEqual(expected_calls, check_output.call_args_list)
+            self.assertEqual(expected_calls, popen.call_args_list)
 
     def test_lint(self):
         linter1 = functools.partial(
@@ -204,8 +693,8 @@ class LintersTest(unittest.TestCase):
             os.linesep.join(['Line 1: 1', 'Line 5: 5']).encode('utf-8'),
             os.linesep.join([' line 4: 4']).encode('utf-8')
         ]
-        with mock.patch('subprocess.check_output',
-                        side_effect=outputs) as check_output, \
+        with mock.patch('subprocess.Popen',
+                        side_effect=_processes(outputs)) as popen, \
                 mock.patch('os.path.getmtime', side_effect=[1, 0, 1, 0]):
             filename = 'foo.txt'
             self.assertEqual({
@@ -223,11 +712,161 @@ class LintersTest(unittest.TestCase):
                 },
             }, linters.lint(filename, lines=[4, 5], config=config))
             expected_calls = [
-                mock.call(
-                    ['linter1', '-f', 'foo.txt'], stderr=subprocess.STDOUT),
-                mock.call(['linter2', 'foo.txt'], stderr=subprocess.STDOUT)
+                _popen_call(['linter1', '-f', 'foo.txt']),
+                _popen_call(['linter2', 'foo.txt'])
             ]
-            self.assertEqual(expected_calls, check_output.call_args_list)
+            self.assertEqual(expected_calls, popen.call_args_list)
+
+    def test_lint_file_hash(self):
+        linter1 = mock.MagicMock(return_value={'foo.txt': {}})
+        config = {'.txt': [linter1]}
+        linters.lint(
+            'foo.txt', lines=[4, 5], config=config, file_hash='0' * 40)
+        linter1.assert_called_once_with('foo.txt', [4, 5], file_hash='0' * 40)
+
+    def test_comment(self):
+        comment = linters.Comment(line=3, message='foo')
+        self.assertEqual({'line': 3, 'message': 'foo'}, comment)
+        self.assertEqual(2, len(comment))
+        self.assertIn('line', comment)
+        self.assertNotIn('column', comment)
+        self.assertIsNone(comment.get('column'))
+        with self.assertRaises(KeyError):
+            comment['severity']  # pylint: disable=pointless-statement
+        with self.assertRaises(AttributeError):
+            comment.formatted_message = 'line 3: foo'
+
+        self.assertEqual(
+            [
+                linters.Comment(message='a'),
+                linters.Comment(line=1),
+                linters.Comment(line=2),
+                linters.Comment(line=2, column=1),
+            ],
+            sorted([
+                linters.Comment(line=2, column=1),
+                linters.Comment(line=2),
+                linters.Comment(message='a'),
+                linters.Comment(line=1),
+            ]))
+
+    def test_comment_format(self):
+        values = {
+            'line': 3,
+            'column': 7,
+            'severity': 'Error',
+            'message_id': 'E1',
+            'message': 'foo',
+        }
+        for size in range(len(values) + 1):
+            for fields in itertools.combinations(sorted(values), size):
+                data = dict((field, values[field]) for field in fields)
+                self.assertEqual(
+                    gitlint.format_comment(data),
+                    linters.Comment(**data).format())
+        self.assertEqual('line 3, col 7: Error: [E1]: foo',
+                         linters.Comment(**values).format())
+
+    def test_parse_comments_interns_strings(self):
+        output = [
+            'foo.txt:1: error: [E1] %s' % 'a',
+            'foo.txt:2: error: [E1] %s' % 'b',
+        ]
+        comments = linters._parse_comments(
+            output, r'^{filename}:(?P<line>{lines}): (?P<severity>\w+): '
+            r'\[(?P<message_id>\w+)\] (?P<message>.*)$', 'foo.txt', None)
+        self.assertEqual([{
+            'line': 1,
+            'severity': 'Error',
+            'message_id': 'E1',
+            'message': 'a'
+        }, {
+            'line': 2,
+            'severity': 'Error',
+            'message_id': 'E1',
+            'message': 'b'
+        }], comments)
+        self.assertIs(comments[0].severity, comments[1].severity)
+        self.assertIs(comments[0].message_id, comments[1].message_id)
+
+    def test_lint_merge_is_stable(self):
+        def linter1(filename, unused_lines):
+            return {filename: {'comments': [{'line': 1, 'message': '1a'}]}}
+
+        def linter2(filename, unused_lines):
+            return {
+                filename: {
+                    'comments': [
+                        linters.Comment(line=2, message='2b'),
+                        linters.Comment(line=1, message='1b'),
+                    ]
+                }
+            }
+
+        self.assertEqual(['1a', '1b', '2b'], [
+            comment['message'] for comment in linters.lint(
+                'foo.txt', None, {'.txt': [linter1, linter2]})['foo.txt']
+            ['comments']
+        ])
+
+    def test_lint_custom_comment_fields(self):
+        def linter(filename, unused_lines):
+            return {
+                filename: {
+                    'comments': [{
+                        'line': 1,
+                        'message': 'a',
+                        'url': 'https://example.com/a',
+                        'fixable': None,
+                    }]
+                }
+            }
+
+        comment, = linters.lint('foo.txt', None,
+                                {'.txt': [linter]})['foo.txt']['comments']
+        self.assertEqual({
+            'line': 1,
+            'message': 'a',
+            'url': 'https://example.com/a'
+        }, comment)
+        self.assertEqual('https://example.com/a', comment['url'])
+        self.assertNotIn('fixable', comment)
+        self.assertEqual('line 1: a', comment.format())
+
+    def test_lint_concurrent(self):
+        pep8_started = threading.Event()
+
+        def pylint(filename, unused_lines):
+            # Waits for the second linter, so they have to run at once.
+            self.assertTrue(pep8_started.wait(5))
+            return {filename: {'comments': [{'line': 2, 'message': 'b'}]}}
+
+        def pep8(filename, unused_lines):
+            pep8_started.set()
+            return {
+                filename: {
+                    'comments': [{
+                        'line': 1,
+                        'message': 'a'
+                    }],
+                    'skipped': ['foo']
+                }
+            }
+
+        parallelism.start(2)
+        self.addCleanup(parallelism.stop)
+        self.assertEqual({
+            'foo.txt': {
+                'comments': [{
+                    'line': 1,
+                    'message': 'a'
+                }, {
+                    'line': 2,
+                    'message': 'b'
+                }],
+                'skipped': ['foo'],
+            }
+        }, linters.lint('foo.txt', None, {'.txt': [pylint, pep8]}))
 
     def test_lint_output_is_sorted(self):
         linter1 = functools.partial(
@@ -248,7 +887,8 @@ class LintersTest(unittest.TestCase):
             os.linesep.join(['message']).encode('utf-8'),
             os.linesep.join(['4:10: 4.a', '4:1: 4.b']).encode('utf-8'),
         ]
-        with mock.patch('subprocess.check_output', side_effect=outputs), \
+        with mock.patch('subprocess.Popen',
+                        side_effect=_processes(outputs)), \
                 mock.patch('os.path.getmtime', side_effect=[1, 0] * 4):
             filename = 'foo.txt'
             self.assertEqual({
@@ -292,8 +932,8 @@ class LintersTest(unittest.TestCase):
             '^ line (?P<line>{lines}): (?P<message>.*)$')
         config = {'.txt': [linter1, linter2]}
         outputs = [b'', os.linesep.join([' line 4: 4']).encode('utf-8')]
-        with mock.patch('subprocess.check_output',
-                        side_effect=outputs) as check_output, \
+        with mock.patch('subprocess.Popen',
+                        side_effect=_processes(outputs)) as popen, \
                 mock.patch('os.path.getmtime', side_effect=[1, 0, 1, 0]):
             filename = 'foo.txt'
             self.assertEqual({
@@ -307,11 +947,10 @@ class LintersTest(unittest.TestCase):
                 },
             }, linters.lint(filename, lines=[4, 5], config=config))
             expected_calls = [
-                mock.call(
-                    ['linter1', '-f', 'foo.txt'], stderr=subprocess.STDOUT),
-                mock.call(['linter2', 'foo.txt'], stderr=subprocess.STDOUT)
+                _popen_call(['linter1', '-f', 'foo.txt']),
+                _popen_call(['linter2', 'foo.txt'])
             ]
-            self.assertEqual(expected_calls, check_output.call_args_list)
+            self.assertEqual(expected_calls, popen.call_args_list)
 
     def test_lint_all_empty_lint(self):
         linter1 = functools.partial(linters.lint_command, 'l1', 'linter1',
@@ -320,8 +959,8 @@ class LintersTest(unittest.TestCase):
                                     '^ line {lines}:')
         config = {'.txt': [linter1, linter2]}
         outputs = [b'', b'']
-        with mock.patch('subprocess.check_output',
-                        side_effect=outputs) as check_output, \
+        with mock.patch('subprocess.Popen',
+                        side_effect=_processes(outputs)) as popen, \
                 mock.patch('os.path.getmtime', side_effect=[1, 0, 1, 0]):
             filename = 'foo.txt'
             self.assertEqual({
@@ -330,11 +969,10 @@ class LintersTest(unittest.TestCase):
                 }
             }, linters.lint(filename, lines=[4, 5], config=config))
             expected_calls = [
-                mock.call(
-                    ['linter1', '-f', 'foo.txt'], stderr=subprocess.STDOUT),
-                mock.call(['linter2', 'foo.txt'], stderr=subprocess.STDOUT)
+                _popen_call(['linter1', '-f', 'foo.txt']),
+                _popen_call(['linter2', 'foo.txt'])
             ]
-            self.assertEqual(expected_calls, check_output.call_args_list)
+            self.assertEqual(expected_calls, popen.call_args_list)
 
     def test_lint_extension_not_defined(self):
         config = {}
@@ -415,6 +1053,131 @@ class LintersTest(unittest.TestCase):
             }
         }, config['.foo'][0]('filename', []))
 
+    def test_parse_yaml_config_stdin_arguments(self):
+        yaml_config = {
+            'linter': {
+                'command': 'linter',
+                'extensions': ['.foo'],
+                'filter': '.*',
+                'installation': 'install',
+                'stdin_arguments': ['--config={REPO_HOME}/rc', '{FILENAME}'],
+                'stdin_display_name': 'stdin',
+            }
+        }
+
+        with mock.patch('gitlint.utils.which', return_value=['linter']):
+            config = linters.parse_yaml_config(yaml_config, '/repo')
+
+        self.assertEqual(['--config=/repo/rc', '{FILENAME}'],
+                         config['.foo'][0].keywords['stdin_arguments'])
+        self.assertEqual('stdin',
+                         config['.foo'][0].keywords['stdin_display_name'])
+        self.assertEqual('/repo',
+                         config['.foo'][0].keywords['repository_root'])
+
+    def test_parse_yaml_config_max_processes(self):
+        yaml_config = {
+            'linter': {
+                'command': 'linter',
+                'extensions': ['.foo'],
+                'filter': '.*',
+                'installation': 'install',
+                'max_processes': 2,
+            }
+        }
+
+        with mock.patch('gitlint.utils.which', return_value=['linter']):
+            config = linters.parse_yaml_config(yaml_config, '/repo')
+
+        self.assertEqual(2, config['.foo'][0].keywords['max_processes'])
+
+    def test_lint_command_cancelled(self):
+        cache_writer = mock.MagicMock()
+        cache_writer.return_value.__exit__.return_value = False
+        with mock.patch('gitlint.engine.popen',
+                        side_effect=_processes([b'Line 1: foo'])), \
+                mock.patch('gitlint.engine.is_cancelled', return_value=True), \
+                mock.patch('gitlint.utils.get_output_from_cache',
+                           return_value=None), \
+                mock.patch('gitlint.utils.cache_writer', cache_writer):
+            with self.assertRaises(engine.Cancelled):
+                linters.lint_command(
+                    'l', 'linter', [],
+                    '^Line (?P<line>{lines}): (?P<message>.*)$', 'foo.txt',
+                    None)
+
+        # The truncated output is discarded.
+        self.assertIs(engine.Cancelled,
+                      cache_writer.return_value.__exit__.call_args[0][0])
+
+    def test_lint_command_max_processes(self):
+        with mock.patch('gitlint.engine.popen',
+                        side_effect=_processes([b'Line 1: foo'])) as popen, \
+                mock.patch('gitlint.utils.get_output_from_cache',
+                           return_value=None), \
+                mock.patch('gitlint.utils.cache_writer'):
+            linters.lint_command(
+                'l',
+                'linter', [],
+                '^Line (?P<line>{lines}): (?P<message>.*)$',
+                'foo.txt',
+                None,
+                max_processes=2)
+
+        popen.assert_called_once_with(
+            ['linter', 'foo.txt'],
+            content=None,
+            limit=('l', 2),
+            stderr=subprocess.STDOUT)
+
+    def test_parse_yaml_config_jobs(self):
+        yaml_config = {
+            'linter': {
+                'command': 'linter',
+                'extensions': ['.foo'],
+                'filter': '.*',
+                'installation': 'install',
+                'jobs': 4,
+            }
+        }
+
+        with mock.patch('gitlint.utils.which', return_value=['linter']):
+            config = linters.parse_yaml_config(yaml_config, '/repo')
+
+        self.assertEqual(4, config['.foo'][0].keywords['jobs'])
+
+    def test_lint_command_jobs(self):
+        with mock.patch('gitlint.engine.popen',
+                        side_effect=_processes([b'Line 1: foo'])), \
+                mock.patch('gitlint.parallelism.slots') as slots, \
+                mock.patch('gitlint.utils.get_output_from_cache',
+                           return_value=None), \
+                mock.patch('gitlint.utils.cache_writer'):
+            linters.lint_command(
+                'l',
+                'linter', [],
+                '^Line (?P<line>{lines}): (?P<message>.*)$',
+                'foo.txt',
+                None,
+                jobs=4)
+
+        slots.assert_called_once_with(4)
+
+    def test_linter_names(self):
+        config = {
+            '.py': [
+                functools.partial(linters.lint_command, 'pylint', 'pylint', [],
+                                  ''),
+                functools.partial(linters.missing_requirements_command,
+                                  ['pep8'], 'pip install pep8'),
+                functools.partial(linters.lint_command, 'pep8', 'pep8', [],
+                                  ''),
+            ]
+        }
+        self.assertEqual(['pylint', 'pep8'],
+                         linters.linter_names('foo.py', config))
+        self.assertEqual([], linters.linter_names('foo.txt', config))
+
     def test_parse_yaml_config_with_variables(self):
         yaml_config_with_vars = {
             'linter': {
@@ -460,3 +1223,103 @@ class LintersTest(unittest.TestCase):
                                                        variables['REPO_HOME'])
 
             self.assertEqual(config_with_vars, config_no_vars)
+
+    def test_fingerprint_is_portable(self):
+        fingerprint1 = linters._fingerprint(
+            'linter', '/home/user1/repo/bin/linter',
+            ['--config=/home/user1/repo/.rc'], '.*',
+            {'REPO_HOME': '/home/user1/repo'})
+        fingerprint2 = linters._fingerprint('linter', '/opt/repo/bin/linter',
+                                            ['--config=/opt/repo/.rc'], '.*',
+                                            {'REPO_HOME': '/opt/repo'})
+        fingerprint3 = linters._fingerprint('linter', '/opt/repo/bin/linter',
+                                            ['--strict'], '.*',
+                                            {'REPO_HOME': '/opt/repo'})
+
+        self.assertEqual(fingerprint1, fingerprint2)
+        self.assertNotEqual(fingerprint2, fingerprint3)
+
+    def test_fingerprint_version_and_config_files(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        rcfile = os.path.join(directory, '.rc')
+        variables = {'REPO_HOME': directory}
+
+        def fingerprint(version):
+            return linters._fingerprint('linter', 'linter', [], '.*',
+                                        variables, version, [rcfile])
+
+        missing = fingerprint('linter 1.0')
+        self.assertNotEqual(missing, fingerprint('linter 2.0'))
+        with open(rcfile, 'w') as f:
+            f.write('strict = true')
+        created = fingerprint('linter 1.0')
+        self.assertNotEqual(missing, created)
+        with open(rcfile, 'w') as f:
+            f.write('strict = false')
+        self.assertNotEqual(created, fingerprint('linter 1.0'))
+
+    def test_config_files(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        rcfile = os.path.join(directory, 'pylintrc')
+        io.open(rcfile, 'w').close()
+        self.assertEqual(
+            ['/repo/setup.cfg', rcfile, rcfile],
+            linters._config_files(['--rcfile=%s' % rcfile, rcfile, '--strict'],
+                                  ['/repo/setup.cfg']))
+
+    def test_program_version(self):
+        versions = {}
+        with mock.patch('gitlint.utils.which', return_value=[sys.executable]):
+            version = linters._program_version(['python', '--version'],
+                                               versions)
+            self.assertIn('Python', version)
+            self.assertEqual([version], list(versions.values()))
+
+            # The version is not asked again while the program is the same.
+            with mock.patch('gitlint.engine.popen') as popen:
+                self.assertEqual(
+                    version,
+                    linters._program_version(['python', '--version'],
+                                             versions))
+            self.assertFalse(popen.called)
+
+        with mock.patch('gitlint.utils.which', return_value=[]):
+            self.assertIsNone(
+                linters._program_version(['python', '--version'], versions))
+
+    def test_parse_yaml_config_version(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        versions_filename = os.path.join(directory, 'versions.json')
+        yaml_config = {
+            'linter': {
+                'command': 'python',
+                'extensions': ['.foo'],
+                'filter': '.*',
+                'installation': 'install',
+            }
+        }
+
+        with mock.patch('gitlint.utils.which',
+                        return_value=[sys.executable]), \
+                mock.patch('gitlint.linters.get_versions_filename',
+                           return_value=versions_filename), \
+                mock.patch('gitlint.engine.popen',
+                           wraps=engine.popen) as popen:
+            # Linters without a version_command are not asked for it.
+            fingerprint = linters.parse_yaml_config(
+                yaml_config, '/repo')['.foo'][0].keywords['fingerprint']
+            self.assertFalse(popen.called)
+            self.assertFalse(os.path.exists(versions_filename))
+
+            yaml_config['linter']['version_command'] = ['python', '--version']
+            self.assertNotEqual(
+                fingerprint,
+                linters.parse_yaml_config(
+                    yaml_config, '/repo')['.foo'][0].keywords['fingerprint'])
+            popen.assert_called_once_with(
+                ['python', '--version'], content=b'', stderr=subprocess.STDOUT)
+            with open(versions_filename) as f:
+                self.assertEqual(1, len(json.load(f)))
@@ -0,0 +1,84 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import shutil
+import tempfile
+import unittest
+
+import gitlint.metrics as metrics
+import gitlint.timings as timings
+
+# pylint: disable=protected-access
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.recorder = timings.Recorder()
+        for name, category, wall in (
+            ('process_file', timings.FILE, 1.0),
+            ('pylint', timings.LINTER, 0.2),
+            ('pylint', timings.LINTER, 3.0),
+            ('pylint', timings.SUBPROCESS, 3.0),
+            ('git blame', timings.SUBPROCESS, 0.1),
+        ):
+            self.recorder.add_span(
+                timings.Span(name, category, 0, wall, 0, 0, 1, {}))
+        self.recorder.increment('cache_hits')
+        self.recorder.increment('cache_misses', 2)
+
+    def test_format_metrics(self):
+        lines = metrics.format_metrics(self.recorder, timestamp=10).split('\n')
+
+        self.assertIn('# TYPE gitlint_files_linted_total counter', lines)
+        self.assertIn('gitlint_files_linted_total 1', lines)
+        self.assertIn('gitlint_linter_invocations_total{linter="pylint"} 2',
+                      lines)
+        self.assertIn('# TYPE gitlint_linter_duration_seconds histogram',
+                      lines)
+        self.assertIn(
+            'gitlint_linter_duration_seconds_bucket{linter="pylint",le="0.25"}'
+            ' 1', lines)
+        self.assertIn(
+            'gitlint_linter_duration_seconds_bucket{linter="pylint",le="+Inf"}'
+            ' 2', lines)
+        self.assertIn(
+            'gitlint_linter_duration_seconds_sum{linter="pylint"} '
+            '3.2', lines)
+        self.assertIn(
+            'gitlint_linter_duration_seconds_count{linter="pylint"} '
+            '2', lines)
+        self.assertIn('gitlint_cache_hits_total 1', lines)
+        self.assertIn('gitlint_cache_misses_total 2', lines)
+        self.assertIn('gitlint_remote_cache_disabled_total 0', lines)
+        self.assertIn('gitlint_subprocesses_total{command="git blame"} 1',
+                      lines)
+        self.assertIn('gitlint_subprocesses_total{command="pylint"} 1', lines)
+        self.assertIn('gitlint_last_run_timestamp_seconds 10.0', lines)
+        self.assertEqual('', lines[-1])
+
+    def test_format_labels_escapes(self):
+        self.assertEqual(r'{linter="a\"b\\c"}',
+                         metrics._format_labels([('linter', 'a"b\\c')]))
+
+    def test_write_metrics(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        filename = os.path.join(directory, 'textfile', 'gitlint.prom')
+
+        metrics.write_metrics(self.recorder, filename)
+
+        with open(filename) as f:
+            self.assertIn('gitlint_files_linted_total 1', f.read())
+        self.assertEqual(['gitlint.prom'], os.listdir(
+            os.path.dirname(filename)))
@@ -0,0 +1,258 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import select
+import shutil
+import tempfile
+import threading
+import unittest
+
+import mock
+from pyfakefs import fake_filesystem_unittest
+
+import gitlint.parallelism as parallelism
+
+# pylint: disable=protected-access
+
+
+class CgroupTest(fake_filesystem_unittest.TestCase):
+    def setUp(self):
+        self.setUpPyfakefs()
+
+    def test_no_cgroup(self):
+        self.assertIsNone(parallelism.cgroup_cpu_quota())
+
+    def test_v2(self):
+        self.fs.create_file('/proc/self/cgroup', contents='0::/user/app\n')
+        self.fs.create_file(
+            '/sys/fs/cgroup/user/app/cpu.max', contents='150000 100000\n')
+        self.assertEqual(1.5, parallelism.cgroup_cpu_quota())
+
+    def test_v2_container(self):
+        self.fs.create_file('/proc/self/cgroup', contents='0::/user/app\n')
+        self.fs.create_file(
+            '/sys/fs/cgroup/cpu.max', contents='400000 100000\n')
+        self.assertEqual(4, parallelism.cgroup_cpu_quota())
+
+    def test_v2_unlimited(self):
+        self.fs.create_file('/proc/self/cgroup', contents='0::/\n')
+        self.fs.create_file('/sys/fs/cgroup/cpu.max', contents='max 100000\n')
+        self.assertIsNone(parallelism.cgroup_cpu_quota())
+
+    def test_v1(self):
+        self.fs.create_file(
+            '/proc/self/cgroup',
+            contents='5:memory:/docker/abc\n4:cpu,cpuacct:/docker/abc\n')
+        self.fs.create_file(
+            '/sys/fs/cgroup/cpu,cpuacct/docker/abc/cpu.cfs_quota_us',
+            contents='200000\n')
+        self.fs.create_file(
+            '/sys/fs/cgroup/cpu,cpuacct/docker/abc/cpu.cfs_period_us',
+            contents='100000\n')
+        self.assertEqual(2, parallelism.cgroup_cpu_quota())
+
+    def test_v1_unlimited(self):
+        self.fs.create_file(
+            '/sys/fs/cgroup/cpu/cpu.cfs_quota_us', contents='-1\n')
+        self.fs.create_file(
+            '/sys/fs/cgroup/cpu/cpu.cfs_period_us', contents='100000\n')
+        self.assertIsNone(parallelism.cgroup_cpu_quota())
+
+    def test_invalid(self):
+        self.fs.create_file('/sys/fs/cgroup/cpu.max', contents='foo bar\n')
+        self.assertIsNone(parallelism.cgroup_cpu_quota())
+
+    def test_available_cpus(self):
+        with mock.patch(
+                'os.sched_getaffinity', create=True, return_value=set(
+                    range(64))):
+            self.assertEqual(64, parallelism.available_cpus())
+            self.fs.create_file(
+                '/sys/fs/cgroup/cpu.max', contents='350000 100000\n')
+            self.assertEqual(4, parallelism.available_cpus())
+        with mock.patch(
+                'os.sched_getaffinity', create=True, return_value={0, 1}):
+            self.assertEqual(2, parallelism.available_cpus())
+
+    def test_available_cpus_small_quota(self):
+        self.fs.create_file('/sys/fs/cgroup/cpu.max', contents='1000 100000\n')
+        self.assertEqual(1, parallelism.available_cpus())
+
+
+class JobserverTest(unittest.TestCase):
+    def setUp(self):
+        self.read_fd, self.write_fd = os.pipe()
+        self.addCleanup(os.close, self.read_fd)
+        self.addCleanup(os.close, self.write_fd)
+
+    def test_from_makeflags(self):
+        self.assertIsNone(parallelism.jobserver_from_makeflags(None))
+        self.assertIsNone(parallelism.jobserver_from_makeflags('-k'))
+        self.assertIsNone(
+            parallelism.jobserver_from_makeflags('--jobserver-auth=-1,-1'))
+
+        jobserver = parallelism.jobserver_from_makeflags(
+            ' -j4 --jobserver-auth=%d,%d' % (self.read_fd, self.write_fd))
+        self.addCleanup(jobserver.close)
+        self.assertEqual(4, jobserver.size)
+
+        jobserver = parallelism.jobserver_from_makeflags(
+            '--jobserver-fds=%d,%d -j' % (self.read_fd, self.write_fd))
+        self.addCleanup(jobserver.close)
+        self.assertIsNone(jobserver.size)
+
+    def test_from_makeflags_fifo(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        fifo = os.path.join(directory, 'jobserver')
+        os.mkfifo(fifo)
+
+        jobserver = parallelism.jobserver_from_makeflags(
+            '-j2 --jobserver-auth=fifo:%s' % fifo)
+        self.addCleanup(jobserver.close)
+        self.assertEqual(2, jobserver.size)
+        # Like when another process takes the token after the select.
+        with mock.patch(
+                'select.select', return_value=([jobserver._read_fd], [], [])):
+            self.assertIsNone(jobserver._read_token())
+
+        jobserver.release([b'+'])
+        self.assertEqual(b'+', jobserver._read_token())
+
+    def test_from_makeflags_invalid(self):
+        read_fd, write_fd = os.pipe()
+        os.close(read_fd)
+        os.close(write_fd)
+        with self.assertRaises(ValueError):
+            parallelism.jobserver_from_makeflags(
+                '--jobserver-auth=%d,%d' % (read_fd, write_fd))
+
+    def test_tokens(self):
+        os.write(self.write_fd, b'+')
+        jobserver = parallelism.Jobserver(self.read_fd, self.write_fd, 2)
+
+        # The implicit slot first, then the token.
+        first = jobserver.acquire(1)
+        self.assertEqual([None], first)
+        second = jobserver.acquire(1)
+        self.assertEqual([b'+'], second)
+
+        # A third linter waits until a slot is released.
+        acquired = []
+        thread = threading.Thread(
+            target=lambda: acquired.append(jobserver.acquire(1)))
+        thread.start()
+        thread.join(0.3)
+        self.assertEqual([], acquired)
+        jobserver.release(first)
+        thread.join(5)
+        self.assertEqual([[None]], acquired)
+
+        jobserver.release(second)
+        jobserver.release(acquired[0])
+        self.assertEqual([None, b'+'], jobserver.acquire(2))
+
+
+class SlotsTest(unittest.TestCase):
+    def tearDown(self):
+        parallelism.stop()
+
+    def test_disabled(self):
+        with parallelism.slots(100):
+            pass
+
+    def test_pool(self):
+        pool = parallelism.start(2)
+        with parallelism.slots(5):
+            # Capped to the size of the pool.
+            self.assertEqual(0, pool._free)
+        self.assertEqual(2, pool._free)
+
+        with parallelism.slots():
+            self.assertEqual(1, pool._free)
+            with self.assertRaises(ValueError):
+                with parallelism.slots():
+                    raise ValueError()
+            self.assertEqual(1, pool._free)
+
+    def test_jobserver(self):
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        self.addCleanup(os.close, write_fd)
+        os.write(write_fd, b'ab')
+        jobserver = parallelism.start(
+            4, '-j3 --jobserver-auth=%d,%d' % (read_fd, write_fd))
+        self.assertIsInstance(jobserver, parallelism.Jobserver)
+
+        with parallelism.slots(3):
+            self.assertEqual(b'', _read_available(read_fd))
+        self.assertEqual(b'ab', _read_available(read_fd))
+
+    def test_jobserver_unknown_size(self):
+        read_fd, write_fd = os.pipe()
+        self.addCleanup(os.close, read_fd)
+        self.addCleanup(os.close, write_fd)
+        os.write(write_fd, b'a')
+        parallelism.start(4, '--jobserver-auth=%d,%d' % (read_fd, write_fd))
+
+        # Only the implicit slot is taken.
+        with parallelism.slots(3):
+            self.assertEqual(b'a', _read_available(read_fd))
+
+
+class RunAllTest(unittest.TestCase):
+    def tearDown(self):
+        parallelism.stop()
+
+    def test_disabled(self):
+        calls = []
+        self.assertEqual([1, 2],
+                         parallelism.run_all([
+                             lambda: calls.append(1) or 1,
+                             lambda: calls.append(2) or 2,
+                         ]))
+        self.assertEqual([1, 2], calls)
+
+    def test_concurrent(self):
+        parallelism.start(2)
+        first_started = threading.Event()
+        second_started = threading.Event()
+
+        def first():
+            first_started.set()
+            return second_started.wait(5)
+
+        def second():
+            second_started.set()
+            return first_started.wait(5)
+
+        self.assertEqual([True, True], parallelism.run_all([first, second]))
+
+    def test_error(self):
+        parallelism.start(2)
+
+        def fail():
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            parallelism.run_all([lambda: 1, fail])
+        self.assertEqual([], parallelism.run_all([]))
+
+
+def _read_available(fd):
+    """Reads the bytes available in the pipe fd without blocking."""
+    data = b''
+    while select.select([fd], [], [], 0)[0]:
+        data += os.read(fd, 1)
+    return data
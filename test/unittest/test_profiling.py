@@ -0,0 +1,88 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import pstats
+import shutil
+import tempfile
+import sys
+import threading
+import unittest
+
+import gitlint.profiling as profiling
+
+
+def _work():
+    return sum(i * i for i in range(1000))
+
+
+class ProfilingTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.addCleanup(profiling.stop)
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            profiling.start('foo')
+        self.assertIsNone(profiling.stop())
+
+    def test_cpu_includes_threads(self):
+        profiling.start(profiling.CPU)
+        thread = threading.Thread(target=_work)
+        thread.start()
+        thread.join()
+        profiler = profiling.stop()
+
+        filename = os.path.join(self.directory, 'cpu.prof')
+        profiler.write(filename)
+        functions = [
+            function for _, _, function in pstats.Stats(filename).stats
+        ]
+        self.assertIn('_work', functions)
+        self.assertIn('_work', profiler.summary())
+
+    def test_cpu_worker_threads_run(self):
+        # Threads started while profiling used to fail to start their own
+        # profile since Python 3.12.
+        results = []
+        profiling.start(profiling.CPU)
+        threads = [
+            threading.Thread(target=lambda: results.append(_work()))
+            for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        profiler = profiling.stop()
+
+        self.assertEqual([_work(), _work()], results)
+        self.assertIsInstance(profiler.summary(), str)
+
+    @unittest.skipUnless(sys.version_info >= (3, 4),
+                         'tracemalloc is not available')
+    def test_memory(self):
+        import tracemalloc  # pylint: disable=import-error
+        profiling.start(profiling.MEMORY)
+        data = [str(i) * 10 for i in range(1000)]
+        profiling.checkpoint()
+        del data
+        profiler = profiling.stop()
+
+        filename = os.path.join(self.directory, 'mem.prof')
+        profiler.write(filename)
+        self.assertTrue(tracemalloc.Snapshot.load(filename).traces)
+        self.assertIn('Peak traced memory', profiler.summary())
+        self.assertIn('test_profiling.py', profiler.summary())
+        self.assertFalse(tracemalloc.is_tracing())
@@ -0,0 +1,152 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+try:
+    from urllib import request as urllib_request
+    from urllib import error as urllib_error
+except ImportError:
+    import urllib2 as urllib_request
+    urllib_error = urllib_request
+
+import mock
+
+import gitlint.remote_cache as remote_cache
+import gitlint.timings as timings
+
+FINGERPRINT = 'f' * 40
+HASH = '1' * 40
+
+
+class RemoteCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.server = remote_cache.Server(('localhost', 0), self.directory)
+        patcher = mock.patch.object(remote_cache.RequestHandler, 'log_message')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        thread = threading.Thread(
+            target=remote_cache.serve, args=(self.server, ))
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.shutdown)
+        self.url = 'http://localhost:%d' % self.server.server_address[1]
+        self.recorder = timings.enable()
+        self.addCleanup(timings.disable)
+
+    def test_client(self):
+        client = remote_cache.Client(self.url)
+        self.addCleanup(client.close)
+
+        self.assertIsNone(client.get(FINGERPRINT, HASH))
+        client.put(FINGERPRINT, HASH, u'output \u2713').result()
+        self.assertEqual(u'output \u2713', client.get(FINGERPRINT, HASH))
+        self.assertEqual(0, self.recorder.counters['remote_cache_errors'])
+
+        with io.open(
+                os.path.join(self.directory, FINGERPRINT, HASH),
+                encoding='utf-8') as f:
+            self.assertEqual(u'output \u2713', f.read())
+
+    def test_client_server_down(self):
+        self.server.shutdown()
+        self.server.server_close()
+        client = remote_cache.Client(self.url, timeout=0.5)
+        self.addCleanup(client.close)
+
+        self.assertIsNone(client.get(FINGERPRINT, HASH))
+        self.assertIsNone(client.put(FINGERPRINT, HASH, u'output').result())
+        self.assertEqual(2, self.recorder.counters['remote_cache_errors'])
+
+    def test_client_disabled_after_errors(self):
+        self.server.shutdown()
+        self.server.server_close()
+        client = remote_cache.Client(self.url, timeout=0.5)
+        self.addCleanup(client.close)
+
+        for _ in range(remote_cache.MAX_CONSECUTIVE_ERRORS - 1):
+            self.assertIsNone(client.get(FINGERPRINT, HASH))
+        self.assertFalse(client.disabled)
+        self.assertIsNone(client.get(FINGERPRINT, HASH))
+        self.assertTrue(client.disabled)
+
+        # The next requests are not sent.
+        with mock.patch.object(urllib_request, 'urlopen') as urlopen:
+            self.assertIsNone(client.get(FINGERPRINT, HASH))
+            self.assertIsNone(client.put(FINGERPRINT, HASH, u'o').result())
+        urlopen.assert_not_called()
+        self.assertEqual(remote_cache.MAX_CONSECUTIVE_ERRORS,
+                         self.recorder.counters['remote_cache_errors'])
+        self.assertEqual(1, self.recorder.counters['remote_cache_disabled'])
+
+    def test_client_errors_not_in_a_row(self):
+        client = remote_cache.Client(self.url)
+        self.addCleanup(client.close)
+        error = IOError('timed out')
+
+        for _ in range(2 * remote_cache.MAX_CONSECUTIVE_ERRORS):
+            with mock.patch.object(
+                    urllib_request, 'urlopen', side_effect=error):
+                self.assertIsNone(client.get(FINGERPRINT, HASH))
+            # Misses are not errors.
+            self.assertIsNone(client.get(FINGERPRINT, HASH))
+        self.assertFalse(client.disabled)
+
+    def test_server_keeps_existing_entries(self):
+        client = remote_cache.Client(self.url)
+        self.addCleanup(client.close)
+
+        client.put(FINGERPRINT, HASH, u'first').result()
+        client.put(FINGERPRINT, HASH, u'second').result()
+
+        self.assertEqual(u'first', client.get(FINGERPRINT, HASH))
+
+    def test_server_invalid_entries(self):
+        for path in ('/foo', '/%s/../%s' % (FINGERPRINT, HASH),
+                     '/%s/%s/' % (FINGERPRINT, 'g' * 40)):
+            request = urllib_request.Request(self.url + path, data=b'output')
+            request.get_method = lambda: 'PUT'
+            with self.assertRaises(urllib_error.HTTPError) as context:
+                urllib_request.urlopen(request)
+            context.exception.close()
+            self.assertEqual(400, context.exception.code)
+        self.assertEqual([], os.listdir(self.directory))
+
+    def test_get_and_save_output(self):
+        remote_cache.enable(self.url)
+        self.addCleanup(remote_cache.disable)
+        self.assertIsNone(
+            remote_cache.get_output(FINGERPRINT, '/clone1/foo.py', HASH))
+        remote_cache.save_output(FINGERPRINT, '/clone1/foo.py',
+                                 '/clone1/foo.py:1: error', HASH)
+        remote_cache.disable()
+        remote_cache.enable(self.url)
+
+        self.assertEqual(
+            '/clone2/foo.py:1: error',
+            remote_cache.get_output(FINGERPRINT, '/clone2/foo.py', HASH))
+        self.assertEqual(1, self.recorder.counters['remote_cache_hits'])
+
+    def test_disabled(self):
+        self.assertIsNone(
+            remote_cache.get_output(FINGERPRINT, '/repo/foo.py', HASH))
+        remote_cache.save_output(FINGERPRINT, '/repo/foo.py', 'output', HASH)
+        self.assertEqual([], os.listdir(self.directory))
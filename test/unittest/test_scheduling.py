@@ -0,0 +1,87 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import os
+
+from pyfakefs import fake_filesystem_unittest
+
+import gitlint.scheduling as scheduling
+
+
+class SchedulingTest(fake_filesystem_unittest.TestCase):
+    def setUp(self):
+        self.setUpPyfakefs()
+
+    def test_record(self):
+        costs = scheduling.LinterCosts()
+        self.assertFalse(costs.changed)
+        costs.record('pylint', 2.0)
+        self.assertEqual(2.0, costs.costs['pylint'])
+        costs.record('pylint', 4.0)
+        self.assertAlmostEqual(2.0 + scheduling.SMOOTHING * 2,
+                               costs.costs['pylint'])
+        self.assertTrue(costs.changed)
+
+    def test_on_linter_end(self):
+        costs = scheduling.LinterCosts()
+        costs.on_linter_end('linter_end', {
+            'linter': 'pylint',
+            'duration': 1.0,
+            'cache_hit': True
+        })
+        self.assertEqual({}, costs.costs)
+        costs.on_linter_end('linter_end', {
+            'linter': 'pylint',
+            'duration': 1.0,
+            'cache_hit': False
+        })
+        self.assertEqual({'pylint': 1.0}, costs.costs)
+
+    def test_estimate(self):
+        costs = scheduling.LinterCosts({'pylint': 2.0, 'pep8': 0.5})
+        self.assertEqual(2.5, costs.estimate(['pylint', 'pep8', 'unknown']))
+        self.assertEqual(0, costs.estimate([]))
+
+    def test_load_and_save(self):
+        filename = scheduling.get_costs_filename()
+        self.fs.create_dir(os.path.dirname(filename))
+        self.assertEqual({}, scheduling.load_costs().costs)
+
+        costs = scheduling.LinterCosts({'pylint': 2.0})
+        scheduling.save_costs(costs)
+        self.assertFalse(os.path.exists(filename))
+
+        costs.record('pep8', 0.5)
+        scheduling.save_costs(costs)
+        with open(filename) as f:
+            self.assertEqual({'pylint': 2.0, 'pep8': 0.5}, json.load(f))
+        self.assertEqual({
+            'pylint': 2.0,
+            'pep8': 0.5
+        },
+                         scheduling.load_costs().costs)
+
+    def test_load_invalid(self):
+        filename = scheduling.get_costs_filename()
+        self.fs.create_file(filename)
+        for content in ('not json', '[1, 2]', '{"pylint": "slow"}'):
+            with open(filename, 'w') as f:
+                f.write(content)
+            self.assertEqual({}, scheduling.load_costs().costs)
+
+    def test_prioritize(self):
+        files = [('/a', None), ('/b', None), ('/c', None), ('/d', None)]
+        self.assertEqual(
+            [('/c', None), ('/b', None), ('/d', None), ('/a', None)],
+            scheduling.prioritize(files, [1, 3, 5, 1], [2.0, 1.0, 9.0, 1.0]))
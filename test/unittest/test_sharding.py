@@ -0,0 +1,137 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+import gitlint.sharding as sharding
+
+
+class ShardingTest(unittest.TestCase):
+    def test_parse_shard(self):
+        self.assertEqual((1, 3), sharding.parse_shard('1/3'))
+        self.assertEqual((3, 3), sharding.parse_shard('3/3'))
+        for value in ('0/3', '4/3', '1', 'a/b', '1/2/3'):
+            with self.assertRaises(ValueError):
+                sharding.parse_shard(value)
+
+    def test_hash_shard_is_stable_and_balanced(self):
+        filenames = ['src/file%d.py' % i for i in range(1000)]
+        shards = [sharding.hash_shard(filename, 4) for filename in filenames]
+
+        self.assertEqual(
+            shards,
+            [sharding.hash_shard(filename, 4) for filename in filenames])
+        self.assertEqual({1, 2, 3, 4}, set(shards))
+        for index in range(1, 5):
+            self.assertGreater(shards.count(index), 200)
+
+    def test_costs_from_report(self):
+        report = {
+            '/repo/a.py': {
+                'comments': []
+            },
+            'timings': {
+                'jobs': [
+                    {
+                        'linter': 'pylint',
+                        'filename': 'a.py',
+                        'wall': 2.0
+                    },
+                    {
+                        'linter': 'pycodestyle',
+                        'filename': 'a.py',
+                        'wall': 0.5
+                    },
+                    {
+                        'linter': 'pylint',
+                        'filename': 'b.py',
+                        'wall': 1.0
+                    },
+                ]
+            }
+        }
+
+        self.assertEqual({
+            'a.py': 2.5,
+            'b.py': 1.0
+        }, sharding.costs_from_report(report))
+        self.assertEqual({}, sharding.costs_from_report({}))
+
+    def test_assign_shards(self):
+        costs = {'a.py': 10, 'b.py': 6, 'c.py': 5, 'd.py': 1}
+
+        self.assertEqual({
+            'a.py': 1,
+            'b.py': 2,
+            'c.py': 2,
+            'd.py': 1
+        }, sharding.assign_shards(costs, 2))
+
+    def test_shard_filter(self):
+        costs = {'a.py': 10, 'b.py': 6}
+        first = sharding.shard_filter(1, 2, costs)
+        second = sharding.shard_filter(2, 2, costs)
+
+        self.assertTrue(first('a.py'))
+        self.assertFalse(second('a.py'))
+        self.assertTrue(second('b.py'))
+        for filename in ('new%d.py' % i for i in range(20)):
+            self.assertNotEqual(first(filename), second(filename))
+            self.assertEqual(
+                sharding.hash_shard(filename, 2) == 1, first(filename))
+
+    def test_return_code(self):
+        ok = {'comments': []}
+        error = {'error': ['pylint is not installed'], 'comments': []}
+        comments = {'comments': [{'line': 1}]}
+
+        self.assertEqual(0, sharding.return_code({'a': ok, 'timings': {}}))
+        self.assertEqual(4, sharding.return_code({'a': ok, 'b': error}))
+        self.assertEqual(1, sharding.return_code({'a': comments, 'b': error}))
+
+    def test_merge_reports(self):
+        summary = {
+            'phases': [],
+            'jobs': [],
+            'cache': {
+                'hits': 1,
+                'misses': 0,
+                'content_hits': 0,
+                'remote_hits': 0
+            },
+        }
+        reports = [
+            {
+                '/repo/a.py': {
+                    'comments': []
+                },
+                'timings': summary
+            },
+            {
+                '/repo/b.py': {
+                    'comments': [{
+                        'line': 1
+                    }]
+                },
+                'timings': summary
+            },
+        ]
+
+        merged = sharding.merge_reports(reports)
+
+        self.assertEqual(['/repo/a.py', '/repo/b.py', 'timings'],
+                         sorted(merged))
+        self.assertEqual(2, merged['timings']['cache']['hits'])
+        self.assertNotIn('timings', sharding.merge_reports([{
+            '/repo/a.py': {}
+        }]))
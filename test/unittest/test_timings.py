@@ -0,0 +1,255 @@
+# Copyright 2013-2014 Sebastian Kreft
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import resource
+import threading
+import unittest
+
+import mock
+
+import gitlint.timings as timings
+
+RUN_USAGE = {
+    'cpu': 1.0,
+    'child_cpu': 2.0,
+    'max_rss': 100,
+    'child_max_rss': 200
+}
+
+
+def _usage(cpu, max_rss):
+    return resource.struct_rusage((cpu, 0) + (max_rss, ) + (0, ) * 13)
+
+
+class TimingsTest(unittest.TestCase):
+    def tearDown(self):
+        timings.disable()
+
+    def test_span_disabled(self):
+        with timings.span('foo', timings.PHASE):
+            pass
+        timings.increment('cache_hits')
+        self.assertIsNone(timings.disable())
+
+    def test_span_enabled(self):
+        recorder = timings.enable()
+        with timings.span('foo', timings.PHASE):
+            pass
+        with timings.span('pylint', timings.LINTER, filename='/repo/a.py'):
+            pass
+
+        self.assertEqual(['foo', 'pylint'],
+                         [span.name for span in recorder.spans])
+        self.assertEqual({'filename': '/repo/a.py'}, recorder.spans[1].args)
+        self.assertTrue(all(span.wall >= 0 for span in recorder.spans))
+        self.assertIs(recorder, timings.disable())
+
+    def test_span_child_usage(self):
+        recorder = timings.enable()
+        timings.record_child(_usage(5, 500))
+        with timings.span('pylint', timings.LINTER):
+            timings.record_child(_usage(1, 100))
+            with timings.span('pylint', timings.SUBPROCESS):
+                timings.record_child(_usage(2, 50))
+        with timings.span('foo', timings.PHASE):
+            pass
+
+        self.assertEqual([(2, 50), (3, 100), (None, None)],
+                         [(span.child_cpu, span.max_rss)
+                          for span in recorder.spans])
+
+    def test_propagate(self):
+        recorder = timings.enable()
+        with timings.span('modified_lines', timings.PHASE):
+            thread = threading.Thread(
+                target=timings.propagate(
+                    lambda: timings.record_child(_usage(1, 100))))
+            thread.start()
+            thread.join()
+            # Other threads are not measured.
+            thread = threading.Thread(
+                target=lambda: timings.record_child(_usage(2, 200)))
+            thread.start()
+            thread.join()
+
+        self.assertEqual([(1, 100)], [(span.child_cpu, span.max_rss)
+                                      for span in recorder.spans])
+
+    def test_span_records_on_exception(self):
+        recorder = timings.enable()
+        with self.assertRaises(ValueError):
+            with timings.span('foo', timings.PHASE):
+                raise ValueError()
+        self.assertEqual(1, len(recorder.spans))
+
+    def test_summary(self):
+        recorder = timings.Recorder()
+        recorder.add_span(
+            timings.Span('modified_lines', timings.VCS, 1, 0.5, 0.25, 10, 1,
+                         {}))
+        recorder.add_span(
+            timings.Span('modified_lines', timings.VCS, 2, 1.5, 0.5, 20, 1,
+                         {}))
+        recorder.add_span(
+            timings.Span('pylint', timings.LINTER, 3, 2, 1, 30, 1,
+                         {'filename': '/repo/a.py'}))
+        recorder.increment('cache_hits', 2)
+        recorder.increment('cache_misses')
+
+        with mock.patch('gitlint.timings._run_usage', return_value=RUN_USAGE):
+            summary = timings.summary(recorder, '/repo')
+        self.assertEqual({
+            'phases': [{
+                'name': 'modified_lines',
+                'count': 2,
+                'wall': 2.0,
+                'child_cpu': 0.75,
+                'max_rss': 20,
+            }],
+            'jobs': [{
+                'linter': 'pylint',
+                'filename': 'a.py',
+                'wall': 2,
+                'child_cpu': 1,
+                'max_rss': 30,
+            }],
+            'cache': {
+                'hits': 2,
+                'misses': 1,
+                'content_hits': 0,
+                'remote_hits': 0
+            },
+            'run':
+            RUN_USAGE,
+        }, summary)
+
+    def test_merge_summaries(self):
+        def phase(wall, **usage):
+            return dict(name='modified_files', count=1, wall=wall, **usage)
+
+        summaries = [
+            {
+                # Like the reports of older versions, without the usage.
+                'phases': [phase(1.0)],
+                'jobs': [{
+                    'linter': 'pylint',
+                    'filename': 'a.py'
+                }],
+                'cache': {
+                    'hits': 1,
+                    'misses': 2,
+                    'content_hits': 0,
+                    'remote_hits': 0
+                },
+            },
+            {
+                'phases': [phase(2.0, child_cpu=0.5, max_rss=10)],
+                'jobs': [{
+                    'linter': 'pylint',
+                    'filename': 'b.py'
+                }],
+                'cache': {
+                    'hits': 3,
+                    'misses': 0,
+                    'content_hits': 1,
+                    'remote_hits': 2
+                },
+                'run': {
+                    'cpu': 0.5,
+                    'child_cpu': 3.0,
+                    'max_rss': 50,
+                    'child_max_rss': 300
+                },
+            }
+        ]
+
+        self.assertEqual({
+            'phases': [{
+                'name': 'modified_files',
+                'count': 2,
+                'wall': 3.0,
+                'child_cpu': 0.5,
+                'max_rss': 10,
+            }],
+            'jobs': [{
+                'linter': 'pylint',
+                'filename': 'a.py'
+            }, {
+                'linter': 'pylint',
+                'filename': 'b.py'
+            }],
+            'cache': {
+                'hits': 4,
+                'misses': 2,
+                'content_hits': 1,
+                'remote_hits': 2
+            },
+            'run': {
+                'cpu': 0.5,
+                'child_cpu': 3.0,
+                'max_rss': 50,
+                'child_max_rss': 300
+            },
+        }, timings.merge_summaries(summaries))
+
+    def test_format_summary(self):
+        recorder = timings.Recorder()
+        recorder.add_span(
+            timings.Span('config', timings.PHASE, 1, 0.5, None, None, 1, {}))
+        recorder.add_span(
+            timings.Span('modified_files', timings.PHASE, 1, 0.5, 0.125, 20, 1,
+                         {}))
+        recorder.add_span(
+            timings.Span('pylint', timings.LINTER, 2, 0.5, 0.25, 10, 1,
+                         {'filename': 'a.py'}))
+        recorder.add_span(
+            timings.Span('pep8', timings.LINTER, 2, 0.5, None, None, 1,
+                         {'filename': 'a.py'}))
+        with mock.patch('gitlint.timings._run_usage', return_value=RUN_USAGE):
+            lines = timings.format_summary(timings.summary(recorder))
+
+        self.assertEqual(7, len(lines))
+        self.assertEqual(['config', '1', '0.500', '-', '-'], lines[1].split())
+        self.assertEqual(['modified_files', '1', '0.500', '0.125', '20'],
+                         lines[2].split())
+        self.assertEqual(['pylint', 'a.py', '1', '0.500', '0.250', '10'],
+                         lines[3].split())
+        self.assertEqual(['pep8', 'a.py', '1', '0.500', '-', '-'],
+                         lines[4].split())
+        self.assertEqual(
+            'Run: 1.000 s CPU and 100 KB max RSS, subprocesses: 2.000 s CPU '
+            'and 200 KB max RSS', lines[5])
+        self.assertEqual(
+            'Cache: 0 hits, 0 misses, 0 content hits, 0 remote hits', lines[6])
+
+    def test_trace_events(self):
+        recorder = timings.Recorder()
+        recorder.add_span(
+            timings.Span('modified_files', timings.PHASE, 1, 0.5, 0, 10, 7,
+                         {}))
+        recorder.add_span(
+            timings.Span('pylint', timings.SUBPROCESS, 2, 0.25, 0, 10, 8,
+                         {'filename': 'a.py'}))
+        recorder.thread_names = {7: 'MainThread', 8: 'Worker'}
+
+        events = timings.trace_events(recorder)['traceEvents']
+
+        self.assertEqual(4, len(events))
+        self.assertEqual(('modified_files', 'phase', 'X', 1000000, 500000, 1),
+                         tuple(events[0][key] for key in ('name', 'cat', 'ph',
+                                                          'ts', 'dur', 'tid')))
+        self.assertEqual({'filename': 'a.py'}, events[1]['args'])
+        self.assertEqual(2, events[1]['tid'])
+        thread_names = dict((event['tid'], event['args']['name'])
+                            for event in events if event['ph'] == 'M')
+        self.assertEqual({1: 'MainThread', 2: 'Worker'}, thread_names)
@@ -11,13 +11,20 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import io
 import os.path
+import shutil
+import subprocess
+import tempfile
+import threading
 import unittest
 import sys
+from concurrent import futures
 
 import mock
 from pyfakefs import fake_filesystem_unittest
 
+import gitlint.timings as timings
 import gitlint.utils as utils
 
 # pylint: disable=protected-access
@@ -78,16 +85,6 @@ class UtilsTest(fake_filesystem_unittest.TestCase):
                                  r'(?P<line>\d+): .*',
                                  groups=('line', 'debug'))))
 
-    @unittest.skipUnless(sys.version_info >= (3, 5),
-                         'pyfakefs does not support pathlib2. See'
-                         'https://github.com/jmcgeheeiv/pyfakefs/issues/408')
-    def test_open_for_write(self):
-        filename = 'foo/bar/new_file'
-        with utils._open_for_write(filename) as f:
-            f.write('foo')
-        with open(filename) as f:
-            self.assertEqual('foo', f.read())
-
     def test_get_cache_filename(self):
         self.fs.create_dir('/abspath')
         os.chdir('/abspath')
@@ -117,6 +114,21 @@ class UtilsTest(fake_filesystem_unittest.TestCase):
             with open(utils._get_cache_filename('linter', 'filename')) as f:
                 self.assertEqual(output, f.read())
 
+    @unittest.skipUnless(sys.version_info >= (3, 5),
+                         'pyfakefs does not support pathlib2. See'
+                         'https://github.com/jmcgeheeiv/pyfakefs/issues/408')
+    def test_cache_writer_error(self):
+        self.fs.create_dir('/cache')
+        with mock.patch(
+                'gitlint.utils._get_cache_filename',
+                return_value='/cache/filename.txt'):
+            with self.assertRaises(ValueError):
+                with utils.cache_writer('linter', 'filename') as write:
+                    write('Line 1: foo\n')
+                    raise ValueError()
+
+        self.assertEqual([], os.listdir('/cache'))
+
     def test_get_output_from_cache_no_cache(self):
         cache_filename = '/cache/filename.txt'
         with mock.patch(
@@ -146,9 +158,256 @@ class UtilsTest(fake_filesystem_unittest.TestCase):
             self.assertEqual(content,
                              utils.get_output_from_cache('linter', 'filename'))
 
+    def test_get_output_from_cache_counts_hits_and_misses(self):
+        cache_filename = '/cache/filename.txt'
+        self.fs.create_file('filename')
+        recorder = timings.enable()
+        self.addCleanup(timings.disable)
+        with mock.patch(
+                'gitlint.utils._get_cache_filename',
+                return_value=cache_filename):
+            utils.get_output_from_cache('linter', 'filename')
+            self.fs.create_file(cache_filename)
+            os.utime(cache_filename, (2**31, 2**31))
+            utils.get_output_from_cache('linter', 'filename')
+
+        self.assertEqual(1, recorder.counters['cache_hits'])
+        self.assertEqual(1, recorder.counters['cache_misses'])
+
+    def test_check_output(self):
+        recorder = timings.enable()
+        self.addCleanup(timings.disable)
+        with mock.patch(
+                'gitlint.engine.check_output',
+                return_value=b'output') as check_output:
+            self.assertEqual(
+                b'output',
+                utils.check_output(['git', 'status', '--porcelain'], cwd='/'))
+            check_output.assert_called_once_with(
+                ['git', 'status', '--porcelain'], cwd='/')
+
+        self.assertEqual([('git status', timings.SUBPROCESS)],
+                         [(span.name, span.category)
+                          for span in recorder.spans])
+
+    @mock.patch('subprocess.Popen')
+    def test_output_fields(self, popen):
+        popen.return_value.stdout = io.BytesIO(b'a\0bb\0\0c')
+        popen.return_value.wait.return_value = 0
+
+        self.assertEqual([b'a', b'bb', b'c'],
+                         list(
+                             utils.output_fields(['git', 'ls-files'],
+                                                 cwd='/')))
+        popen.assert_called_once_with(
+            ['git', 'ls-files'],
+            stdout=subprocess.PIPE,
+            cwd='/',
+            start_new_session=True)
+
+    @mock.patch('subprocess.Popen')
+    def test_output_fields_error(self, popen):
+        popen.return_value.stdout = io.BytesIO(b'')
+        popen.return_value.wait.return_value = 1
+
+        with self.assertRaises(subprocess.CalledProcessError):
+            list(utils.output_fields(['hg', 'files']))
+        popen.return_value.stdout = io.BytesIO(b'')
+        self.assertEqual([],
+                         list(
+                             utils.output_fields(
+                                 ['hg', 'files'], ok_returncodes=(0, 1))))
+
+    def test_ordered_map(self):
+        consumed = []
+
+        def items():
+            for item in range(10):
+                consumed.append(item)
+                yield item
+
+        with futures.ThreadPoolExecutor(max_workers=2) as executor:
+            results = utils.ordered_map(executor, lambda item: item * 2,
+                                        items(), 3)
+            self.assertEqual(0, next(results))
+            self.assertEqual([0, 1, 2], consumed)
+            self.assertEqual(list(range(2, 20, 2)), list(results))
+
+    def test_ordered_map_error(self):
+        calls = []
+
+        def items():
+            for item in range(3):
+                yield item
+            raise ValueError()
+
+        with futures.ThreadPoolExecutor(max_workers=1) as executor:
+            # Keeps the only worker busy, so the items stay pending.
+            release = threading.Event()
+            executor.submit(release.wait, 5)
+            with self.assertRaises(ValueError):
+                list(utils.ordered_map(executor, calls.append, items(), 5))
+            release.set()
+        self.assertEqual([], calls)
+
+    def test_content_hash(self):
+        self.fs.create_file('/empty')
+        self.fs.create_file('/hello', contents='hello\n')
+
+        self.assertEqual('e69de29bb2d1d6434b8b29ae775ad8c2e48c5391',
+                         utils.content_hash('/empty'))
+        self.assertEqual('ce013625030ba8dba906f756967f9e9ca394464a',
+                         utils.content_hash('/hello'))
+
+    def test_changed_lines(self):
+        self.assertEqual([2, 4, 5],
+                         utils.changed_lines(b'a\nb\nc\nd\n',
+                                             b'a\nB\nc\nx\ny\n'))
+        self.assertEqual([], utils.changed_lines(b'a\nb\n', b'a\n'))
+        self.assertEqual([], utils.changed_lines(b'a\n', b'a\n'))
+        self.assertIsNone(utils.changed_lines(None, b'a\n'))
+
+    def test_diff_changes(self):
+        diff = b'\n'.join([
+            b'diff --git a/foo.py b/foo.py', b'index 1..2 100644',
+            b'--- a/foo.py', b'+++ b/foo.py', b'@@ -3 +3 @@ def foo():', b'-a',
+            b'+b', b'@@ -10,0 +11,2 @@', b'+c', b'+d', b'@@ -20,2 +22,0 @@',
+            b'-e', b'-f', b'diff --git a/new file.py b/new file.py',
+            b'new file mode 100644', b'--- /dev/null', b'+++ b/new file.py',
+            b'@@ -0,0 +1 @@', b'+new', b'diff --git a/img.png b/img.png',
+            b'new file mode 100644', b'Binary files /dev/null and b/img.png '
+            b'differ', b'diff --git a/old.py b/old.py',
+            b'deleted file mode 100644', b'--- a/old.py', b'+++ /dev/null',
+            b'@@ -1 +0,0 @@', b'-old', b''
+        ])
+
+        self.assertEqual([('foo.py', [3, 11, 12]), ('new file.py', None),
+                          ('img.png', None)], utils.diff_changes(diff))
+        self.assertEqual([], utils.diff_changes(b''))
+
+    def test_diff_changes_quoted(self):
+        diff = b'\n'.join([
+            b'diff --git "a/\\303\\251.py" "b/\\303\\251.py"',
+            b'--- "a/\\303\\251.py"', b'+++ "b/\\303\\251.py"', b'@@ -3 +3 @@',
+            b'diff --git "a/q\\"t\\\\.py" "b/q\\"t\\\\.py"',
+            b'new file mode 100644', b'Binary files /dev/null and '
+            b'"b/q\\"t\\\\.py" differ', b'diff --git a/sp ace.py b/sp ace.py',
+            b'--- a/sp ace.py\t', b'+++ b/sp ace.py\t', b'@@ -1 +1 @@'
+        ])
+
+        self.assertEqual([(u'\xe9.py', [3]), ('q"t\\.py', None),
+                          ('sp ace.py', [1])], utils.diff_changes(diff))
+
+    def test_scratch_file(self):
+        with utils.scratch_file('/repo/foo/bar.py', b'content') as filename:
+            self.assertEqual('bar.py', os.path.basename(filename))
+            with open(filename, 'rb') as f:
+                self.assertEqual(b'content', f.read())
+
+        self.assertFalse(os.path.exists(os.path.dirname(filename)))
+
     def test_which_absolute_path(self):
         filename = '/foo/bar.sh'
         self.fs.create_file(filename)
         os.chmod(filename, 0o755)
 
         self.assertEqual([filename], utils.which(filename))
+
+
+class CheckOutputTest(unittest.TestCase):
+    def tearDown(self):
+        timings.disable()
+
+    def test_check_output_child_usage(self):
+        recorder = timings.enable()
+        with timings.span('modified_files', timings.PHASE):
+            self.assertEqual(b'foo\n', utils.check_output(['echo', 'foo']))
+
+        # Reaped by the engine, so measured in its span and in the phase.
+        self.assertEqual(['echo foo', 'modified_files'],
+                         [span.name for span in recorder.spans])
+        for span in recorder.spans:
+            self.assertGreaterEqual(span.child_cpu, 0)
+            self.assertGreater(span.max_rss, 0)
+
+
+class WriteAtomicallyTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_write_atomically(self):
+        filename = os.path.join(self.directory, 'sub', 'file.json')
+        utils.write_atomically(filename, u'{"caf\xe9": 1}')
+
+        with io.open(filename, encoding='utf-8') as f:
+            self.assertEqual(u'{"caf\xe9": 1}', f.read())
+        self.assertEqual(['file.json'], os.listdir(os.path.dirname(filename)))
+
+    def test_write_atomically_bytes(self):
+        # Like the str returned by json.dumps in Python 2.
+        filename = os.path.join(self.directory, 'file.json')
+        utils.write_atomically(filename, b'{"a": 1}')
+
+        with io.open(filename, encoding='utf-8') as f:
+            self.assertEqual(u'{"a": 1}', f.read())
+
+
+class SingleFlightTest(unittest.TestCase):
+    def setUp(self):
+        self.lock_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.lock_dir)
+        patcher = mock.patch(
+            'gitlint.utils.get_lock_dir', return_value=self.lock_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_single_flight_no_contention(self):
+        with utils.single_flight('key') as waited:
+            self.assertFalse(waited)
+            self.assertEqual(1, len(os.listdir(self.lock_dir)))
+        self.assertEqual([], os.listdir(self.lock_dir))
+
+    def test_single_flight_waits(self):
+        events = []
+        locked = threading.Event()
+        release = threading.Event()
+
+        def holder():
+            with utils.single_flight('key'):
+                locked.set()
+                release.wait()
+                events.append('holder')
+
+        thread = threading.Thread(target=holder)
+        thread.start()
+        locked.wait()
+        recorder = timings.enable()
+        self.addCleanup(timings.disable)
+        threading.Timer(0.1, release.set).start()
+        with utils.single_flight('key') as waited:
+            events.append('waiter')
+        thread.join()
+
+        self.assertTrue(waited)
+        self.assertEqual(['holder', 'waiter'], events)
+        self.assertEqual(1, recorder.counters['single_flight_waits'])
+        self.assertEqual([], os.listdir(self.lock_dir))
+
+    def test_single_flight_timeout(self):
+        recorder = timings.enable()
+        self.addCleanup(timings.disable)
+        with utils.single_flight('key'):
+            lock_filename, = os.listdir(self.lock_dir)
+            # The holder is stuck, so the work runs without the lock.
+            with utils.single_flight('key', timeout=0.05) as waited:
+                self.assertTrue(waited)
+            self.assertEqual([lock_filename], os.listdir(self.lock_dir))
+        self.assertEqual([], os.listdir(self.lock_dir))
+        self.assertEqual(1, recorder.counters['single_flight_timeouts'])
+
+    def test_single_flight_different_keys(self):
+        with utils.single_flight('key1') as waited1:
+            with utils.single_flight('key2') as waited2:
+                self.assertFalse(waited1)
+                self.assertFalse(waited2)